@@ -1,7 +1,10 @@
+import importlib
+import os
+import time
+
 import streamlit as st
-from pages import _home, _documentation
-from data_viz import show_data_visualization
-from predictive_model import show_predictive_page
+
+import instrumentation
 
 st.set_page_config(
     page_title="Substance Abuse Amongst Women",
@@ -9,18 +12,54 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+# Set NSDUH_PROFILE_STARTUP=1 to print how long each page takes to import and to render
+# the first time in this process (see startup_profile.py for a per-module breakdown).
+PROFILE_STARTUP = os.environ.get("NSDUH_PROFILE_STARTUP", "0") == "1"
+
 
 if 'page' not in st.session_state:
     st.session_state.page = 'home'
 
+# Navigation name to (session page id, module, render function). A page's module, and
+# the libraries it needs (Plotly for the Descriptive Analysis page, scikit-learn for the
+# Predictive Analysis page), are only imported when the page is first shown.
 PAGES = {
-    "Home": _home.show_home_page,
-    "Descriptive Analysis": show_data_visualization,
-    "Predictive Analysis": show_predictive_page,
-    "Documentation": _documentation.show_documentation_page
+    "Home": ('home', 'pages._home', 'show_home_page'),
+    "Descriptive Analysis": ('statistical', 'data_viz', 'show_data_visualization'),
+    "Predictive Analysis": ('predictive', 'predictive_model', 'show_predictive_page'),
+    "Documentation": ('documentation', 'pages._documentation', 'show_documentation_page')
 }
 
 
+@st.cache_resource
+def startup_profile():
+    """
+    Returns the process-wide record of pages already profiled, {page id: timings}.
+    """
+    return {}
+
+
+def show_page(page_id):
+    """
+    Imports the module of a page on first use and renders the page.
+    """
+    entry = next(((module, function) for pid, module, function in PAGES.values() if pid == page_id), None)
+    if entry is None:
+        return
+    module_name, function_name = entry
+    start = time.perf_counter()
+    with instrumentation.span("import"):
+        module = importlib.import_module(module_name)
+    imported = time.perf_counter()
+    getattr(module, function_name)()
+    if PROFILE_STARTUP:
+        profile = startup_profile()
+        if page_id not in profile:
+            profile[page_id] = {'import_ms': (imported - start) * 1000, 'render_ms': (time.perf_counter() - imported) * 1000}
+            print(f"[startup] {page_id}: import {profile[page_id]['import_ms']:.0f} ms, "
+                  f"first render {profile[page_id]['render_ms']:.0f} ms", flush=True)
+
+
 if st.session_state.page == 'home':
     st.markdown(
         """
@@ -36,15 +75,7 @@ else:
     st.sidebar.empty()
 
     st.sidebar.title("Navigation")
-    current_page_display_name = ""
-    if st.session_state.page == 'statistical':
-        current_page_display_name = "Descriptive Analysis"
-    elif st.session_state.page == 'predictive':
-        current_page_display_name = "Predictive Analysis"
-    elif st.session_state.page == 'documentation':
-        current_page_display_name = "Documentation"
-    elif st.session_state.page == 'home':
-        current_page_display_name = "Home"
+    current_page_display_name = next((name for name, (pid, _, _) in PAGES.items() if pid == st.session_state.page), "")
 
     try:
         selected_page_index = list(PAGES.keys()).index(current_page_display_name)
@@ -56,21 +87,14 @@ else:
         index=selected_page_index
     )
 
-    if selected_page == "Home":
-        st.session_state.page = 'home'
-    elif selected_page == "Descriptive Analysis":
-        st.session_state.page = 'statistical'
-    elif selected_page == "Predictive Analysis":
-        st.session_state.page = 'predictive'
-    elif selected_page == "Documentation":
-        st.session_state.page = 'documentation'
+    st.session_state.page = PAGES[selected_page][0]
 
 
-if st.session_state.page == 'home':
-    _home.show_home_page()
-elif st.session_state.page == 'statistical':
-    show_data_visualization()
-elif st.session_state.page == 'predictive':
-    show_predictive_page()
-elif st.session_state.page == 'documentation':
-    _documentation.show_documentation_page()
+# Timing spans of this rerun, shown in the sidebar Performance panel and/or logged (see instrumentation.py).
+instrumentation.start_rerun(st.session_state.page)
+try:
+    show_page(st.session_state.page)
+finally:
+    rerun_record = instrumentation.finish_rerun()
+if rerun_record and instrumentation.PERF_PANEL:
+    instrumentation.show_performance_panel(rerun_record)
@@ -0,0 +1,211 @@
+"""
+Scores whole cohort files with the stored substance-use models.
+
+The input is read in chunks, each chunk is scored in one vectorized call of the
+model's numpy scorer (see compiled_model.py), and results are appended to the output
+as they are produced, so memory stays bounded by the chunk size (times the number of
+workers).
+
+Usage:
+    python batch_scoring.py cohort.csv scores.csv --target alcever
+    python batch_scoring.py cohort.parquet scores.parquet --target mjever --workers 4 --keep respondent_id
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from compiled_model import CompiledModel, compile_model
+from data_loader import DATA_PATH, file_fingerprint
+from model_store import FEATURES, TARGETS, rebuild_command, stored_model_path
+
+DEFAULT_CHUNKSIZE = 100_000
+
+
+def score_frame(model, df):
+    """
+    Scores a DataFrame of respondents in one vectorized call.
+
+    Rows missing any of the FEATURES, which the models are neither trained on nor
+    able to score, are left unscored: their probability is NaN and their prediction
+    is missing.
+
+    Args:
+        model (CompiledModel or Pipeline): A fitted pipeline from model_store, or its
+            compiled_model.compile_model scorer.
+        df (pd.DataFrame): Rows with the FEATURES columns.
+
+    Returns:
+        pd.DataFrame: 'probability' (the likelihood shown on the Predictive Analysis
+        page, i.e. predict_proba's second column) and 'prediction' (the predicted
+        class, as a nullable column).
+    """
+    if not isinstance(model, CompiledModel):
+        model = compile_model(model)
+    complete = df[FEATURES].notna().all(axis=1).to_numpy()
+    probability = np.full(len(df), np.nan)
+    prediction = pd.array(np.zeros(len(df), dtype=model.classes.dtype))
+    if complete.any():
+        probability[complete], prediction[complete] = model.score(df.loc[complete, FEATURES])
+    prediction[~complete] = pd.NA
+    return pd.DataFrame({'probability': probability, 'prediction': prediction}, index=df.index)
+
+
+def iter_chunks(path, chunksize=DEFAULT_CHUNKSIZE, columns=None):
+    """
+    Yields a CSV or Parquet file as DataFrames of at most chunksize rows.
+    """
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize, usecols=columns)
+
+
+class ChunkWriter:
+    """
+    Appends scored chunks to a CSV or Parquet file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.parquet_writer = None
+        self.header_written = False
+
+    def write(self, df):
+        if self.path.endswith('.parquet'):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self.parquet_writer is None:
+                self.parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            self.parquet_writer.write_table(table)
+        else:
+            df.to_csv(self.path, mode='a' if self.header_written else 'w', header=not self.header_written, index=False)
+            self.header_written = True
+
+    def close(self):
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+
+
+_worker_model = None
+
+
+def load_scorer(model_path):
+    """
+    Loads a stored model file and compiles it into a numpy scorer.
+    """
+    return compile_model(joblib.load(model_path)['pipeline'])
+
+
+def _init_worker(model_path):
+    global _worker_model
+    _worker_model = load_scorer(model_path)
+
+
+def _score_chunk(model, chunk, keep):
+    scores = score_frame(model, chunk)
+    return pd.concat([chunk[keep], scores], axis=1) if keep else scores
+
+
+def _score_chunk_in_worker(chunk, keep):
+    return _score_chunk(_worker_model, chunk, keep)
+
+
+def score_file(input_path, output_path, target, chunksize=DEFAULT_CHUNKSIZE, workers=1, keep=None,
+               model_path=None):
+    """
+    Scores every row of input_path with the stored model for target and writes the
+    scores to output_path chunk by chunk.
+
+    The model is the one the Predictive Analysis page uses for the dataset at
+    DATA_PATH (see model_store.stored_model_path), or the model file given; it must
+    already be stored, so the dataset itself is never read.
+
+    Args:
+        input_path (str): CSV or Parquet file with the FEATURES columns.
+        output_path (str): CSV or Parquet file to write (chosen by extension).
+        target (str): 'mjever' or 'alcever'.
+        chunksize (int): Rows read and scored at a time.
+        workers (int): Number of scoring processes; 1 scores in this process.
+        keep (list, optional): Input columns (e.g. an ID) copied to the output.
+        model_path (str, optional): Stored model file to score with instead.
+
+    Returns:
+        tuple: The number of rows written and, among them, of rows left unscored
+        because a feature is missing (see score_frame).
+
+    Raises:
+        FileNotFoundError: If the model is not stored yet.
+    """
+    keep = list(keep or [])
+    if model_path is None:
+        if not os.path.exists(DATA_PATH):
+            raise FileNotFoundError(f"Dataset {DATA_PATH} not found to look up its stored {target} model; "
+                                    f"pass the model file with --model.")
+        model_path = stored_model_path(target, file_fingerprint(DATA_PATH)['sha256'])
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"No stored {target} model at {model_path}; run `{rebuild_command(target)}` "
+                                    f"first.")
+    elif not os.path.exists(model_path):
+        raise FileNotFoundError(f"Model file {model_path} not found.")
+    # Worker processes load the model themselves, so this one only does when scoring alone.
+    model = load_scorer(model_path) if workers <= 1 else None
+
+    chunks = iter_chunks(input_path, chunksize, columns=keep + FEATURES)
+    writer = ChunkWriter(output_path)
+    counts = {'rows': 0, 'unscored': 0}
+
+    def write(scored):
+        writer.write(scored)
+        counts['rows'] += len(scored)
+        counts['unscored'] += int(scored['prediction'].isna().sum())
+
+    try:
+        if workers <= 1:
+            for chunk in chunks:
+                write(_score_chunk(model, chunk, keep))
+        else:
+            with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(model_path,)) as pool:
+                # Keep at most two chunks per worker in flight so memory stays bounded,
+                # and write results in input order.
+                pending = []
+                for chunk in chunks:
+                    pending.append(pool.submit(_score_chunk_in_worker, chunk, keep))
+                    if len(pending) >= 2 * workers:
+                        write(pending.pop(0).result())
+                for future in pending:
+                    write(future.result())
+    finally:
+        writer.close()
+    return counts['rows'], counts['unscored']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a cohort file with a stored substance-use model.")
+    parser.add_argument("input", help="CSV or Parquet file with the model's feature columns")
+    parser.add_argument("output", help="CSV or Parquet file to write the scores to")
+    parser.add_argument("--target", required=True, choices=TARGETS)
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument("--workers", type=int, default=1, help="Scoring processes (default: 1)")
+    parser.add_argument("--keep", nargs="*", default=[], help="Input columns to copy to the output")
+    parser.add_argument("--model", help="Stored model file to score with (default: the stored model of DATA_PATH)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    rows, unscored = score_file(args.input, args.output, args.target, args.chunksize, args.workers, args.keep,
+                                args.model)
+    elapsed = time.perf_counter() - start
+    print(f"Scored {rows:,} rows in {elapsed:.2f}s ({rows / elapsed:,.0f} rows/s)")
+    if unscored:
+        print(f"{unscored:,} rows with a missing feature were written without a score")
+
+
+if __name__ == "__main__":
+    main()
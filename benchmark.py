@@ -0,0 +1,908 @@
+"""
+Headless benchmark suite for the dashboard's data work.
+
+Runs outside Streamlit and prints one table per section. Datasets larger than the
+shipped CSV are made by repeating its rows, or with --synthetic by sampling new rows
+from its distribution (see synthetic_data.py). The dashboard sections (overview ...
+treatment, predictive) time the per-rerun data work behind each tab of the
+Descriptive Analysis page and the Predictive Analysis page; the others compare an
+optimized path with the implementation it replaced.
+
+Usage:
+    python benchmark.py load --scales 1 10 100
+    python benchmark.py memory
+    python benchmark.py labels
+    python benchmark.py filters --scales 10 100 1000
+    python benchmark.py cube
+    python benchmark.py models
+    python benchmark.py table --scales 1 --synthetic
+    python benchmark.py selection --scales 1 10
+    python benchmark.py incremental --scales 10 100 1000
+    python benchmark.py sessions --no-filter
+    python benchmark.py processes --scales 100
+    python benchmark.py overview marijuana --select age2=2,3,4 --select irwrkstat=1
+    python benchmark.py --json results.json --compare previous.json
+    python benchmark.py marijuana predictive --scales 100 1000 --synthetic
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from data_loader import (DATA_PATH, LABEL_MAPS, apply_display_mappings, compact_frame, read_dataset,
+                         to_categorical)
+from data_cube import (CORR_COLUMNS, CUBE_FILTERS, CUBE_GROUPS, CUBE_OUTCOMES, append_corr_stats, build_corr_stats,
+                       build_cube, corr_matrix, query_cube)
+from filter_index import build_filter_index, filter_mask
+
+# Sections timing the per-tab data work of the Descriptive Analysis page.
+DASHBOARD_SECTIONS = ["overview", "correlation", "marijuana", "alcohol", "social", "socioeconomic", "treatment"]
+
+
+# Set by --synthetic: a synthetic_data model that scaled datasets are sampled from.
+SYNTHETIC_MODEL = None
+
+
+def scale_frame(df, scale):
+    """
+    Returns a DataFrame `scale` times the size of df: its rows repeated, or rows sampled
+    from SYNTHETIC_MODEL if set.
+    """
+    if scale == 1:
+        return df
+    if SYNTHETIC_MODEL is not None:
+        from synthetic_data import generate_frame
+        return compact_frame(generate_frame(SYNTHETIC_MODEL, len(df) * scale, np.random.default_rng(scale)))
+    return pd.concat([df] * scale, ignore_index=True)
+
+
+def best_time(fn, repeat=3):
+    """
+    Returns the fastest wall-clock time of `repeat` calls to fn, in seconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def bench_load(scales, repeat, selections):
+    """
+    Compares parsing the CSV with reading the Arrow IPC cache built by read_dataset.
+    """
+    base = pd.read_csv(DATA_PATH)
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for scale in scales:
+            path = os.path.join(tmp, f"dataset_{scale}x.csv")
+            scale_frame(base, scale).to_csv(path, index=False)
+            csv_s = best_time(lambda: read_dataset(path, use_cache=False), repeat)
+            read_dataset(path)  # builds the cache
+            cache_s = best_time(lambda: read_dataset(path), repeat)
+            rows.append({
+                "scale": f"{scale}x",
+                "rows": len(base) * scale,
+                "csv_ms": csv_s * 1000,
+                "cache_ms": cache_s * 1000,
+                "speedup": csv_s / cache_s,
+            })
+    return pd.DataFrame(rows)
+
+
+def frame_mb(df):
+    """
+    Returns the deep memory usage of a DataFrame in MiB.
+    """
+    return df.memory_usage(deep=True).sum() / 2**20
+
+
+def bench_memory(scales, repeat, selections):
+    """
+    Reports the footprint of the parsed float64 frame against the compact frame, and of
+    string label columns against Categorical ones.
+    """
+    base = pd.read_csv(DATA_PATH)
+    rows = []
+    for scale in scales:
+        raw = scale_frame(base, scale)
+        compact = compact_frame(raw)
+        string_labels = pd.DataFrame({
+            col: raw[col].map(mapping).fillna(raw[col]).astype(str) for col, mapping in LABEL_MAPS.items()
+        })
+        categorical_labels = pd.DataFrame({
+            col: to_categorical(compact[col], mapping) for col, mapping in LABEL_MAPS.items()
+        })
+        rows.append({
+            "scale": f"{scale}x",
+            "rows": len(raw),
+            "float64_mb": frame_mb(raw),
+            "compact_mb": frame_mb(compact),
+            "str_labels_mb": frame_mb(string_labels),
+            "cat_labels_mb": frame_mb(categorical_labels),
+        })
+    return pd.DataFrame(rows)
+
+
+def peak_alloc_mb(fn):
+    """
+    Returns the peak memory traced by tracemalloc while fn runs, in MiB.
+    """
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+
+def legacy_apply_display_mappings(df):
+    """
+    The original per-column `.map().fillna().astype(str)` implementation, kept as a baseline.
+    """
+    df_display = df.copy()
+    for col, mapping in LABEL_MAPS.items():
+        if col in df_display.columns:
+            df_display[f"{col}_label"] = df_display[col].map(mapping).fillna(df_display[col]).astype(str)
+    return df_display
+
+
+def bench_labels(scales, repeat, selections):
+    """
+    Compares one Descriptive Analysis rerun's label work: the legacy path maps the full and
+    the filtered frame, the current path slices the once-decoded display frame by the mask.
+    """
+    base = read_dataset()
+    rows = []
+    for scale in scales:
+        df = scale_frame(base, scale)
+        display = apply_display_mappings(df)
+        mask = filter_mask(build_filter_index(df), selections)
+
+        def legacy_rerun():
+            legacy_apply_display_mappings(df)
+            legacy_apply_display_mappings(df[mask])
+
+        def current_rerun():
+            display[mask]
+
+        rows.append({
+            "scale": f"{scale}x",
+            "rows": len(df),
+            "legacy_ms": best_time(legacy_rerun, repeat) * 1000,
+            "current_ms": best_time(current_rerun, repeat) * 1000,
+            "legacy_alloc_mb": peak_alloc_mb(legacy_rerun),
+            "current_alloc_mb": peak_alloc_mb(current_rerun),
+        })
+    return pd.DataFrame(rows)
+
+
+# Default selection: restricts all four sidebar filters.
+SAMPLE_SELECTIONS = {
+    "age2": [2, 3, 4],
+    "eduhighcat": [5],
+    "irwrkstat": [1, 2],
+    "irmaritstat": [1, 4],
+}
+
+
+def legacy_filter(df, selections):
+    """
+    The original filter: a full copy followed by one chained `isin` selection per column.
+    """
+    filtered_df = df.copy()
+    for col, codes in selections.items():
+        if codes:
+            filtered_df = filtered_df[filtered_df[col].isin(codes)]
+    return filtered_df
+
+
+def bench_filters(scales, repeat, selections):
+    """
+    Compares resolving the sidebar selection by chained `isin` frames with the bitmap
+    filter index.
+    """
+    base = read_dataset()
+    rows = []
+    for scale in scales:
+        df = scale_frame(base, scale)
+        index = build_filter_index(df)
+        mask = filter_mask(index, selections)
+        if not np.array_equal(df.index[mask], legacy_filter(df, selections).index):
+            raise ValueError(f"The bitmap filter selects other rows than chained `isin` at {scale}x.")
+        rows.append({
+            "scale": f"{scale}x",
+            "rows": len(df),
+            "build_ms": best_time(lambda: build_filter_index(df), 1) * 1000,
+            "legacy_ms": best_time(lambda: legacy_filter(df, selections), repeat) * 1000,
+            "bitmap_mask_ms": best_time(lambda: filter_mask(index, selections), repeat) * 1000,
+            "bitmap_select_ms": best_time(lambda: df[filter_mask(index, selections)], repeat) * 1000,
+        })
+    return pd.DataFrame(rows)
+
+
+def check_cube(df, cube, selections):
+    """
+    Checks that every cube answers the selection with the same counts and sums as
+    grouping the filtered rows.
+
+    Raises:
+        ValueError: If a cube's groups or totals differ.
+    """
+    filtered = legacy_filter(df, selections)
+    for name, group_cols in CUBE_GROUPS.items():
+        expected = filtered.groupby(group_cols)[CUBE_OUTCOMES].agg(["count", "sum"])
+        expected.columns = [f"{outcome}_{stat}" for outcome, stat in expected.columns]
+        actual = query_cube(cube, name, selections)
+        if not np.array_equal(actual.index.to_numpy(), expected.index.to_numpy()):
+            raise ValueError(f"The {name} cube's groups differ from the groupby's.")
+        if not np.array_equal(actual[expected.columns].to_numpy(), expected.to_numpy()):
+            raise ValueError(f"The {name} cube's counts or sums differ from the groupby's.")
+
+
+def bench_cube(scales, repeat, selections):
+    """
+    Compares computing every rate table with groupbys over the filtered rows against
+    summing the matching cells of the pre-aggregated cube, and building the cube with
+    the bincount kernel against one pandas groupby per cube.
+    """
+    base = read_dataset()
+    rows = []
+    for scale in scales:
+        df = scale_frame(base, scale)
+        index = build_filter_index(df)
+        cube = build_cube(df)
+        check_cube(df, cube, selections)
+
+        def rows_rerun():
+            filtered = df[filter_mask(index, selections)]
+            for group_cols in CUBE_GROUPS.values():
+                filtered.groupby(group_cols)[["mjever", "alcever", "alcbng30d"]].agg(["count", "sum"])
+
+        def cube_rerun():
+            for name in CUBE_GROUPS:
+                query_cube(cube, name, selections)
+
+        def groupby_build():
+            for group_cols in CUBE_GROUPS.values():
+                keys = list(dict.fromkeys(CUBE_FILTERS + group_cols))
+                df.groupby(keys)[CUBE_OUTCOMES].agg(["count", "sum"])
+
+        rows.append({
+            "scale": f"{scale}x",
+            "rows": len(df),
+            "cube_cells": sum(len(entry["group_ids"]) for entry in cube.values()),
+            "groupby_build_ms": best_time(groupby_build, repeat) * 1000,
+            "build_ms": best_time(lambda: build_cube(df), repeat) * 1000,
+            "groupby_ms": best_time(rows_rerun, repeat) * 1000,
+            "cube_ms": best_time(cube_rerun, repeat) * 1000,
+        })
+    return pd.DataFrame(rows)
+
+
+def check_corr(stats, expected, selections, tolerance=1e-9):
+    """
+    Checks that the correlation matrix assembled from the statistics matches the
+    filtered rows' `.corr()`: NaN in the same pairs, and the other correlations within
+    tolerance.
+
+    Returns:
+        float: The largest absolute difference.
+
+    Raises:
+        ValueError: If the matrices differ.
+    """
+    actual = corr_matrix(stats, selections)
+    # The statistics keep the dataset's column order
+    expected = expected.loc[actual.index, actual.columns].to_numpy()
+    actual = actual.to_numpy()
+    if not np.array_equal(np.isnan(actual), np.isnan(expected)):
+        raise ValueError("The correlation statistics leave other pairs undefined than `.corr()`.")
+    max_abs_diff = float(np.nanmax(np.abs(actual - expected), initial=0))
+    if max_abs_diff > tolerance:
+        raise ValueError(f"The correlation statistics differ from `.corr()` by up to {max_abs_diff:.3g}.")
+    return max_abs_diff
+
+
+def bench_corr(scales, repeat, selections):
+    """
+    Compares the heatmap's `.corr()` over the filtered rows with assembling it from the
+    per-cell correlation statistics (checked to match, see check_corr), and times
+    building the statistics and appending one shipped dataset's worth of rows to them.
+    """
+    base = read_dataset()
+    rows = []
+    for scale in scales:
+        df = scale_frame(base, scale)
+        index = build_filter_index(df)
+        stats = build_corr_stats(df)
+        max_abs_diff = check_corr(stats, df[filter_mask(index, selections)][CORR_COLUMNS].corr(), selections)
+        rows.append({
+            "scale": f"{scale}x",
+            "rows": len(df),
+            "cells": len(stats["n"]),
+            "corr_ms": best_time(lambda: df[filter_mask(index, selections)][CORR_COLUMNS].corr(), repeat) * 1000,
+            "stats_ms": best_time(lambda: corr_matrix(stats, selections), repeat) * 1000,
+            "build_ms": best_time(lambda: build_corr_stats(df), repeat) * 1000,
+            "append_ms": best_time(lambda: append_corr_stats(stats, base), repeat) * 1000,
+            "max_abs_diff": max_abs_diff,
+        })
+    return pd.DataFrame(rows)
+
+
+def bench_models(scales, repeat, selections):
+    """
+    Compares fitting the alcever pipeline, as every page rerun used to, with loading the
+    stored model from a fresh model directory.
+    """
+    import joblib
+    from model_store import train_model
+
+    base = read_dataset()
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for scale in scales:
+            df = scale_frame(base, scale)
+            path = os.path.join(tmp, f"alcever_{scale}x.joblib")
+            joblib.dump({"pipeline": train_model(df, "alcever")}, path)
+            rows.append({
+                "scale": f"{scale}x",
+                "rows": len(df),
+                "train_ms": best_time(lambda: train_model(df, "alcever"), repeat) * 1000,
+                "store_load_ms": best_time(lambda: joblib.load(path)["pipeline"], repeat) * 1000,
+            })
+    return pd.DataFrame(rows)
+
+
+def bench_selection(scales, repeat, selections):
+    """
+    Times the alcever cross-validation search of model_selection.py with 1, 2, 4, ...
+    worker processes up to the number of cores. The saga candidates are left out to
+    keep the section short; the search is timed once per setting.
+    """
+    from model_selection import SEARCH_SPACE, search
+
+    search_space = [family for family in SEARCH_SPACE if family['solver'] != 'saga']
+    worker_counts = sorted({min(2 ** i, os.cpu_count()) for i in range((os.cpu_count() or 1).bit_length() + 1)})
+    base = read_dataset()
+    rows = []
+    for scale in scales:
+        df = scale_frame(base, scale)
+        serial_seconds = None
+        for workers in worker_counts:
+            result = search(df, "alcever", workers=workers, search_space=search_space)
+            serial_seconds = serial_seconds or result["search_seconds"]
+            rows.append({
+                "scale": f"{scale}x",
+                "rows": len(df),
+                "workers": workers,
+                "encode_ms": result["encode_seconds"] * 1000,
+                "search_ms": result["search_seconds"] * 1000,
+                "speedup": serial_seconds / result["search_seconds"],
+            })
+    return pd.DataFrame(rows)
+
+
+def bench_incremental(scales, repeat, selections):
+    """
+    Compares training the alcever model in memory (reading the whole Parquet training
+    file, then fitting the LogisticRegression pipeline) with streaming the same file
+    through incremental_model, and scores both on the same held-out rows. Memory is
+    the peak traced by tracemalloc during training.
+    """
+    from sklearn.metrics import accuracy_score, log_loss
+    from sklearn.model_selection import train_test_split
+
+    from incremental_model import train_incremental
+    from model_store import FEATURES, build_pipeline
+
+    def train_in_memory(path):
+        df = pd.read_parquet(path)
+        return build_pipeline().fit(df[FEATURES], df["alcever"])
+
+    def train_streaming(path):
+        return train_incremental(path, "alcever", holdout_fraction=0)[0]
+
+    base = read_dataset()
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for scale in scales:
+            df = scale_frame(base, scale)[FEATURES + ["alcever"]].dropna()
+            train, test = train_test_split(df, test_size=0.2, random_state=42, stratify=df["alcever"])
+            path = os.path.join(tmp, f"train_{scale}x.parquet")
+            train.to_parquet(path)
+            row = {"scale": f"{scale}x", "rows": len(train)}
+            for name, fit in (("memory", train_in_memory), ("streaming", train_streaming)):
+                models = []
+                row[f"{name}_peak_mb"] = peak_alloc_mb(lambda: models.append(fit(path)))
+                row[f"{name}_ms"] = best_time(lambda: fit(path), repeat) * 1000
+                proba = models[0].predict_proba(test[FEATURES])
+                row[f"{name}_accuracy"] = accuracy_score(test["alcever"], models[0].classes_[proba.argmax(axis=1)])
+                row[f"{name}_log_loss"] = log_loss(test["alcever"], proba, labels=models[0].classes_)
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+
+@lru_cache(maxsize=None)
+def prepared_dataset(scale):
+    """
+    Returns the display frame, filter index, rate cube and correlation statistics for a
+    scaled dataset, built once per scale the way the app builds them once per dataset.
+    """
+    df = scale_frame(read_dataset(), scale)
+    return apply_display_mappings(df), build_filter_index(df), build_cube(df), build_corr_stats(df)
+
+
+def dashboard_rerun(section, scale, selections):
+    """
+    Returns a function running one rerun's data work for a Descriptive Analysis tab:
+    resolving the filter mask, selecting the rows and computing the tab's tables.
+    """
+    import data_viz
+
+    display, index, cube, corr_stats = prepared_dataset(scale)
+
+    def rerun():
+        filtered_df_display = display[filter_mask(index, selections)]
+        if section == "overview":
+            return data_viz.overview_tables(filtered_df_display)
+        if section == "correlation":
+            return data_viz.correlation_table(corr_stats, selections)
+        if section == "marijuana":
+            return data_viz.marijuana_tables(filtered_df_display, cube, selections)
+        if section == "alcohol":
+            return data_viz.alcohol_tables(filtered_df_display, cube, selections)
+        if section == "social":
+            return data_viz.social_tables(cube, selections)
+        if section == "socioeconomic":
+            return data_viz.socioeconomic_tables(cube, selections)
+        return data_viz.treatment_tables(filtered_df_display, cube, selections)
+
+    return rerun
+
+
+def bench_payload(scales, repeat, selections):
+    """
+    Measures the figures of the tabs with histograms and density charts: time to build
+    them from the filtered rows and cubes, time to serialize them to the JSON Streamlit
+    sends to the browser, and the size of that JSON.
+    """
+    import plotly.io
+    import data_viz
+
+    builders = {
+        "marijuana": data_viz.marijuana_figures,
+        "alcohol": data_viz.alcohol_figures,
+        "treatment": data_viz.treatment_figures,
+    }
+    rows = []
+    for scale in scales:
+        display, index, cube, _ = prepared_dataset(scale)
+        filtered_df_display = display[filter_mask(index, selections)]
+        for tab, build in builders.items():
+            figures = [fig for fig in build(filtered_df_display, cube, selections).values() if fig is not None]
+
+            def serialize():
+                return [plotly.io.to_json(fig, validate=False) for fig in figures]
+
+            rows.append({
+                "scale": f"{scale}x",
+                "rows": len(display),
+                "tab": tab,
+                "payload_kb": sum(len(spec) for spec in serialize()) / 1024,
+                "build_ms": best_time(lambda: build(filtered_df_display, cube, selections), repeat) * 1000,
+                "to_json_ms": best_time(serialize, repeat) * 1000,
+            })
+    return pd.DataFrame(rows)
+
+
+def bench_sessions(scales, repeat, selections):
+    """
+    Memory of 1, 10 and 50 concurrent sessions of the Descriptive Analysis page. Each
+    session, in its own thread, gets the cached dataset objects the way the page does
+    (data_loader's load_* functions), resolves the filter selection to its rows, and
+    holds them until every session has, as overlapping reruns do. The cached objects
+    are built before tracing, once per process; per_session_mb is the traced peak
+    divided by the number of sessions.
+    """
+    import logging
+    import threading
+
+    import streamlit as st
+
+    import data_loader
+
+    # Sessions are plain threads here, without the Streamlit script context they have in the app.
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").setLevel(logging.ERROR)
+    original_path = data_loader.DATA_PATH
+    base = read_dataset()
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            for scale in scales:
+                data_loader.DATA_PATH = os.path.join(tmp, f"scaled_{scale}x.parquet")
+                scale_frame(base, scale).to_parquet(data_loader.DATA_PATH)
+                st.cache_data.clear()
+                st.cache_resource.clear()
+                loaders = [data_loader.load_display_data, data_loader.load_filter_index,
+                           data_loader.load_data_cube, data_loader.load_corr_stats]
+                for load in loaders:
+                    load()
+                shared_mb = frame_mb(data_loader.load_display_data())
+
+                for sessions in (1, 10, 50):
+                    barrier = threading.Barrier(sessions)
+
+                    def session():
+                        df, filter_index, _, _ = [load() for load in loaders]
+                        mask = filter_mask(filter_index, selections)
+                        filtered = df if mask.all() else df[mask]
+                        barrier.wait()
+                        return filtered
+
+                    def run_sessions():
+                        threads = [threading.Thread(target=session) for _ in range(sessions)]
+                        for thread in threads:
+                            thread.start()
+                        for thread in threads:
+                            thread.join()
+
+                    peak_mb = peak_alloc_mb(run_sessions)
+                    rows.append({
+                        "scale": f"{scale}x",
+                        "rows": len(data_loader.load_data()),
+                        "shared_mb": shared_mb,
+                        "sessions": sessions,
+                        "peak_mb": peak_mb,
+                        "per_session_mb": peak_mb / sessions,
+                    })
+        finally:
+            data_loader.DATA_PATH = original_path
+            st.cache_data.clear()
+            st.cache_resource.clear()
+    return pd.DataFrame(rows)
+
+
+def process_memory():
+    """
+    Returns this process's resident set size, proportional set size and anonymous
+    (heap, not file-backed) memory in MB, read from /proc/self/smaps_rollup (Linux only).
+    """
+    with open("/proc/self/smaps_rollup") as f:
+        fields = {line.split(":")[0]: int(line.split()[1]) for line in f if line.rstrip().endswith("kB")}
+    return {"rss_mb": fields["Rss"] / 1024, "pss_mb": fields["Pss"] / 1024, "anon_mb": fields["Anonymous"] / 1024}
+
+
+def _dataset_process(mode, path, selections):
+    # Body of a bench_processes worker: loads the dataset the way a server process of
+    # the given mode does, touches every column, reports "ready" and measures its memory
+    # once the parent writes a line to stdin (when every worker is ready).
+    from filter_index import filter_mask
+    from data_loader import read_only
+    from mapped_dataset import open_mapped_dataset
+
+    before = process_memory()
+    if mode == "mapped":
+        mapped = open_mapped_dataset(path)
+        display, index = mapped["display"], mapped["filter_index"]
+    else:
+        df = read_dataset(path)
+        display, index = read_only(apply_display_mappings(df)), read_only(build_filter_index(df))
+        del df
+    mask = filter_mask(index, selections)
+    view = display if mask.all() else display[mask]
+    for col in display.columns:
+        display[col].value_counts()
+    print("ready", flush=True)
+    sys.stdin.readline()
+    memory = process_memory()
+    print(json.dumps({**memory, "data_mb": memory["rss_mb"] - before["rss_mb"],
+                      "data_anon_mb": memory["anon_mb"] - before["anon_mb"], "rows": len(view)}), flush=True)
+
+
+def bench_processes(scales, repeat, selections):
+    """
+    Memory of 1, 4 and 8 server processes on one host, each either loading its own
+    copy of the dataset (read from a Parquet file, labels decoded and filter index built
+    in the process) or mapping one mapped_dataset directory. Every worker loads the
+    data and reads all of its columns; then all of them measure at once. rss_mb counts
+    every page a process maps, shared ones included; pss_mb charges each shared page in
+    equal parts to the processes mapping it, so host_mb, their sum, is what the host
+    spends. data_mb is a process's resident growth from loading the data, above the
+    interpreter and libraries, and data_anon_mb the part of it in private heap memory
+    rather than in mapped files. Linux only (reads /proc).
+    """
+    from mapped_dataset import build_mapped_dataset
+
+    base = read_dataset()
+    code = "import json, sys; from benchmark import _dataset_process; " \
+           "_dataset_process(sys.argv[1], sys.argv[2], json.loads(sys.argv[3]))"
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for scale in scales:
+            paths = {"private": os.path.join(tmp, f"scaled_{scale}x.parquet"),
+                     "mapped": os.path.join(tmp, f"scaled_{scale}x-mapped")}
+            scale_frame(base, scale).to_parquet(paths["private"])
+            build_mapped_dataset(paths["private"], paths["mapped"])
+            for mode, path in paths.items():
+                for workers in (1, 4, 8):
+                    processes = [subprocess.Popen(
+                        [sys.executable, "-c", code, mode, path, json.dumps(selections)],
+                        stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+                        cwd=os.path.dirname(os.path.abspath(__file__))) for _ in range(workers)]
+                    for process in processes:
+                        if process.stdout.readline().strip() != "ready":
+                            raise RuntimeError(f"A {mode} worker failed to load the dataset.")
+                    reports = [json.loads(process.communicate("\n")[0]) for process in processes]
+                    rows.append({
+                        "scale": f"{scale}x",
+                        "rows": len(base) * scale,
+                        "mode": mode,
+                        "workers": workers,
+                        "rss_mb": np.mean([report["rss_mb"] for report in reports]),
+                        "data_mb": np.mean([report["data_mb"] for report in reports]),
+                        "data_anon_mb": np.mean([report["data_anon_mb"] for report in reports]),
+                        "pss_mb": np.mean([report["pss_mb"] for report in reports]),
+                        "host_mb": sum(report["pss_mb"] for report in reports),
+                    })
+    return pd.DataFrame(rows)
+
+
+def bench_dashboard(section):
+    """
+    Builds the benchmark of one Descriptive Analysis tab: time and peak traced memory of
+    a rerun's data work (see dashboard_rerun).
+    """
+    def bench(scales, repeat, selections):
+        rows = []
+        for scale in scales:
+            rerun = dashboard_rerun(section, scale, selections)
+            rows.append({
+                "scale": f"{scale}x",
+                "rows": len(prepared_dataset(scale)[0]),
+                "time_ms": best_time(rerun, repeat) * 1000,
+                "peak_mb": peak_alloc_mb(rerun),
+            })
+        return pd.DataFrame(rows)
+    bench.__doc__ = f"Per-rerun data work of the {section} tab."
+    return bench
+
+
+def bench_predictive(scales, repeat, selections):
+    """
+    The Predictive Analysis page's model work: fitting the alcever pipeline, scoring one
+    form submission, and scoring every row in one batch, through the sklearn pipeline
+    and through its compiled numpy scorer. The compiled scorer is checked against the
+    pipeline for each of its links (see check_compiled_links).
+    """
+    from batch_scoring import score_frame
+    from compiled_model import compile_model
+    from model_store import FEATURES, train_model
+
+    base = read_dataset()
+    rows = []
+    for scale in scales:
+        df = scale_frame(base, scale)
+        model_pipeline = train_model(df, "alcever")
+        compiled = compile_model(model_pipeline)
+        input_df = df[FEATURES].iloc[[0]]
+        rows.append({
+            "scale": f"{scale}x",
+            "rows": len(df),
+            "train_ms": best_time(lambda: train_model(df, "alcever"), repeat) * 1000,
+            "train_peak_mb": peak_alloc_mb(lambda: train_model(df, "alcever")),
+            "compile_ms": best_time(lambda: compile_model(model_pipeline), repeat) * 1000,
+            "predict_one_ms": best_time(lambda: (model_pipeline.predict_proba(input_df), model_pipeline.predict(input_df)), repeat) * 1000,
+            "predict_one_compiled_ms": best_time(lambda: compiled.score(input_df), repeat) * 1000,
+            "score_all_ms": best_time(lambda: model_pipeline.predict_proba(df[FEATURES]), repeat) * 1000,
+            "score_all_compiled_ms": best_time(lambda: score_frame(compiled, df), repeat) * 1000,
+            **check_compiled_links(df),
+        })
+    return pd.DataFrame(rows)
+
+
+def bench_table(scales, repeat, selections):
+    """
+    The prediction form's probability table of the alcever model: the grid of form
+    inputs, the table's size and build time and peak memory, and answering one
+    submission from the table against scoring it with the compiled scorer and the
+    sklearn pipeline. Grids over MAX_TABLE_CELLS, which the page scores live, are
+    only sized.
+    """
+    from compiled_model import compile_model
+    from model_store import train_model
+    from probability_table import MAX_TABLE_CELLS, build_probability_table, form_grid_axes, grid_cells, lookup
+
+    base = read_dataset()
+    rows = []
+    for scale in scales:
+        df = scale_frame(base, scale)
+        axes = form_grid_axes(df)
+        row = {"scale": f"{scale}x", "rows": len(df), "grid": "x".join(str(len(values)) for values in axes.values()),
+               "cells": grid_cells(axes), "fits": grid_cells(axes) <= MAX_TABLE_CELLS}
+        rows.append(row)
+        if not row["fits"]:
+            continue
+        model_pipeline = train_model(df, "alcever")
+        compiled = compile_model(model_pipeline)
+        tables = []
+        row["build_peak_mb"] = peak_alloc_mb(lambda: tables.append(build_probability_table(model_pipeline, axes)))
+        row["build_ms"] = best_time(lambda: build_probability_table(model_pipeline, axes), repeat) * 1000
+        table = tables[0]
+        row["table_mb"] = (table["probability"].nbytes + table["prediction"].nbytes) / 2**20
+
+        rng = np.random.default_rng(scale)
+        inputs = [{feature: values[rng.integers(len(values))].item() for feature, values in axes.items()}
+                  for _ in range(300)]
+        answers = [lookup(table, input_data) for input_data in inputs]
+        proba = model_pipeline.predict_proba(pd.DataFrame(inputs))
+        max_abs_diff = float(np.abs(np.array([answer[0] for answer in answers]) - proba[:, 1]).max())
+        if max_abs_diff > 1e-12 or any(answer[1] != predicted for answer, predicted in
+                                       zip(answers, model_pipeline.classes_[proba.argmax(axis=1)])):
+            raise ValueError(f"The probability table differs from the pipeline at {scale}x "
+                             f"(probabilities by up to {max_abs_diff:.3g}).")
+        input_df = pd.DataFrame([inputs[0]])
+        # Per lookup, timed over 1,000 calls
+        row["lookup_us"] = best_time(lambda: [lookup(table, inputs[0]) for _ in range(1000)], repeat) * 1000
+        row["compiled_ms"] = best_time(lambda: compiled.score(inputs[0]), repeat) * 1000
+        row["pipeline_ms"] = best_time(lambda: (model_pipeline.predict_proba(input_df),
+                                                model_pipeline.predict(input_df)), repeat) * 1000
+        row["max_abs_diff"] = max_abs_diff
+    return pd.DataFrame(rows)
+
+
+def check_compiled_links(df):
+    """
+    Fits a model of each kind the page can load and checks that its compiled scorer
+    predicts the same classes as the pipeline and probabilities within 1e-12, also
+    for unknown and missing codes (see compiled_model.check_compiled): the binary
+    alcever model, multinomial mjever models from the lbfgs and saga solvers, and the
+    one-vs-rest streamed mjever model. Raises ValueError if one does not.
+
+    Returns:
+        dict: The largest absolute probability difference of each model.
+    """
+    from compiled_model import check_compiled, compile_model
+    from incremental_model import train_incremental
+    from model_store import FEATURES, HYPERPARAMETERS, train_model
+
+    models = {
+        "binary": train_model(df, "alcever"),
+        "lbfgs": train_model(df, "mjever", {**HYPERPARAMETERS, "solver": "lbfgs", "max_iter": 1000}),
+        "saga": train_model(df, "mjever", {**HYPERPARAMETERS, "solver": "saga"}),
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "train.parquet")
+        df[FEATURES + ["mjever"]].to_parquet(path)
+        models["ovr"] = train_incremental(path, "mjever", holdout_fraction=0)[0]
+    expected_links = {"binary": "binary", "lbfgs": "softmax", "saga": "softmax", "ovr": "ovr"}
+    diffs = {}
+    for name, model_pipeline in models.items():
+        compiled = compile_model(model_pipeline)
+        if compiled.link != expected_links[name]:
+            raise ValueError(f"The {name} model compiled with the {compiled.link} link.")
+        diffs[f"{name}_max_abs_diff"] = check_compiled(model_pipeline, compiled, df[FEATURES].dropna())
+    return diffs
+
+
+SECTIONS = {
+    **{section: bench_dashboard(section) for section in DASHBOARD_SECTIONS},
+    "predictive": bench_predictive,
+    "table": bench_table,
+    "load": bench_load,
+    "memory": bench_memory,
+    "labels": bench_labels,
+    "filters": bench_filters,
+    "cube": bench_cube,
+    "corr": bench_corr,
+    "payload": bench_payload,
+    "models": bench_models,
+    "selection": bench_selection,
+    "incremental": bench_incremental,
+    "sessions": bench_sessions,
+    "processes": bench_processes,
+}
+
+
+def parse_selection(items):
+    """
+    Parses repeated `--select column=code,code` options into a selections dict.
+    """
+    selections = {}
+    for item in items:
+        col, _, codes = item.partition("=")
+        selections[col] = [int(code) for code in codes.split(",") if code]
+    return selections
+
+
+def compare_results(current, previous):
+    """
+    Returns, per section, the ratio of each timing column to the previous run at the same
+    scale (above 1 means slower now).
+    """
+    ratios = {}
+    for name, rows in current["sections"].items():
+        before = {row["scale"]: row for row in previous.get("sections", {}).get(name, [])}
+        table = []
+        for row in rows:
+            old = before.get(row["scale"])
+            if old is None:
+                continue
+            table.append({"scale": row["scale"], **{
+                col: row[col] / old[col] for col in row
+                if col.endswith("_ms") and old.get(col)
+            }})
+        if table:
+            ratios[name] = pd.DataFrame(table)
+    return ratios
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard's data work without a browser.")
+    # Checked after parsing: before Python 3.12, argparse rejects an empty "*" list that has choices.
+    parser.add_argument("sections", nargs="*", metavar="SECTION",
+                        help=f"Sections to run (default: all): {', '.join(SECTIONS)}")
+    parser.add_argument("--scales", nargs="+", type=int, default=[1, 10, 100],
+                        help="Dataset sizes as multiples of the shipped row count")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed repetitions per measurement")
+    parser.add_argument("--select", action="append", default=[], metavar="COLUMN=CODES",
+                        help="Sidebar filter selection, e.g. age2=2,3,4 (repeatable; default: a sample "
+                             "selection restricting all four filters)")
+    parser.add_argument("--no-filter", action="store_true", help="Benchmark the unfiltered default view")
+    parser.add_argument("--synthetic", action="store_true",
+                        help="Sample scaled datasets from the data's distribution instead of repeating rows")
+    parser.add_argument("--json", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Print timing ratios against a previous --json file")
+    args = parser.parse_args()
+    unknown = [name for name in args.sections if name not in SECTIONS]
+    if unknown:
+        parser.error(f"unknown section(s) {', '.join(unknown)} (choose from {', '.join(SECTIONS)})")
+
+    if args.synthetic:
+        from synthetic_data import fit_generator
+        global SYNTHETIC_MODEL
+        SYNTHETIC_MODEL = fit_generator(pd.read_csv(DATA_PATH))
+
+    selections = {} if args.no_filter else (parse_selection(args.select) if args.select else SAMPLE_SELECTIONS)
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "scales": args.scales,
+            "repeat": args.repeat,
+            "synthetic": args.synthetic,
+            "selections": selections,
+        },
+        "sections": {},
+    }
+    for name in args.sections or list(SECTIONS):
+        table = SECTIONS[name](args.scales, args.repeat, selections)
+        results["sections"][name] = table.to_dict(orient="records")
+        print(f"\n== {name} ==")
+        print(table.to_string(index=False, float_format="%.2f"))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2, default=float)
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        for name, table in compare_results(results, previous).items():
+            print(f"\n== {name} vs {args.compare} ==")
+            print(table.to_string(index=False, float_format="%.2f"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Scores respondents with a fitted substance-use model without going through sklearn.
+
+A model_store (or incremental_model) pipeline is a one-hot encoder followed by a
+linear classifier, so a respondent's score is the intercept plus one coefficient per
+categorical feature, picked by the feature's code, plus the numerical features times
+their coefficients. compile_model extracts those numbers once into per-feature
+code-to-weight tables, and CompiledModel.score computes the scores of one row or a
+whole batch with numpy indexing and sums, skipping the pipeline's input validation,
+column selection and sparse matrix construction. Like the pipeline, it treats a
+missing or unseen categorical code as a zero-weight unknown category and rejects a
+missing numerical feature.
+"""
+import numpy as np
+from scipy.special import expit, softmax
+from sklearn.linear_model import LogisticRegression
+from sklearn.preprocessing import FunctionTransformer, OneHotEncoder
+
+
+class CompiledModel:
+    """
+    The intercept, per-feature weight tables and class labels of a fitted pipeline.
+
+    Attributes:
+        classes (np.ndarray): Class labels, in predict_proba column order.
+        intercept (np.ndarray): One intercept per decision function.
+        tables (dict): Categorical feature to a (max code + 1, n functions) weight
+            table; codes the encoder did not see have zero weight.
+        coefficients (dict): Numerical feature to its weight per decision function.
+        link (str): 'binary', 'softmax' or 'ovr', how the decision functions map
+            to class probabilities.
+    """
+
+    def __init__(self, classes, intercept, tables, coefficients, link):
+        self.classes = classes
+        self.intercept = intercept
+        self.tables = tables
+        self.coefficients = coefficients
+        self.link = link
+
+    def decision_function(self, data):
+        """
+        Returns the decision functions of the rows of data, shape (rows, functions).
+
+        Args:
+            data: A DataFrame, or a dict of feature name to a value or array.
+
+        Raises:
+            ValueError: If a numerical feature is missing (NaN) in any row, as the
+                pipeline's LogisticRegression raises.
+        """
+        columns = {feature: np.atleast_1d(np.asarray(data[feature], dtype=np.float64))
+                   for feature in [*self.tables, *self.coefficients]}
+        n_rows = len(next(iter(columns.values())))
+        scores = np.tile(self.intercept, (n_rows, 1))
+        for feature, table in self.tables.items():
+            codes = columns[feature]
+            known = (codes >= 0) & (codes < len(table)) & (codes == np.floor(codes))
+            scores += np.where(known[:, None], table[np.where(known, codes, 0).astype(np.intp)], 0.0)
+        for feature, weights in self.coefficients.items():
+            if np.isnan(columns[feature]).any():
+                raise ValueError(f"Input X contains NaN: {feature} is missing in "
+                                 f"{int(np.isnan(columns[feature]).sum())} rows.")
+            scores += columns[feature][:, None] * weights
+        return scores
+
+    def predict_proba(self, data):
+        """
+        Returns the class probabilities of the rows of data, as the pipeline's
+        predict_proba does.
+        """
+        scores = self.decision_function(data)
+        if self.link == 'softmax':
+            return softmax(scores, axis=1)
+        proba = expit(scores)
+        if self.link == 'binary':
+            return np.hstack([1 - proba, proba])
+        # One-vs-rest probabilities, normalized like sklearn's _predict_proba_lr.
+        total = proba.sum(axis=1, keepdims=True)
+        return np.where(total == 0, 1 / proba.shape[1], proba / np.where(total == 0, 1, total))
+
+    def score(self, data):
+        """
+        Scores the rows of data in one call.
+
+        Returns:
+            tuple: (probability, prediction) arrays: predict_proba's second column, the
+            likelihood shown on the Predictive Analysis page, and the predicted class.
+        """
+        proba = self.predict_proba(data)
+        return proba[:, 1], self.classes[np.argmax(proba, axis=1)]
+
+
+def compile_model(model_pipeline):
+    """
+    Extracts a CompiledModel from a fitted pipeline of a ColumnTransformer (one-hot
+    encoded and passthrough columns) and a linear classifier.
+
+    Args:
+        model_pipeline (Pipeline): A fitted pipeline from model_store or incremental_model.
+
+    Returns:
+        CompiledModel: Gives the pipeline's predict_proba up to floating-point rounding.
+    """
+    preprocessor = model_pipeline.named_steps['preprocessor']
+    classifier = model_pipeline.named_steps['classifier']
+    coef = classifier.coef_.T
+
+    tables = {}
+    coefficients = {}
+    for name, transformer, features in preprocessor.transformers_:
+        columns = preprocessor.output_indices_[name]
+        if columns.start == columns.stop:
+            continue
+        weights = coef[columns]
+        if isinstance(transformer, OneHotEncoder):
+            if transformer.drop_idx_ is not None or getattr(transformer, '_infrequent_enabled', False):
+                raise ValueError("Only one-hot encoders without dropped or infrequent categories can be compiled.")
+            offset = 0
+            for feature, categories in zip(features, transformer.categories_):
+                codes = np.asarray(categories, dtype=np.float64)
+                if (codes < 0).any() or (codes != np.floor(codes)).any():
+                    raise ValueError(f"{feature} has categories that are not non-negative integer codes.")
+                table = np.zeros((int(codes.max()) + 1, coef.shape[1]))
+                table[codes.astype(np.intp)] = weights[offset:offset + len(codes)]
+                tables[feature] = table
+                offset += len(codes)
+        elif transformer == 'passthrough' or isinstance(transformer, FunctionTransformer) and transformer.func is None:
+            for feature, feature_weights in zip(features, weights):
+                coefficients[feature] = feature_weights
+        else:
+            raise ValueError(f"Cannot compile the {name!r} transformer {transformer!r}.")
+
+    if len(classifier.classes_) <= 2:
+        link = 'binary'
+    elif isinstance(classifier, LogisticRegression) and not (
+            getattr(classifier, 'multi_class', 'auto') == 'ovr' or classifier.solver == 'liblinear'):
+        # Scikit-learn versions that still had multi_class fitted liblinear one-vs-rest.
+        link = 'softmax'
+    else:
+        link = 'ovr'
+    return CompiledModel(classifier.classes_, classifier.intercept_.copy(), tables, coefficients, link)
+
+
+def check_compiled(model_pipeline, compiled, data, tolerance=1e-12):
+    """
+    Checks that a compiled model scores the rows of data like its pipeline: the same
+    predicted classes and probabilities within tolerance, also when a categorical
+    feature has a code the encoder did not see or no code, and a ValueError from both
+    for a row with a missing numerical feature.
+
+    Args:
+        model_pipeline (Pipeline): The fitted pipeline.
+        compiled (CompiledModel): Its compile_model scorer.
+        data (pd.DataFrame): Rows with the pipeline's feature columns.
+        tolerance (float): Largest absolute probability difference allowed.
+
+    Returns:
+        float: The largest absolute probability difference.
+
+    Raises:
+        ValueError: If a prediction differs, a probability differs by more than
+            tolerance, or a row with a missing numerical feature is scored.
+    """
+    def compare(rows, what):
+        proba = compiled.predict_proba(rows)
+        max_abs_diff = float(np.abs(proba - model_pipeline.predict_proba(rows)).max(initial=0))
+        if max_abs_diff > tolerance:
+            raise ValueError(f"The {compiled.link} compiled model's probabilities differ from the pipeline's "
+                             f"by up to {max_abs_diff:.3g} on {what}.")
+        mismatched = int((compiled.classes[np.argmax(proba, axis=1)] != model_pipeline.predict(rows)).sum())
+        if mismatched:
+            raise ValueError(f"The {compiled.link} compiled model predicts a different class for {mismatched} {what}.")
+        return max_abs_diff
+
+    max_abs_diff = compare(data, "rows")
+    if compiled.tables and len(data):
+        # Copies of the first row with one categorical feature at a time set to a code
+        # past the encoder's categories, then to no code.
+        unknown = data.iloc[[0] * (2 * len(compiled.tables))].astype(
+            {feature: np.float64 for feature in compiled.tables})
+        for number, (feature, table) in enumerate(compiled.tables.items()):
+            column = unknown.columns.get_loc(feature)
+            unknown.iloc[2 * number, column] = len(table)
+            unknown.iloc[2 * number + 1, column] = np.nan
+        max_abs_diff = max(max_abs_diff, compare(unknown, "rows with an unknown or missing code"))
+    if compiled.coefficients and len(data):
+        missing = data.iloc[[0]].astype({feature: np.float64 for feature in compiled.coefficients})
+        missing[next(iter(compiled.coefficients))] = np.nan
+        for name, scorer in (("compiled model", compiled.score), ("pipeline", model_pipeline.predict_proba)):
+            try:
+                scorer(missing)
+            except ValueError:
+                continue
+            raise ValueError(f"The {compiled.link} {name} scored a row with a missing numerical feature.")
+    return max_abs_diff
@@ -0,0 +1,462 @@
+import numpy as np
+import pandas as pd
+
+# Dimensions the sidebar filters on; every cube cell is keyed by all of them.
+CUBE_FILTERS = ['age2', 'eduhighcat', 'irwrkstat', 'irmaritstat']
+
+# Outcome columns whose counts and sums the rate charts need.
+CUBE_OUTCOMES = ['mjever', 'alcever', 'alcbng30d']
+
+# Grouping variables of the rate charts, by cube name.
+CUBE_GROUPS = {
+    'age2': ['age2'],
+    'eduhighcat': ['eduhighcat'],
+    'irwrkstat': ['irwrkstat'],
+    'irmaritstat': ['irmaritstat'],
+    'income': ['income'],
+    'poverty3': ['poverty3'],
+    'govtprog': ['govtprog'],
+    'frdmjmon': ['frdmjmon'],
+    'irhhsiz2': ['irhhsiz2'],
+    'parents': ['imother', 'ifather']
+}
+
+# Columns of the histograms and the first-use density chart, by cube name. These cubes
+# hold row counts per code instead of outcome totals, so the charts are drawn from bin
+# counts rather than from every respondent's value.
+HISTOGRAM_GROUPS = {
+    'mjage': ['mjage'],
+    'mjday30a': ['mjday30a'],
+    'alcydays': ['alcydays'],
+    'age2_mjage': ['age2', 'mjage']
+}
+
+# Substance use columns of the correlation heatmap.
+CORR_COLUMNS = ['mjever', 'alcever', 'mjday30a', 'alcydays', 'mjage']
+
+# NSDUH codes that are not answers on the columns' scale: don't know, refused, blank,
+# bad data and the "never used" / "did not use in the period" skips.
+CORR_SENTINELS = {
+    'mjever': [94, 97, 98],
+    'alcever': [85, 94, 97, 98],
+    'mjday30a': [85, 91, 93, 94, 97, 98],
+    'alcydays': [6],
+    'mjage': [985, 991, 994, 997, 998]
+}
+
+# Resamples and coverage of the rate confidence intervals.
+BOOTSTRAP_SAMPLES = 2000
+CONFIDENCE_LEVEL = 0.95
+
+# Largest number of possible key combinations accumulated with a dense bincount;
+# sparser keys are compacted with np.unique first.
+DENSE_KEY_LIMIT = 1 << 24
+
+
+def factorize_codes(values):
+    """
+    Maps a column of integer codes to dense ids in code order, in one pass when the
+    codes are small non-negative integers.
+
+    Args:
+        values (pd.Series or np.ndarray): The coded column, without missing values.
+
+    Returns:
+        tuple: (ids as np.intp array, sorted distinct codes as np.ndarray)
+    """
+    values = np.asarray(values)
+    if values.dtype.kind in 'iu' and len(values) and values.min() >= 0 and values.max() < DENSE_KEY_LIMIT:
+        present = np.bincount(values) > 0
+        codes = np.flatnonzero(present)
+        lookup = np.cumsum(present) - 1
+        return lookup[values], codes.astype(values.dtype)
+    codes, ids = np.unique(values, return_inverse=True)
+    return ids.ravel(), codes
+
+
+def combine_keys(ids, sizes):
+    """
+    Combines per-column ids into one mixed-radix key per row, the first column most
+    significant, so keys sort like the id tuples. Returns (keys, number of possible keys).
+    """
+    keys = np.zeros(len(ids[0]) if ids else 0, dtype=np.int64)
+    for column_ids, size in zip(ids, sizes):
+        keys = keys * size + column_ids
+    return keys, int(np.prod(sizes, dtype=np.int64))
+
+
+def aggregate(keys, n_keys, values, count_rows=False, codes=None):
+    """
+    Counts rows and sums values per key in one bincount pass per statistic.
+
+    Args:
+        keys (np.ndarray): Non-negative int key per row.
+        n_keys (int): Number of possible keys.
+        values (dict): Name to float64 array aligned with keys; NaN values are left
+            out of that column's count and sum, like groupby's count and sum.
+        count_rows (bool): Also return the number of rows per key, as 'rows'.
+        codes (dict, optional): Name of values to (code id per row, distinct codes),
+            as returned by factorize_codes; the rows of each code are also counted,
+            as '<name>=<code>'.
+
+    Returns:
+        tuple: (keys present, dict of ('rows',) '<name>_count' / '<name>_sum' and then
+        '<name>=<code>' int64 arrays aligned with the present keys, in the order of values)
+    """
+    if n_keys > DENSE_KEY_LIMIT:
+        present, keys = np.unique(keys, return_inverse=True)
+        keys, n_keys = keys.ravel(), len(present)
+    else:
+        present = None
+    row_counts = np.bincount(keys, minlength=n_keys)
+    totals = {'rows': row_counts} if count_rows else {}
+    for name, data in values.items():
+        valid = ~np.isnan(data)
+        if valid.all():
+            totals[f"{name}_count"] = np.bincount(keys, minlength=n_keys)
+            totals[f"{name}_sum"] = np.bincount(keys, weights=data, minlength=n_keys)
+        else:
+            totals[f"{name}_count"] = np.bincount(keys[valid], minlength=n_keys)
+            totals[f"{name}_sum"] = np.bincount(keys[valid], weights=data[valid], minlength=n_keys)
+    for name, (ids, distinct) in (codes or {}).items():
+        valid = ~np.isnan(values[name])
+        # One bincount over (key, code) pairs counts every code at once
+        per_code = np.bincount(keys[valid] * len(distinct) + ids[valid], minlength=n_keys * len(distinct))
+        per_code = per_code.reshape(n_keys, len(distinct))
+        for j, code in enumerate(distinct.tolist()):
+            totals[f"{name}={code}"] = per_code[:, j]
+    rows = row_counts > 0
+    for name in totals:
+        totals[name] = totals[name][rows].astype(np.int64)
+    observed = np.flatnonzero(rows)
+    return (observed if present is None else present[observed]), totals
+
+
+def build_cube(df):
+    """
+    Pre-aggregates the outcome counts and sums over the filter dimensions and each
+    grouping variable of CUBE_GROUPS, and the row counts over the filter dimensions and
+    each code of the HISTOGRAM_GROUPS columns.
+
+    The key columns are factorized once; each cube is then accumulated with bincounts
+    on a combined integer key, in the cell order `groupby(keys).agg(['count', 'sum'])`
+    would produce.
+
+    Args:
+        df (pd.DataFrame): The dataset.
+
+    Returns:
+        dict: Cube name to a dict holding one cell per observed combination of the
+        filter and grouping codes: 'filters' (filter column to cell codes), 'groups'
+        (index of the distinct grouping codes), 'group_ids' (each cell's position in
+        'groups'), 'columns' (`<outcome>_count` / `<outcome>_sum` names followed by
+        `<outcome>=<code>` row counts per outcome code, or 'rows' for the histogram
+        cubes) and 'values' (cells x columns int64 totals).
+    """
+    all_groups = {**CUBE_GROUPS, **HISTOGRAM_GROUPS}
+    key_columns = list(dict.fromkeys(CUBE_FILTERS + [col for cols in all_groups.values() for col in cols]))
+    # Like groupby, rows with a missing key are left out of the cubes keyed by that column
+    complete = {col: df[col].notna().to_numpy() for col in key_columns}
+    factorized = {}
+    for col in key_columns:
+        ids, codes = factorize_codes(df[col].to_numpy(dtype=np.int64, na_value=0))
+        # Cell codes keep the column's compact dtype, as groupby's keys do
+        factorized[col] = (ids, codes.astype(df[col].dtype) if isinstance(df[col].dtype, np.dtype) else codes)
+    # The filter dimensions lead every cube's key, so their combined key is computed once
+    filter_keys, n_filter_keys = combine_keys([factorized[col][0] for col in CUBE_FILTERS],
+                                              [len(factorized[col][1]) for col in CUBE_FILTERS])
+    outcomes = {outcome: df[outcome].to_numpy(dtype=np.float64, na_value=np.nan) for outcome in CUBE_OUTCOMES}
+    # Rows per outcome code, which the rate intervals resample
+    outcome_codes = {}
+    for outcome, column in outcomes.items():
+        valid = ~np.isnan(column)
+        ids = np.zeros(len(column), dtype=np.intp)
+        ids[valid], distinct = factorize_codes(column[valid].astype(np.int64))
+        outcome_codes[outcome] = (ids, distinct)
+
+    cube = {}
+    for name, group_cols in all_groups.items():
+        histogram = name in HISTOGRAM_GROUPS
+        keys = list(dict.fromkeys(CUBE_FILTERS + group_cols))
+        rows = np.logical_and.reduce([complete[col] for col in keys])
+        if rows.all():
+            rows = slice(None)
+        sizes = [len(factorized[col][1]) for col in keys]
+        extra = keys[len(CUBE_FILTERS):]
+        combined, n_keys = combine_keys([filter_keys[rows]] + [factorized[col][0][rows] for col in extra],
+                                        [n_filter_keys] + sizes[len(CUBE_FILTERS):])
+        values = {} if histogram else {outcome: column[rows] for outcome, column in outcomes.items()}
+        codes = {} if histogram else {outcome: (ids[rows], distinct) for outcome, (ids, distinct) in outcome_codes.items()}
+        cells, totals = aggregate(combined, n_keys, values, count_rows=histogram, codes=codes)
+
+        # Decode each cell back into its codes, last key column first
+        cell_codes = {}
+        remainder = cells
+        for col, size in zip(reversed(keys), reversed(sizes)):
+            cell_codes[col] = factorized[col][1][remainder % size]
+            remainder = remainder // size
+
+        group_ids, groups = pd.MultiIndex.from_arrays([cell_codes[col] for col in group_cols]).factorize(sort=True)
+        groups = pd.MultiIndex.from_tuples(groups, names=group_cols)
+        if len(group_cols) == 1:
+            groups = groups.get_level_values(0)
+        cube[name] = {
+            'filters': {col: cell_codes[col] for col in CUBE_FILTERS},
+            'groups': groups,
+            'group_ids': group_ids,
+            'columns': list(totals),
+            'values': np.column_stack(list(totals.values())) if totals else np.empty((len(cells), 0), dtype=np.int64)
+        }
+    return cube
+
+
+def query_cube(cube, name, selections):
+    """
+    Sums the cube cells matching a filter selection, per value of the grouping variable.
+
+    Args:
+        cube (dict): The cube returned by build_cube.
+        name (str): Key of CUBE_GROUPS to query.
+        selections (dict): Filter column to list of selected codes; an empty list
+            does not restrict that column.
+
+    Returns:
+        pd.DataFrame: `<outcome>_count` and `<outcome>_sum` columns indexed by the
+        grouping code(s), sorted by code. Groups without matching cells are omitted.
+    """
+    entry = cube[name]
+    mask = np.ones(len(entry['group_ids']), dtype=bool)
+    for col, codes in selections.items():
+        if codes:
+            mask &= np.isin(entry['filters'][col], codes)
+    group_ids = entry['group_ids'][mask]
+    n_groups, n_columns = len(entry['groups']), len(entry['columns'])
+    # One bincount over (group, column) pairs sums every column at once
+    flat = (group_ids[:, None] * n_columns + np.arange(n_columns)).ravel()
+    totals = np.bincount(flat, weights=entry['values'][mask].ravel(), minlength=n_groups * n_columns)
+    totals = totals.reshape(n_groups, n_columns).astype(np.int64)
+    observed = np.bincount(group_ids, minlength=n_groups) > 0
+    return pd.DataFrame(totals[observed], index=entry['groups'][observed], columns=entry['columns'])
+
+
+def group_rates(cube, name, selections, outcome):
+    """
+    Returns the count, sum and percentage of an outcome per group, as the rate charts
+    computed them with `groupby(...).agg(["count", "sum"])`.
+
+    Args:
+        cube (dict): The cube returned by build_cube.
+        name (str): Key of CUBE_GROUPS to query.
+        selections (dict): Filter column to list of selected codes.
+        outcome (str): One of CUBE_OUTCOMES.
+
+    Returns:
+        pd.DataFrame: 'count', 'sum' and 'percentage' columns, and the percentage's
+        confidence interval as 'ci_lower' and 'ci_upper' (see rate_intervals),
+        indexed by group code(s).
+    """
+    totals = query_cube(cube, name, selections)
+    rates = pd.DataFrame({
+        'count': totals[f"{outcome}_count"],
+        'sum': totals[f"{outcome}_sum"]
+    })
+    rates['percentage'] = (rates['sum'] / rates['count']) * 100
+    return rates.join(rate_intervals(totals, outcome))
+
+
+def rate_intervals(totals, outcome, level=CONFIDENCE_LEVEL, samples=BOOTSTRAP_SAMPLES, seed=0):
+    """
+    Bootstrap confidence intervals of an outcome's rate (`sum / count * 100`) per group.
+
+    Resampling a group's rows with replacement only changes how many rows carry each
+    outcome code, so every group is resampled at once with one batched multinomial
+    draw over its `<outcome>=<code>` counts, without touching the rows. The cost
+    depends on the number of groups, codes and samples, not on the row count. The
+    fixed seed makes a selection's intervals the same on every rerun.
+
+    Args:
+        totals (pd.DataFrame): Group totals returned by query_cube.
+        outcome (str): One of CUBE_OUTCOMES.
+        level (float): Coverage of the percentile intervals.
+        samples (int): Bootstrap resamples per group.
+        seed (int): Seed of the resampling.
+
+    Returns:
+        pd.DataFrame: 'ci_lower' and 'ci_upper' indexed like totals; NaN for groups
+        without rows.
+    """
+    columns = [col for col in totals.columns if col.startswith(f"{outcome}=")]
+    codes = np.array([float(col.split('=', 1)[1]) for col in columns])
+    counts = totals[columns].to_numpy(dtype=np.int64)
+    n = counts.sum(axis=1)
+    rng = np.random.default_rng(seed)
+    draws = rng.multinomial(n, counts / np.maximum(n, 1)[:, None], size=(samples, len(n)))
+    rates = draws @ codes / np.maximum(n, 1) * 100
+    lower, upper = np.quantile(rates, [(1 - level) / 2, (1 + level) / 2], axis=0) if len(n) else ([], [])
+    intervals = pd.DataFrame({'ci_lower': lower, 'ci_upper': upper}, index=totals.index)
+    intervals[n == 0] = np.nan
+    return intervals
+
+
+def code_labels(codes, mapping):
+    """
+    Maps group codes to display labels, keeping unmapped codes as strings.
+    """
+    return [mapping.get(code, str(code)) for code in codes]
+
+
+def code_counts(cube, name, selections):
+    """
+    Returns the number of rows per code (per code combination for multi-column cubes)
+    of a HISTOGRAM_GROUPS cube matching a filter selection.
+
+    Returns:
+        pd.Series: Counts named 'count', indexed by code(s) in code order.
+    """
+    return query_cube(cube, name, selections)['rows'].rename('count')
+
+
+def label_counts(values, mapping, order):
+    """
+    Counts rows per display label with a bincount over the codes, as
+    `labels.value_counts().reindex(order, fill_value=0)` does on the decoded column.
+
+    Args:
+        values (pd.Series): The coded column of the (filtered) rows.
+        mapping (dict): Code-to-label map such as AGE_MAP.
+        order (list): Labels to return counts for, in chart order.
+
+    Returns:
+        pd.Series: Counts indexed by order, named like value_counts' result.
+    """
+    ids, codes = factorize_codes(values.dropna().to_numpy(dtype=np.int64))
+    per_code = np.bincount(ids, minlength=len(codes))
+    per_label = dict.fromkeys(order, 0)
+    for code, count in zip(codes.tolist(), per_code.tolist()):
+        label = mapping.get(code, str(code))
+        if label in per_label:
+            per_label[label] += count
+    return pd.Series(list(per_label.values()), index=pd.Index(order, name=f"{values.name}_label"), name="count", dtype=np.int64)
+
+
+def _filter_cells(df):
+    # Cell id of every row over CUBE_FILTERS and each cell's codes, in code order.
+    ids, codes = zip(*(factorize_codes(df[col].to_numpy()) for col in CUBE_FILTERS))
+    keys, _ = combine_keys(list(ids), [len(col_codes) for col_codes in codes])
+    cell_ids, cells = factorize_codes(keys)
+    filters = {}
+    remainder = cells
+    for col, col_codes in zip(reversed(CUBE_FILTERS), reversed(codes)):
+        filters[col] = col_codes[remainder % len(col_codes)]
+        remainder = remainder // len(col_codes)
+    return cell_ids.ravel(), {col: filters[col] for col in CUBE_FILTERS}
+
+
+def build_corr_stats(df, exclude_sentinels=False):
+    """
+    Computes the sufficient statistics of the pairwise Pearson correlations of
+    CORR_COLUMNS per cell of the filter dimensions, so the correlation matrix of any
+    filter selection can be assembled from the cells instead of the rows.
+
+    Like `DataFrame.corr()`, each pair of columns uses the rows where both are
+    present. The columns must hold integer codes, which keeps the statistics exact.
+    Rows missing a filter code are left out, as they are from the cubes.
+
+    Args:
+        df (pd.DataFrame): The dataset.
+        exclude_sentinels (bool): Treat the CORR_SENTINELS codes as missing.
+
+    Returns:
+        dict: 'columns' (the CORR_COLUMNS present in df, in df's order), 'exclude_sentinels',
+        'filters' (filter column to cell codes) and four (cells x columns x columns)
+        int64 arrays over the rows where both columns i and j are present: 'n' (row
+        counts), 'sum' and 'sumsq' (sums of column i and of its squares) and 'cross'
+        (sums of the products of columns i and j).
+    """
+    columns = [col for col in df.columns if col in CORR_COLUMNS]
+    df = df.dropna(subset=CUBE_FILTERS)
+    values = df[columns].to_numpy(dtype=np.float64, na_value=np.nan)
+    if exclude_sentinels:
+        for j, col in enumerate(columns):
+            values[np.isin(values[:, j], CORR_SENTINELS[col]), j] = np.nan
+    valid = ~np.isnan(values)
+    if (values[valid] % 1 != 0).any():
+        raise ValueError("Correlation statistics need integer codes")
+    # float64 products go through BLAS and stay exact for integer codes while the sums
+    # are below 2**53
+    present = valid.astype(np.float64)
+    x = np.where(valid, values, 0)
+
+    # Rows sorted by cell, so each cell's rows are one contiguous slice
+    cell_ids, filters = _filter_cells(df)
+    order = np.argsort(cell_ids, kind='stable')
+    present, x = present[order], x[order]
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(cell_ids, minlength=len(filters[CUBE_FILTERS[0]])))])
+    stats = {name: np.empty((len(bounds) - 1, len(columns), len(columns)), dtype=np.int64)
+             for name in ('n', 'sum', 'sumsq', 'cross')}
+    for cell in range(len(bounds) - 1):
+        cell_present, cell_x = present[bounds[cell]:bounds[cell + 1]], x[bounds[cell]:bounds[cell + 1]]
+        stats['n'][cell] = np.rint(cell_present.T @ cell_present)
+        stats['sum'][cell] = np.rint(cell_x.T @ cell_present)
+        stats['sumsq'][cell] = np.rint((cell_x * cell_x).T @ cell_present)
+        stats['cross'][cell] = np.rint(cell_x.T @ cell_x)
+    return {'columns': columns, 'exclude_sentinels': exclude_sentinels, 'filters': filters, **stats}
+
+
+def merge_corr_stats(left, right):
+    """
+    Combines the correlation statistics of two sets of rows, e.g. the stored dataset
+    and newly appended rows, into the statistics of their union.
+    """
+    if left['columns'] != right['columns'] or left['exclude_sentinels'] != right['exclude_sentinels']:
+        raise ValueError("Correlation statistics of different columns or sentinel handling cannot be merged")
+    codes = np.column_stack([np.concatenate([left['filters'][col], right['filters'][col]]) for col in CUBE_FILTERS])
+    cells, cell_ids = np.unique(codes, axis=0, return_inverse=True)
+    merged = {
+        'columns': left['columns'],
+        'exclude_sentinels': left['exclude_sentinels'],
+        'filters': {col: cells[:, i] for i, col in enumerate(CUBE_FILTERS)}
+    }
+    for name in ('n', 'sum', 'sumsq', 'cross'):
+        merged[name] = np.zeros((len(cells),) + left[name].shape[1:], dtype=np.int64)
+        np.add.at(merged[name], cell_ids.ravel(), np.concatenate([left[name], right[name]]))
+    return merged
+
+
+def append_corr_stats(stats, new_rows):
+    """
+    Returns stats updated with the rows of new_rows, without revisiting the rows
+    stats was built from.
+    """
+    return merge_corr_stats(stats, build_corr_stats(new_rows, stats['exclude_sentinels']))
+
+
+def corr_matrix(stats, selections):
+    """
+    Returns the Pearson correlation matrix of the rows matching a filter selection,
+    equal to `rows[columns].corr()` up to floating-point rounding, in time that does
+    not depend on the number of rows.
+
+    Args:
+        stats (dict): The statistics returned by build_corr_stats.
+        selections (dict): Filter column to list of selected codes; an empty list
+            does not restrict that column.
+
+    Returns:
+        pd.DataFrame: Correlations of stats['columns']; NaN where a pair has fewer
+        than two rows or a column is constant.
+    """
+    mask = np.ones(len(stats['n']), dtype=bool)
+    for col, codes in selections.items():
+        if codes:
+            mask &= np.isin(stats['filters'][col], codes)
+    # Python integers keep the centered sums exact before the final division
+    n, total, total_sq, cross = (stats[name][mask].sum(axis=0).astype(object)
+                                 for name in ('n', 'sum', 'sumsq', 'cross'))
+    covariance = n * cross - total * total.T
+    variance = n * total_sq - total * total
+    denominator = np.sqrt((variance * variance.T).astype(np.float64))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = covariance.astype(np.float64) / denominator
+    corr[(denominator == 0) | (n.astype(np.int64) < 2)] = np.nan
+    return pd.DataFrame(corr, index=stats['columns'], columns=stats['columns'])
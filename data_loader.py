@@ -1,6 +1,35 @@
+import hashlib
+import json
+import os
+
 import streamlit as st
+import numpy as np
 import pandas as pd
 
+from data_cube import build_corr_stats, build_cube
+from filter_index import build_filter_index
+from instrumentation import span
+
+try:
+    import pyarrow as pa
+    from pyarrow import ipc
+except ImportError:  # the binary cache is optional; fall back to plain CSV parsing
+    pa = ipc = None
+
+# Location of the cleaned dataset. Override with the NSDUH_DATA_PATH environment variable.
+DATA_PATH = os.environ.get(
+    "NSDUH_DATA_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "Cleaned Womens Dataset.csv")
+)
+
+# Prebuilt memory-mapped dataset directory (see mapped_dataset.py). When set, the loaders
+# below map its files instead of loading DATA_PATH, so the server processes of a host
+# share one copy of the data, its display labels and its filter index.
+MAPPED_DATASET_PATH = os.environ.get("NSDUH_MAPPED_DATASET")
+
+# Bump when the on-disk cache layout changes so stale caches are rebuilt.
+CACHE_VERSION = 2
+
 AGE_MAP = {
     1: "12-17",
     2: "18-25",
@@ -59,54 +88,353 @@ ALCPDANG_MAP = {
     4: "Not dangerous"
 }
 
+# Storage type of every column of the cleaned dataset. All columns are small integer
+# codes; only the age-at-first-use and yearly-days columns carry three-digit NSDUH
+# sentinels (985, 991, 998, ...) and need 16 bits.
+COLUMN_SCHEMA = {
+    'age2': 'int8', 'eduhighcat': 'int8', 'irwrkstat': 'int8', 'irmaritstat': 'int8',
+    'imother': 'int8', 'ifather': 'int8', 'irhhsiz2': 'int8', 'frdmjmon': 'int8',
+    'talkprob': 'int8', 'govtprog': 'int8', 'income': 'int8', 'poverty3': 'int8',
+    'mjever': 'int8', 'mjage': 'int16', 'mjday30a': 'int8', 'mjrec': 'int8',
+    'mjyrtot': 'int16', 'mjonlyflag': 'int8', 'mjonlyyr': 'int8', 'mjprior': 'int8',
+    'mjpriyr': 'int8', 'alcflag': 'int8', 'alcmon': 'int8', 'alcyr': 'int8',
+    'alcever': 'int8', 'alcydays': 'int8', 'alcmfu': 'int8', 'alcbng30d': 'int8',
+    'alclimit': 'int8', 'alcpdang': 'int8', 'drvinalco': 'int8', 'txyralc': 'int8',
+    'txalconly': 'int8'
+}
+
+# Display labels of the coded variables.
+LABEL_MAPS = {
+    'age2': AGE_MAP,
+    'eduhighcat': EDU_MAP,
+    'irwrkstat': WORK_MAP,
+    'irmaritstat': MARITAL_MAP,
+    'income': INCOME_MAP,
+    'poverty3': POVERTY_MAP,
+    'imother': YES_NO_MAP,
+    'ifather': YES_NO_MAP,
+    'mjever': YES_NO_MAP,
+    'alcever': YES_NO_MAP,
+    'alcbng30d': YES_NO_MAP,
+    'alclimit': YES_NO_MAP,
+    'drvinalco': YES_NO_MAP,
+    'txyralc': YES_NO_MAP,
+    'txalconly': YES_NO_MAP,
+    'alcpdang': ALCPDANG_MAP
+}
+
+
+def _fits(values, dtype):
+    info = np.iinfo(dtype)
+    return bool((values == np.round(values)).all() and values.min() >= info.min and values.max() <= info.max)
+
+
+def compact_frame(df):
+    """
+    Converts the columns listed in COLUMN_SCHEMA to their compact integer types.
+
+    Codes, including NSDUH sentinel codes, are kept as-is so comparisons and rates
+    computed on the frame do not change. Columns with missing values get the nullable
+    counterpart (e.g. Int8), and columns whose values do not fit the declared type are
+    left untouched.
+
+    Args:
+        df (pd.DataFrame): The dataset as parsed from CSV.
+
+    Returns:
+        pd.DataFrame: A new DataFrame with compact column types.
+    """
+    columns = {}
+    for col in df.columns:
+        series = df[col]
+        dtype = COLUMN_SCHEMA.get(col)
+        present = series.dropna()
+        if dtype is None or not pd.api.types.is_numeric_dtype(series) or (len(present) and not _fits(present.to_numpy(), dtype)):
+            columns[col] = series
+        elif len(present) < len(series):
+            columns[col] = series.astype(dtype.capitalize())
+        else:
+            columns[col] = series.astype(dtype)
+    return pd.DataFrame(columns, index=df.index)
+
+
+def to_categorical(codes, mapping):
+    """
+    Decodes a column of integer codes into a Categorical of display labels.
+
+    The categories are the mapping's labels in code order, followed by any codes the
+    mapping does not cover (as strings). Missing values stay missing.
+
+    Args:
+        codes (pd.Series or array-like): The coded values.
+        mapping (dict): Code-to-label map such as AGE_MAP.
+
+    Returns:
+        pd.Categorical: The decoded labels.
+    """
+    values = pd.Series(codes)
+    extra = sorted(set(values.dropna().unique()) - set(mapping))
+    keys = list(mapping) + extra
+    labels = list(mapping.values()) + [str(code) for code in extra]
+    positions = pd.Index(keys).get_indexer(values)
+    return pd.Categorical.from_codes(positions, categories=labels)
+
+
+def build_display_labels(df):
+    """
+    Decodes every coded column of LABEL_MAPS present in df into a `<column>_label`
+    Categorical. The codes are looked up once per category rather than once per row,
+    and the base frame is neither copied nor modified.
+
+    Args:
+        df (pd.DataFrame): The dataset.
+
+    Returns:
+        pd.DataFrame: The label columns, aligned with df's index.
+    """
+    return pd.DataFrame({
+        f"{col}_label": to_categorical(df[col], mapping)
+        for col, mapping in LABEL_MAPS.items() if col in df.columns
+    }, index=df.index)
+
+
 def apply_display_mappings(df):
-    df_display = df.copy()
-    if 'age2' in df_display.columns:
-        df_display['age2_label'] = df_display['age2'].map(AGE_MAP).fillna(df_display['age2']).astype(str)
-    if 'eduhighcat' in df_display.columns:
-        df_display['eduhighcat_label'] = df_display['eduhighcat'].map(EDU_MAP).fillna(df_display['eduhighcat']).astype(str)
-    if 'irwrkstat' in df_display.columns:
-        df_display['irwrkstat_label'] = df_display['irwrkstat'].map(WORK_MAP).fillna(df_display['irwrkstat']).astype(str)
-    if 'irmaritstat' in df_display.columns:
-        df_display['irmaritstat_label'] = df_display['irmaritstat'].map(MARITAL_MAP).fillna(df_display['irmaritstat']).astype(str)
-    if 'income' in df_display.columns:
-        df_display['income_label'] = df_display['income'].map(INCOME_MAP).fillna(df_display['income']).astype(str)
-    if 'poverty3' in df_display.columns:
-        df_display['poverty3_label'] = df_display['poverty3'].map(POVERTY_MAP).fillna(df_display['poverty3']).astype(str)
-    if 'imother' in df_display.columns:
-        df_display['imother_label'] = df_display['imother'].map(YES_NO_MAP).fillna(df_display['imother']).astype(str)
-    if 'ifather' in df_display.columns:
-        df_display['ifather_label'] = df_display['ifather'].map(YES_NO_MAP).fillna(df_display['ifather']).astype(str)
-    if 'mjever' in df_display.columns:
-        df_display['mjever_label'] = df_display['mjever'].map(YES_NO_MAP).fillna(df_display['mjever']).astype(str)
-    if 'alcever' in df_display.columns:
-        df_display['alcever_label'] = df_display['alcever'].map(YES_NO_MAP).fillna(df_display['alcever']).astype(str)
-    if 'alcbng30d' in df_display.columns:
-        df_display['alcbng30d_label'] = df_display['alcbng30d'].map(YES_NO_MAP).fillna(df_display['alcbng30d']).astype(str)
-    if 'alclimit' in df_display.columns:
-        df_display['alclimit_label'] = df_display['alclimit'].map(YES_NO_MAP).fillna(df_display['alclimit']).astype(str)
-    if 'drvinalco' in df_display.columns:
-        df_display['drvinalco_label'] = df_display['drvinalco'].map(YES_NO_MAP).fillna(df_display['drvinalco']).astype(str)
-    if 'txyralc' in df_display.columns:
-        df_display['txyralc_label'] = df_display['txyralc'].map(YES_NO_MAP).fillna(df_display['txyralc']).astype(str)
-    if 'txalconly' in df_display.columns:
-        df_display['txalconly_label'] = df_display['txalconly'].map(YES_NO_MAP).fillna(df_display['txalconly']).astype(str)
-    if 'alcpdang' in df_display.columns:
-        df_display['alcpdang_label'] = df_display['alcpdang'].map(ALCPDANG_MAP).fillna(df_display['alcpdang']).astype(str)
-
-    return df_display
-
-# Load dataset
-@st.cache_data
+    """
+    Returns df together with its `<column>_label` display columns (see build_display_labels).
+    """
+    return pd.concat([df, build_display_labels(df)], axis=1)
+
+def get_cache_path(csv_path):
+    """
+    Returns the path of the Arrow IPC cache stored next to the given CSV file.
+    """
+    return os.path.splitext(csv_path)[0] + ".arrow"
+
+
+def _file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_fingerprint(path):
+    """
+    Fingerprints a source file by size, modification time and content hash.
+
+    Args:
+        path (str): Path of the file to fingerprint.
+
+    Returns:
+        dict: The fingerprint, including the cache layout version.
+    """
+    stat = os.stat(path)
+    return {
+        "version": CACHE_VERSION,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": _file_sha256(path),
+    }
+
+
+def _cached_fingerprint(cache_path):
+    try:
+        with pa.memory_map(cache_path) as source:
+            metadata = ipc.open_file(source).schema.metadata or {}
+        return json.loads(metadata.get(b"fingerprint", b"{}"))
+    except (OSError, ValueError, pa.ArrowInvalid):
+        return {}
+
+
+def _cache_is_valid(csv_path, cache_path):
+    cached = _cached_fingerprint(cache_path)
+    if cached.get("version") != CACHE_VERSION:
+        return False
+    stat = os.stat(csv_path)
+    if cached.get("size") != stat.st_size:
+        return False
+    if cached.get("mtime_ns") == stat.st_mtime_ns:
+        return True
+    # Same size but touched (e.g. re-copied): only the content hash can tell.
+    return cached.get("sha256") == _file_sha256(csv_path)
+
+
+def _write_cache(df, csv_path, cache_path):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[b"fingerprint"] = json.dumps(file_fingerprint(csv_path)).encode()
+    table = table.replace_schema_metadata(metadata)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        # A read-only data directory just means no cache; the CSV is still usable.
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def read_dataset(path=None, use_cache=True):
+    """
+    Reads the cleaned dataset, going through the columnar binary cache when possible.
+
+    The first read parses the CSV and writes an Arrow IPC file next to it, stamped with
+    the CSV's fingerprint. Later reads load the typed columns straight from that file
+    and only fall back to re-parsing the CSV when the fingerprint no longer matches.
+    Either way the columns come back in the compact types of COLUMN_SCHEMA. A Parquet
+    file (as written by prepare_dataset.py) is already columnar and is read directly.
+
+    Args:
+        path (str, optional): Path of the CSV or Parquet file. Defaults to DATA_PATH.
+        use_cache (bool): Whether to read and maintain the binary cache.
+
+    Returns:
+        pd.DataFrame: The dataset.
+    """
+    path = path or DATA_PATH
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    if path.endswith('.parquet'):
+        return compact_frame(pd.read_parquet(path))
+    if not use_cache or pa is None:
+        return compact_frame(pd.read_csv(path))
+
+    cache_path = get_cache_path(path)
+    if os.path.exists(cache_path) and _cache_is_valid(path, cache_path):
+        with pa.memory_map(cache_path) as source:
+            return ipc.open_file(source).read_all().to_pandas()
+
+    df = compact_frame(pd.read_csv(path))
+    _write_cache(df, path, cache_path)
+    return df
+
+
+def read_only(value):
+    """
+    Marks the arrays of a dataset object read-only so it can be shared by every session
+    of the server without being copied: writing to it in place then raises instead of
+    changing what all sessions see.
+
+    Args:
+        value: A DataFrame, a numpy array, or dicts, lists and tuples of them (such as
+            the filter index, the rate cube or the correlation statistics).
+
+    Returns:
+        The same value; dicts, lists and arrays are frozen in place, and a DataFrame
+        is returned re-wrapped around frozen views of its columns (Categorical
+        columns get one frozen copy of their codes).
+    """
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            value[key] = read_only(item)
+    elif isinstance(value, list):
+        value[:] = [read_only(item) for item in value]
+    elif isinstance(value, tuple):
+        for item in value:
+            read_only(item)
+    elif isinstance(value, pd.DataFrame):
+        columns = {}
+        for col in value.columns:
+            series = value[col]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                columns[col] = pd.Categorical.from_codes(read_only(series.cat.codes.to_numpy().copy()),
+                                                         dtype=series.dtype, validate=False)
+            elif isinstance(series.dtype, np.dtype):
+                columns[col] = read_only(series.to_numpy())
+            else:
+                columns[col] = series.array
+        return pd.DataFrame(columns, index=value.index, copy=False)
+    return value
+
+
+# Load dataset. The cached objects below are built once per process and the same
+# read-only object is handed to every session (st.cache_resource), where st.cache_data
+# would unpickle a private copy on every call of every rerun.
+@st.cache_resource
+def load_mapped_dataset():
+    """
+    Maps the dataset directory at MAPPED_DATASET_PATH (see mapped_dataset.open_mapped_dataset).
+    """
+    from mapped_dataset import open_mapped_dataset
+
+    with span("map_dataset"):
+        return open_mapped_dataset(MAPPED_DATASET_PATH)
+
+
+@st.cache_resource
 def load_data():
     """
-    Loads the main dataset from a CSV file.
-    Displays an error and stops the app if the file is not found.
+    Loads the main dataset from DATA_PATH (see read_dataset), or maps it from
+    MAPPED_DATASET_PATH, shared read-only by all sessions. Displays an error and stops
+    the app if the file is not found.
     """
     try:
-        df = pd.read_csv(r"C:\Users\zanny\Desktop\School\NCAIR Cohort\Data Science Beginners\Project\National Survey of Drug Use and Health\Dataset and Splits\Cleaned Womens Dataset.csv")
-        return df
+        if MAPPED_DATASET_PATH:
+            return load_mapped_dataset()['data']
+        with span("read_dataset"):
+            return read_only(read_dataset())
     except FileNotFoundError:
-        st.error("Dataset 'Cleaned Womens Dataset.csv' not found. Please ensure it's in the correct directory.")
+        st.error("Dataset 'Cleaned Womens Dataset.csv' not found. Set NSDUH_DATA_PATH or place it next to data_loader.py.")
         st.stop()
 
+
+@st.cache_resource
+def dataset_fingerprint():
+    """
+    Fingerprints the dataset file at DATA_PATH once per process (see file_fingerprint).
+    A mapped dataset carries the fingerprint of the file it was built from.
+    """
+    if MAPPED_DATASET_PATH:
+        return load_mapped_dataset()['source']
+    return file_fingerprint(DATA_PATH)
+
+
+@st.cache_resource
+def load_display_data():
+    """
+    Loads the dataset with its display label columns decoded once, so pages only
+    need to slice it by their filter mask. Shared read-only by all sessions.
+    """
+    if MAPPED_DATASET_PATH:
+        return load_mapped_dataset()['display']
+    df = load_data()
+    with span("mapping"):
+        return read_only(apply_display_mappings(df))
+
+
+@st.cache_resource
+def load_filter_index():
+    """
+    Builds the sidebar filter bitmaps (see filter_index.build_filter_index) once per dataset.
+    """
+    if MAPPED_DATASET_PATH:
+        return load_mapped_dataset()['filter_index']
+    df = load_data()
+    with span("build_filter_index"):
+        return read_only(build_filter_index(df))
+
+
+@st.cache_resource
+def load_data_cube():
+    """
+    Builds the pre-aggregated rate cube (see data_cube.build_cube) once per dataset.
+    """
+    df = load_data()
+    with span("build_cube"):
+        return read_only(build_cube(df))
+
+
+@st.cache_resource
+def load_corr_stats(exclude_sentinels=False):
+    """
+    Builds the per-cell correlation statistics (see data_cube.build_corr_stats) once
+    per dataset and sentinel handling.
+    """
+    df = load_data()
+    with span("build_corr_stats"):
+        return read_only(build_corr_stats(df, exclude_sentinels))
@@ -1,8 +1,1037 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from data_loader import load_data, apply_display_mappings, AGE_MAP, EDU_MAP, WORK_MAP, MARITAL_MAP, INCOME_MAP, POVERTY_MAP, YES_NO_MAP, ALCPDANG_MAP
+from filter_index import filter_mask, normalize_selections
+from figure_cache import get_figure_cache
+from instrumentation import span, traced
+from data_cube import CONFIDENCE_LEVEL, group_rates, query_cube, rate_intervals, code_labels, code_counts, label_counts, corr_matrix
+from data_loader import load_display_data, load_filter_index, load_data_cube, load_corr_stats, dataset_fingerprint, AGE_MAP, EDU_MAP, WORK_MAP, MARITAL_MAP, INCOME_MAP, POVERTY_MAP, YES_NO_MAP, ALCPDANG_MAP
+
+
+# Category orders used by the charts
+AGE_ORDER = [AGE_MAP[k] for k in sorted(AGE_MAP.keys())]
+EDU_ORDER = [EDU_MAP[k] for k in sorted(EDU_MAP.keys())]
+MARITAL_ORDER = [MARITAL_MAP[k] for k in sorted(MARITAL_MAP.keys())]
+WORK_ORDER = [WORK_MAP[k] for k in sorted(WORK_MAP.keys())]
+INCOME_ORDER = [INCOME_MAP[k] for k in sorted(INCOME_MAP.keys())]
+POVERTY_ORDER = [POVERTY_MAP[k] for k in sorted(POVERTY_MAP.keys())]
+ALCPDANG_ORDER = [ALCPDANG_MAP[k] for k in sorted(ALCPDANG_MAP.keys())]
+PARENT_ORDER = [
+    "Mother: Yes, Father: Yes",
+    "Mother: Yes, Father: No",
+    "Mother: No, Father: Yes",
+    "Mother: No, Father: No"
+]
+GOVT_ORDER_CODES = [1, 2] # 1: Yes, 2: No
+# Note shown on the tabs whose rate charts carry error bars
+INTERVAL_NOTE = f"Error bars on the use-rate charts show {CONFIDENCE_LEVEL:.0%} bootstrap confidence intervals."
+
+
+# The functions below hold the data work behind each tab. They take the filtered
+# display frame and/or the rate cube with the current selection, and return the
+# tables the charts are drawn from, so they can also be run without Streamlit.
+
+@traced("overview.tables")
+def overview_tables(filtered_df_display):
+    """
+    Key metrics and demographic distributions for the Overview tab.
+    """
+    tables = {
+        "total_respondents": len(filtered_df_display),
+        "marijuana_users": len(filtered_df_display[filtered_df_display["mjever"] == 1]),
+        "alcohol_users": len(filtered_df_display[filtered_df_display["alcever"] == 1])
+    }
+    # Average age group might still be numerical, so map it to the closest age group label
+    avg_age_code = filtered_df_display["age2"].mean()
+    tables["closest_age_label"] = "N/A"
+    if not pd.isna(avg_age_code):
+        closest_age_code = min(AGE_MAP.keys(), key=lambda k: abs(k - avg_age_code))
+        tables["closest_age_label"] = AGE_MAP.get(closest_age_code, str(round(avg_age_code, 1)))
+    tables["age_dist"] = label_counts(filtered_df_display["age2"], AGE_MAP, AGE_ORDER)
+    tables["edu_dist"] = label_counts(filtered_df_display["eduhighcat"], EDU_MAP, EDU_ORDER)
+    return tables
+
+
+@traced("correlation.tables")
+def correlation_table(corr_stats, selections):
+    """
+    Correlation matrix of the substance use columns, assembled from the per-cell
+    statistics (see data_cube.build_corr_stats), or None if fewer than two are available.
+    """
+    if len(corr_stats["columns"]) > 1:
+        return corr_matrix(corr_stats, selections)
+    return None
+
+
+def _positive_counts(cube, name, selections):
+    # Rows per code of a histogram cube, for the codes above 0
+    counts = code_counts(cube, name, selections)
+    return counts[counts.index.get_level_values(-1) > 0]
+
+
+@traced("marijuana.tables")
+def marijuana_tables(filtered_df_display, cube, selections):
+    """
+    Use rates and first-use/frequency distributions for the Marijuana Analysis tab.
+    """
+    mj_age_data = group_rates(cube, "age2", selections, "mjever")
+    mj_age_data.insert(0, "age2_label", code_labels(mj_age_data.index, AGE_MAP))
+    mj_edu_data = group_rates(cube, "eduhighcat", selections, "mjever")
+    mj_edu_data.insert(0, "eduhighcat_label", code_labels(mj_edu_data.index, EDU_MAP))
+    return {
+        "mj_age_data": mj_age_data,
+        "mj_first_use": _positive_counts(cube, "mjage", selections),
+        "mj_30_days": _positive_counts(cube, "mjday30a", selections),
+        "mj_edu_data": mj_edu_data
+    }
+
+
+@traced("alcohol.tables")
+def alcohol_tables(filtered_df_display, cube, selections):
+    """
+    Use days, binge rates and risk distributions for the Alcohol Analysis tab.
+    """
+    binge_data = group_rates(cube, "age2", selections, "alcbng30d")
+    binge_data.insert(0, "age2_label", code_labels(binge_data.index, AGE_MAP))
+    tables = {
+        "alc_days": _positive_counts(cube, "alcydays", selections),
+        "binge_data": binge_data,
+        "dui_data": label_counts(filtered_df_display["drvinalco"], YES_NO_MAP, ["No", "Yes"]),
+        "danger_data": None
+    }
+    if "alcpdang_label" in filtered_df_display.columns:
+        tables["danger_data"] = label_counts(filtered_df_display["alcpdang"], ALCPDANG_MAP, ALCPDANG_ORDER)
+    return tables
+
+
+def _rate_pair(totals):
+    # Marijuana and alcohol use rates (%) from cube totals
+    mj = (totals["mjever_sum"] / totals["mjever_count"]) * 100
+    alc = (totals["alcever_sum"] / totals["alcever_count"]) * 100
+    return mj, alc
+
+
+def _interval_pair(totals):
+    # Confidence intervals of the marijuana and alcohol use rates from cube totals
+    return rate_intervals(totals, "mjever"), rate_intervals(totals, "alcever")
+
+
+@traced("social.tables")
+def social_tables(cube, selections):
+    """
+    Use rates by parental presence, friends' use, household size and marital status
+    for the Social Factors tab.
+    """
+    parent_agg = group_rates(cube, "parents", selections, "mjever")
+    parent_agg.index = [
+        f"Mother: {YES_NO_MAP.get(mother, str(mother))}, Father: {YES_NO_MAP.get(father, str(father))}"
+        for mother, father in parent_agg.index
+    ]
+    parent_agg.index.name = "parent_status_label"
+    # Reindex to ensure all categories are present, even if empty
+    parent_agg_reindexed = parent_agg.reindex(PARENT_ORDER, fill_value=0).reset_index()
+    parent_agg_reindexed['percentage'] = parent_agg_reindexed['percentage'].fillna(0) # Fill NaN percentages with 0
+
+    household_totals = query_cube(cube, "irhhsiz2", selections)
+    household_data = pd.DataFrame({
+        "mjever": household_totals["mjever_sum"] / household_totals["mjever_count"],
+        "alcever": household_totals["alcever_sum"] / household_totals["alcever_count"]
+    }).reset_index()
+    household_data["mjever"] *= 100
+    household_data["alcever"] *= 100
+    household_mj_ci, household_alc_ci = _interval_pair(household_totals)
+    household_data[["mjever_ci_lower", "mjever_ci_upper"]] = household_mj_ci.to_numpy()
+    household_data[["alcever_ci_lower", "alcever_ci_upper"]] = household_alc_ci.to_numpy()
+
+    marital_data = query_cube(cube, "irmaritstat", selections)
+    marital_data.index = code_labels(marital_data.index, MARITAL_MAP)
+    marital_mj, marital_alc = _rate_pair(marital_data)
+    marital_mj_ci, marital_alc_ci = _interval_pair(marital_data)
+
+    return {
+        "parent_agg_reindexed": parent_agg_reindexed,
+        "friend_data": group_rates(cube, "frdmjmon", selections, "mjever").reset_index(),
+        "household_data": household_data,
+        # Reindex to ensure all categories are present, even if empty
+        "marital_mj_reindexed": marital_mj.reindex(MARITAL_ORDER, fill_value=0).fillna(0),
+        "marital_alc_reindexed": marital_alc.reindex(MARITAL_ORDER, fill_value=0).fillna(0),
+        "marital_mj_ci": marital_mj_ci.reindex(MARITAL_ORDER, fill_value=0).fillna(0),
+        "marital_alc_ci": marital_alc_ci.reindex(MARITAL_ORDER, fill_value=0).fillna(0)
+    }
+
+
+@traced("socioeconomic.tables")
+def socioeconomic_tables(cube, selections):
+    """
+    Use rates by income, poverty level, employment status and government assistance
+    for the Socioeconomic Impact tab.
+    """
+    income_data = query_cube(cube, "income", selections)
+    income_data.index = pd.Index(code_labels(income_data.index, INCOME_MAP), name="income_label")
+    income_data["mjever_percentage"], income_data["alcever_percentage"] = _rate_pair(income_data)
+    income_mj_ci, income_alc_ci = _interval_pair(income_data)
+    income_data[["mjever_ci_lower", "mjever_ci_upper"]] = income_mj_ci.to_numpy()
+    income_data[["alcever_ci_lower", "alcever_ci_upper"]] = income_alc_ci.to_numpy()
+    # Reindex to ensure all categories are present, even if empty
+    income_data_reindexed = income_data.reindex(INCOME_ORDER, fill_value=0).reset_index()
+    income_data_reindexed["mjever_percentage"] = income_data_reindexed["mjever_percentage"].fillna(0)
+    income_data_reindexed["alcever_percentage"] = income_data_reindexed["alcever_percentage"].fillna(0)
+    ci_columns = ["mjever_ci_lower", "mjever_ci_upper", "alcever_ci_lower", "alcever_ci_upper"]
+    income_data_reindexed[ci_columns] = income_data_reindexed[ci_columns].fillna(0)
+
+    poverty_totals = query_cube(cube, "poverty3", selections)
+    poverty_data = pd.DataFrame({
+        "mjever": poverty_totals["mjever_sum"] / poverty_totals["mjever_count"],
+        "alcever": poverty_totals["alcever_sum"] / poverty_totals["alcever_count"]
+    })
+    poverty_data.index = pd.Index(code_labels(poverty_data.index, POVERTY_MAP), name="poverty3_label")
+    poverty_data = poverty_data.reset_index()
+    poverty_data["mjever"] *= 100
+    poverty_data["alcever"] *= 100
+    poverty_data[["mjever_ci_lower", "mjever_ci_upper"]] = rate_intervals(poverty_totals, "mjever").to_numpy()
+    poverty_data_reindexed = poverty_data.set_index('poverty3_label').reindex(POVERTY_ORDER, fill_value=0).reset_index()
+    poverty_data_reindexed["mjever"] = poverty_data_reindexed["mjever"].fillna(0)
+    poverty_data_reindexed["alcever"] = poverty_data_reindexed["alcever"].fillna(0)
+    poverty_data_reindexed[["mjever_ci_lower", "mjever_ci_upper"]] = poverty_data_reindexed[["mjever_ci_lower", "mjever_ci_upper"]].fillna(0)
+
+    work_data = query_cube(cube, "irwrkstat", selections)
+    work_data.index = code_labels(work_data.index, WORK_MAP)
+    work_mj, work_alc = _rate_pair(work_data)
+    work_mj_ci, work_alc_ci = _interval_pair(work_data)
+
+    # Reindex to ensure all categories (1 and 2) are present, even if empty
+    govt_totals = query_cube(cube, "govtprog", selections)
+    govt_mj, govt_alc = _rate_pair(govt_totals)
+    govt_mj_ci, govt_alc_ci = _interval_pair(govt_totals)
+    govt_mj_reindexed = govt_mj.reindex(GOVT_ORDER_CODES, fill_value=0).fillna(0)
+    govt_alc_reindexed = govt_alc.reindex(GOVT_ORDER_CODES, fill_value=0).fillna(0)
+
+    return {
+        "income_data_reindexed": income_data_reindexed,
+        "poverty_data_reindexed": poverty_data_reindexed,
+        "work_mj_reindexed": work_mj.reindex(WORK_ORDER, fill_value=0).fillna(0),
+        "work_alc_reindexed": work_alc.reindex(WORK_ORDER, fill_value=0).fillna(0),
+        "work_mj_ci": work_mj_ci.reindex(WORK_ORDER, fill_value=0).fillna(0),
+        "work_alc_ci": work_alc_ci.reindex(WORK_ORDER, fill_value=0).fillna(0),
+        "govt_mj_reindexed": govt_mj_reindexed,
+        "govt_alc_reindexed": govt_alc_reindexed,
+        "govt_mj_ci": govt_mj_ci.reindex(GOVT_ORDER_CODES, fill_value=0).fillna(0),
+        "govt_alc_ci": govt_alc_ci.reindex(GOVT_ORDER_CODES, fill_value=0).fillna(0),
+        # Map the indices to display labels for plotting
+        "govt_labels": [YES_NO_MAP.get(idx, str(idx)) for idx in govt_mj_reindexed.index]
+    }
+
+
+@traced("treatment.tables")
+def treatment_tables(filtered_df_display, cube, selections):
+    """
+    Treatment seeking, risk behavior counts and first-use ages for the Treatment & Risk tab.
+    """
+    tables = {"treatment_data": None, "age_comparison": None, "tx_type_data": None}
+    if "txyralc_label" in filtered_df_display.columns:
+        tables["treatment_data"] = label_counts(filtered_df_display["txyralc"], YES_NO_MAP, ["No", "Yes"])
+
+    # Sum 'Yes' (1) occurrences for each risk behavior
+    risk_behaviors = []
+    risk_labels = []
+    if "drvinalco" in filtered_df_display.columns:
+        risk_behaviors.append(filtered_df_display[filtered_df_display["drvinalco"] == 1].shape[0])
+        risk_labels.append("Drove Under Influence")
+    if "alcpdang" in filtered_df_display.columns:
+        # Counts respondents with code 1 ("Very dangerous" in ALCPDANG_MAP)
+        risk_behaviors.append(filtered_df_display[filtered_df_display["alcpdang"] == 1].shape[0])
+        risk_labels.append("Alcohol Caused Danger")
+    if "alclimit" in filtered_df_display.columns:
+        risk_behaviors.append(filtered_df_display[filtered_df_display["alclimit"] == 1].shape[0])
+        risk_labels.append("Tried to Limit Alcohol")
+    tables["risk_behaviors"] = risk_behaviors
+    tables["risk_labels"] = risk_labels
+
+    if "mjage" in filtered_df_display.columns:
+        # Respondents per (age group, age at first use) pair
+        age_comparison = _positive_counts(cube, "age2_mjage", selections).reset_index()
+        age_comparison.insert(0, "age2_label", code_labels(age_comparison["age2"], AGE_MAP))
+        tables["age_comparison"] = age_comparison
+    if "txalconly_label" in filtered_df_display.columns:
+        tables["tx_type_data"] = label_counts(filtered_df_display["txalconly"], YES_NO_MAP, ["No", "Yes"])
+    return tables
+
+
+# The functions below build each tab's figures from its tables. Charts with nothing to
+# draw for the selection are None.
+
+@traced("overview.figures")
+def overview_figures(filtered_df_display, corr_stats, selections):
+    """
+    Key metrics and the figures of the Overview tab.
+    """
+    tables = overview_tables(filtered_df_display)
+    metrics = {key: tables[key] for key in ("total_respondents", "marijuana_users", "alcohol_users", "closest_age_label")}
+
+    # Age distribution - Use age2_label for x-axis
+    age_dist = tables["age_dist"]
+    fig_age = px.bar(
+        x=age_dist.index,
+        y=age_dist.values,
+        title="Age Group Distribution",
+        labels={"x": "Age Group", "y": "Count"},
+        color=age_dist.values,
+        color_continuous_scale="viridis",
+        category_orders={"x": AGE_ORDER} # Ensure correct order
+    )
+    fig_age.update_layout(showlegend=False)
+
+    # Education distribution - Use eduhighcat_label for names
+    edu_dist = tables["edu_dist"]
+    fig_edu = px.pie(
+        values=edu_dist.values,
+        names=edu_dist.index,
+        title="Education Level Distribution",
+        color_discrete_sequence=px.colors.qualitative.Set3,
+        category_orders={"names": EDU_ORDER} # Ensure correct order
+    )
+
+    fig_corr = None
+    corr_table = correlation_table(corr_stats, selections)
+    if corr_table is not None:
+        fig_corr = px.imshow(
+            corr_table,
+            color_continuous_scale="RdBu",
+            title="Substance Use Correlation Matrix",
+            aspect="auto"
+        )
+    return {"metrics": metrics, "age": fig_age, "education": fig_edu, "correlation": fig_corr}
+
+
+def _error_bars(rates, intervals):
+    # Plotly error bars spanning each rate's confidence interval (ci_lower, ci_upper)
+    rates = np.asarray(rates, dtype=float)
+    return dict(
+        type="data",
+        array=np.nan_to_num(intervals["ci_upper"].to_numpy(dtype=float) - rates),
+        arrayminus=np.nan_to_num(rates - intervals["ci_lower"].to_numpy(dtype=float))
+    )
+
+
+def _interval_columns(table, outcome):
+    # The `<outcome>_ci_lower` / `<outcome>_ci_upper` columns of a table as an interval frame
+    return pd.DataFrame({
+        "ci_lower": table[f"{outcome}_ci_lower"],
+        "ci_upper": table[f"{outcome}_ci_upper"]
+    })
+
+
+def _with_error_columns(table, rate="percentage", prefix=""):
+    # Adds the distances from a rate to its interval bounds as px error_y columns
+    return table.assign(
+        error_plus=(table[f"{prefix}ci_upper"] - table[rate]).fillna(0),
+        error_minus=(table[rate] - table[f"{prefix}ci_lower"]).fillna(0)
+    )
+
+
+def _code_histogram(counts, nbins, title, x_label, color):
+    # Histogram of a coded column from its row counts per code. Plotly bins the distinct
+    # codes weighted by their counts, which gives the bins of the raw values while only
+    # the counts are sent to the browser.
+    variable = counts.index.name
+    fig = px.histogram(
+        pd.DataFrame({"value": counts.index, "count": counts.values, "variable": variable}),
+        x="value",
+        y="count",
+        color="variable",
+        histfunc="sum",
+        nbins=nbins,
+        title=title,
+        labels={"value": x_label},
+        color_discrete_sequence=[color]
+    )
+    fig.update_traces(hovertemplate=f"variable={variable}<br>{x_label}=%{{x}}<br>count=%{{y}}<extra></extra>")
+    fig.update_layout(yaxis_title="count")
+    return fig
+
+
+@traced("marijuana.figures")
+def marijuana_figures(filtered_df_display, cube, selections):
+    """
+    Figures of the Marijuana Analysis tab.
+    """
+    tables = marijuana_tables(filtered_df_display, cube, selections)
+    figures = {"first_use": None, "frequency": None}
+
+    figures["age"] = px.bar(
+        _with_error_columns(tables["mj_age_data"]),
+        x="age2_label",
+        y="percentage",
+        error_y="error_plus",
+        error_y_minus="error_minus",
+        title="Marijuana Use Rate by Age Group",
+        labels={"age2_label": "Age Group", "percentage": "Usage Rate (%)"},
+        color="percentage",
+        color_continuous_scale="greens",
+        category_orders={"age2_label": AGE_ORDER} # Ensure correct order
+    )
+
+    # Age at first use (mjage is numerical, no mapping needed here)
+    mj_first_use = tables["mj_first_use"]
+    if len(mj_first_use) > 0:
+        figures["first_use"] = _code_histogram(mj_first_use, 20, "Age at First Marijuana Use", "Age at First Use", "#2E8B57")
+
+    # Days used in past 30 days (mjday30a is numerical)
+    mj_30_days = tables["mj_30_days"]
+    if len(mj_30_days) > 0:
+        figures["frequency"] = _code_histogram(mj_30_days, 15, "Marijuana Use Frequency (Past 30 Days)", "Days Used", "#228B22")
+
+    figures["education"] = px.bar(
+        _with_error_columns(tables["mj_edu_data"]),
+        x="eduhighcat_label",
+        y="percentage",
+        error_y="error_plus",
+        error_y_minus="error_minus",
+        title="Marijuana Use Rate by Education Level",
+        labels={"eduhighcat_label": "Education Level", "percentage": "Usage Rate (%)"},
+        color="percentage",
+        color_continuous_scale="greens",
+        category_orders={"eduhighcat_label": EDU_ORDER} # Ensure correct order
+    )
+    return figures
+
+
+@traced("alcohol.figures")
+def alcohol_figures(filtered_df_display, cube, selections):
+    """
+    Figures of the Alcohol Analysis tab.
+    """
+    tables = alcohol_tables(filtered_df_display, cube, selections)
+    figures = {"days": None, "danger": None}
+
+    # Alcohol use days in past year (alcydays is numerical)
+    alc_days = tables["alc_days"]
+    if len(alc_days) > 0:
+        figures["days"] = _code_histogram(alc_days, 30, "Alcohol Use Days in Past Year", "Days Used", "#8B0000")
+
+    figures["binge"] = px.bar(
+        _with_error_columns(tables["binge_data"]),
+        x="age2_label",
+        y="percentage",
+        error_y="error_plus",
+        error_y_minus="error_minus",
+        title="Binge Drinking Rate by Age Group",
+        labels={"age2_label": "Age Group", "percentage": "Binge Drinking Rate (%)"},
+        color="percentage",
+        color_continuous_scale="reds",
+        category_orders={"age2_label": AGE_ORDER} # Ensure correct order
+    )
+
+    dui_data = tables["dui_data"]
+    figures["dui"] = px.pie(
+        values=dui_data.values,
+        names=dui_data.index, # Use index which now contains "No", "Yes"
+        title="Drove Under Influence of Alcohol",
+        color_discrete_sequence=["#90EE90", "#FF6B6B"]
+    )
+
+    danger_data = tables["danger_data"]
+    if danger_data is not None and not danger_data.empty and danger_data.sum() > 0:
+        figures["danger"] = px.pie(
+            values=danger_data.values,
+            names=danger_data.index, # Use index which now contains labels
+            title="Alcohol Caused Dangerous Situations",
+            color_discrete_sequence=["#98FB98", "#FF4500"],
+            category_orders={"names": ALCPDANG_ORDER}
+        )
+    return figures
+
+
+def _grouped_bars(mj, alc, title, xaxis_title, x=None, categoryarray=None, mj_ci=None, alc_ci=None):
+    # Side-by-side marijuana and alcohol use rates per group, with their confidence intervals
+    fig = go.Figure()
+    fig.add_trace(go.Bar(
+        x=mj.index if x is None else x,
+        y=mj.values,
+        name="Marijuana Use",
+        marker_color="lightgreen",
+        error_y=None if mj_ci is None else _error_bars(mj, mj_ci)
+    ))
+    fig.add_trace(go.Bar(
+        x=alc.index if x is None else x,
+        y=alc.values,
+        name="Alcohol Use",
+        marker_color="lightcoral",
+        error_y=None if alc_ci is None else _error_bars(alc, alc_ci)
+    ))
+    fig.update_layout(
+        title=title,
+        xaxis_title=xaxis_title,
+        yaxis_title="Usage Rate (%)",
+        barmode="group",
+        xaxis=dict(categoryorder='array', categoryarray=categoryarray) # Ensure order
+    )
+    return fig
+
+
+def _rate_lines(x, mj, alc, title, xaxis_title, categoryarray=None, mj_ci=None, alc_ci=None):
+    # Marijuana and alcohol use rates per group as two lines, with their confidence intervals
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=x,
+        y=mj,
+        mode="lines+markers",
+        name="Marijuana Use",
+        line=dict(color="green"),
+        error_y=None if mj_ci is None else _error_bars(mj, mj_ci)
+    ))
+    fig.add_trace(go.Scatter(
+        x=x,
+        y=alc,
+        mode="lines+markers",
+        name="Alcohol Use",
+        line=dict(color="red"),
+        error_y=None if alc_ci is None else _error_bars(alc, alc_ci)
+    ))
+    layout = dict(title=title, xaxis_title=xaxis_title, yaxis_title="Usage Rate (%)")
+    if categoryarray is not None:
+        layout["xaxis"] = dict(categoryorder='array', categoryarray=categoryarray) # Ensure order
+    fig.update_layout(**layout)
+    return fig
+
+
+@traced("social.figures")
+def social_figures(cube, selections):
+    """
+    Figures of the Social Factors tab.
+    """
+    tables = social_tables(cube, selections)
+    figures = {"friends": None, "household": None, "marital": None}
+
+    figures["parents"] = px.bar(
+        _with_error_columns(tables["parent_agg_reindexed"]),
+        x="parent_status_label",
+        y="percentage",
+        error_y="error_plus",
+        error_y_minus="error_minus",
+        title="Marijuana Use by Parental Presence",
+        labels={"parent_status_label": "Parental Presence", "percentage": "Usage Rate (%)"},
+        color="percentage",
+        color_continuous_scale="blues",
+        category_orders={"parent_status_label": PARENT_ORDER}
+    )
+    figures["parents"].update_xaxes(tickangle=45)
+
+    friend_data = tables["friend_data"]
+    if not friend_data.empty:
+        figures["friends"] = px.bar(
+            _with_error_columns(friend_data),
+            x="frdmjmon",
+            y="percentage",
+            error_y="error_plus",
+            error_y_minus="error_minus",
+            title="Marijuana Use by Friends' Marijuana Use (Past 30 Days)",
+            labels={"frdmjmon": "Number of Friends Using Marijuana (Past 30 Days)", "percentage": "Usage Rate (%)"},
+            color="percentage",
+            color_continuous_scale="purples"
+        )
+
+    household_data = tables["household_data"]
+    if not household_data.empty:
+        figures["household"] = _rate_lines(
+            household_data["irhhsiz2"], household_data["mjever"], household_data["alcever"],
+            "Substance Use by Household Size", "Household Size",
+            mj_ci=_interval_columns(household_data, "mjever"), alc_ci=_interval_columns(household_data, "alcever")
+        )
+
+    marital_mj_reindexed = tables["marital_mj_reindexed"]
+    marital_alc_reindexed = tables["marital_alc_reindexed"]
+    if not marital_mj_reindexed.empty or not marital_alc_reindexed.empty:
+        figures["marital"] = _grouped_bars(
+            marital_mj_reindexed, marital_alc_reindexed,
+            "Substance Use by Marital Status", "Marital Status", categoryarray=MARITAL_ORDER,
+            mj_ci=tables["marital_mj_ci"], alc_ci=tables["marital_alc_ci"]
+        )
+    return figures
+
+
+@traced("socioeconomic.figures")
+def socioeconomic_figures(cube, selections):
+    """
+    Figures of the Socioeconomic Impact tab.
+    """
+    tables = socioeconomic_tables(cube, selections)
+    figures = {"income": None, "poverty": None, "employment": None, "government": None}
+
+    income_data_reindexed = tables["income_data_reindexed"]
+    if not income_data_reindexed.empty:
+        figures["income"] = _rate_lines(
+            income_data_reindexed["income_label"], income_data_reindexed["mjever_percentage"],
+            income_data_reindexed["alcever_percentage"], "Substance Use by Income Level", "Income Category",
+            categoryarray=INCOME_ORDER,
+            mj_ci=_interval_columns(income_data_reindexed, "mjever"),
+            alc_ci=_interval_columns(income_data_reindexed, "alcever")
+        )
+
+    poverty_data_reindexed = tables["poverty_data_reindexed"]
+    if not poverty_data_reindexed.empty:
+        figures["poverty"] = px.scatter(
+            _with_error_columns(poverty_data_reindexed, rate="mjever", prefix="mjever_"),
+            x="poverty3_label",
+            y="mjever",
+            error_y="error_plus",
+            error_y_minus="error_minus",
+            size="alcever",
+            title="Marijuana Use vs Poverty Level",
+            labels={"poverty3_label": "Poverty Level", "mjever": "Marijuana Use Rate (%)", "alcever": "Alcohol Use Rate (%)"},
+            color="alcever",
+            color_continuous_scale="viridis",
+            category_orders={"poverty3_label": POVERTY_ORDER}
+        )
+
+    work_mj_reindexed = tables["work_mj_reindexed"]
+    work_alc_reindexed = tables["work_alc_reindexed"]
+    if not work_mj_reindexed.empty or not work_alc_reindexed.empty:
+        figures["employment"] = _grouped_bars(
+            work_mj_reindexed, work_alc_reindexed,
+            "Substance Use by Employment Status", "Employment Status", categoryarray=WORK_ORDER,
+            mj_ci=tables["work_mj_ci"], alc_ci=tables["work_alc_ci"]
+        )
+
+    govt_mj_reindexed = tables["govt_mj_reindexed"]
+    govt_alc_reindexed = tables["govt_alc_reindexed"]
+    govt_labels = tables["govt_labels"]
+    if not govt_mj_reindexed.empty or not govt_alc_reindexed.empty:
+        figures["government"] = _grouped_bars(
+            govt_mj_reindexed, govt_alc_reindexed,
+            "Substance Use by Government Assistance", "Government Assistance Status",
+            x=govt_labels, categoryarray=govt_labels,
+            mj_ci=tables["govt_mj_ci"], alc_ci=tables["govt_alc_ci"]
+        )
+    return figures
+
+
+@traced("treatment.figures")
+def treatment_figures(filtered_df_display, cube, selections):
+    """
+    Figures of the Treatment & Risk tab.
+    """
+    tables = treatment_tables(filtered_df_display, cube, selections)
+    figures = {"seeking": None, "risk": None, "first_use_age": None, "type": None}
+
+    # Treatment seeking behavior - Use txyralc_label for names
+    treatment_data = tables["treatment_data"]
+    if treatment_data is not None and not treatment_data.empty and treatment_data.sum() > 0:
+        figures["seeking"] = px.pie(
+            values=treatment_data.values,
+            names=treatment_data.index,
+            title="Alcohol Treatment Seeking Behavior",
+            color_discrete_sequence=["#FFB6C1", "#FF69B4"]
+        )
+
+    # Risk behaviors (drvinalco, alcpdang, alclimit)
+    risk_behaviors = tables["risk_behaviors"]
+    if risk_behaviors:
+        figures["risk"] = px.bar(
+            x=tables["risk_labels"],
+            y=risk_behaviors,
+            title="Risk Behaviors and Consequences (Count of 'Yes')",
+            labels={"x": "Risk Behavior", "y": "Number of Cases"},
+            color=risk_behaviors,
+            color_continuous_scale="reds"
+        )
+        figures["risk"].update_xaxes(tickangle=45)
+
+    # Age at first marijuana use vs current age (mjage is numerical)
+    age_comparison = tables["age_comparison"]
+    if age_comparison is not None and len(age_comparison) > 0:
+        # 2D binned density of the pair counts instead of one marker per respondent
+        fig_age_comp = px.density_heatmap(
+            age_comparison,
+            x="mjage",
+            y="age2_label", # Use label for y-axis
+            z="count",
+            histfunc="sum",
+            title="Age at First Marijuana Use vs Current Age Group",
+            labels={"mjage": "Age at First Use", "age2_label": "Current Age Group", "count": "Respondents"},
+            color_continuous_scale="greens",
+            category_orders={"age2_label": AGE_ORDER} # Ensure order
+        )
+        fig_age_comp.update_layout(coloraxis_colorbar_title="Respondents")
+        # Add diagonal reference line
+        fig_age_comp.add_shape(
+            type="line",
+            x0=age_comparison["mjage"].min(),
+            y0=age_comparison["mjage"].min(),
+            x1=age_comparison["mjage"].max(),
+            y1=age_comparison["mjage"].max(),
+            line=dict(color="red", dash="dash")
+        )
+        figures["first_use_age"] = fig_age_comp
+
+    # Treatment type analysis - Use txalconly_label for names
+    tx_type_data = tables["tx_type_data"]
+    if tx_type_data is not None and not tx_type_data.empty and tx_type_data.sum() > 0:
+        figures["type"] = px.pie(
+            values=tx_type_data.values,
+            names=tx_type_data.index,
+            title="Type of Treatment Received (Alcohol Only)",
+            color_discrete_sequence=["#87CEEB", "#4682B4"]
+        )
+    return figures
+
+
+# Charts returned by each tab's figure builder, cached under "<tab>.<chart>".
+TAB_CHARTS = {
+    "overview": ["metrics", "age", "education", "correlation"],
+    "marijuana": ["age", "first_use", "frequency", "education"],
+    "alcohol": ["days", "binge", "dui", "danger"],
+    "social": ["parents", "friends", "household", "marital"],
+    "socioeconomic": ["income", "poverty", "employment", "government"],
+    "treatment": ["seeking", "risk", "first_use_age", "type"]
+}
+
+
+@traced("overview.render")
+def show_overview_tab(filtered_df_display, figures):
+    """
+    Renders the Overview tab.
+    """
+    metrics = figures["metrics"]
+    st.markdown('<h2 class="sub-header">📊 Dataset Overview</h2>', unsafe_allow_html=True)
+    st.markdown("This section provides a high-level summary of the dataset and key demographic distributions.")
+
+    # Dataset Description and Image
+    desc_col, img_col = st.columns([2, 2]) # Adjust column ratio as needed
+
+    with desc_col:
+        st.markdown(f"""
+        Drug abuse among women is a complex issue influenced by both parental involvement and social environments. Research has shown that the absence of parental support,
+        supervision, or open communication can increase vulnerability to substance use. Additionally, peer pressure and social acceptance of drugs—especially in close circles—can further encourage risky behavior.
+        Understanding how these two forces interact is critical to developing targeted prevention and treatment strategies for women at risk.
+        The dataset used in this research is derived from the **[National Survey on Drug Use and Health (NSDUH)](https://www.kaggle.com/datasets/bgallamoza/national-survey-of-drug-use-and-health-20152019)**,
+        covering the years 2015 to 2019. 
+        """)
+    with img_col:
+        # IMPORTANT: Update this image path if your image is not in the specified location
+        st.image(r"C:\Users\zanny\Desktop\School\NCAIR Cohort\Data Science Beginners\Project\National Survey of Drug Use and Health\womens-picture2.jpg", use_container_width=True)
+
+    st.markdown('<h2 class="sub-header">Key Metrics</h2>', unsafe_allow_html=True)
+    st.write("These cards display essential summary statistics for the entire dataset and the filtered data, giving you an immediate sense of the scale and prevalence of substance use within the surveyed population.")
+
+    # Key metrics
+    col1, col2, col3, col4 = st.columns(4)
+
+    with col1:
+        st.metric("Total Respondents", f"{metrics['total_respondents']:,}")
+    with col2:
+        marijuana_users = metrics["marijuana_users"]
+        st.metric("Marijuana Users", f"{marijuana_users:,}",
+                 f"{marijuana_users/len(filtered_df_display)*100:.1f}%")
+    with col3:
+        alcohol_users = metrics["alcohol_users"]
+        st.metric("Alcohol Users", f"{alcohol_users:,}",
+                 f"{alcohol_users/len(filtered_df_display)*100:.1f}%")
+    with col4:
+        st.metric("Average Age Group", metrics["closest_age_label"])
+
+
+    # Demographics overview
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.markdown("### Age Group Distribution")
+        st.write("This bar chart shows the number of respondents falling into each defined age category. It helps you understand the age demographics of the survey participants.")
+        st.plotly_chart(figures["age"], use_container_width=True)
+
+    with col2:
+        st.markdown("### Education Level Distribution")
+        st.write("This pie chart illustrates the proportion of respondents across different education levels, providing insight into the educational background of the surveyed women.")
+        st.plotly_chart(figures["education"], use_container_width=True)
+
+    # Correlation heatmap
+    st.markdown("### 🔥 Substance Use Correlation")
+    st.write("This heatmap visualizes the statistical relationships between various substance use-related variables. Red colors (towards -1) indicate a strong negative correlation (as one variable increases, the other tends to decrease). Blue colors (towards +1) indicate a strong positive correlation (as one variable increases, the other also tends to increase). Colors near white/gray (near 0) indicate a weak or no linear correlation.")
+    if figures["correlation"] is not None:
+        st.plotly_chart(figures["correlation"], use_container_width=True)
+    else:
+        st.info("Not enough numerical substance use columns available to compute correlation in the filtered data.")
+
+
+@traced("marijuana.render")
+def show_marijuana_tab(filtered_df_display, figures):
+    """
+    Renders the Marijuana Analysis tab.
+    """
+    st.markdown('<h2 class="sub-header">🌿 Marijuana Use Analysis</h2>', unsafe_allow_html=True)
+    st.markdown("This tab focuses specifically on patterns and characteristics related to marijuana use.")
+    st.caption(INTERVAL_NOTE)
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.markdown("### Marijuana Use Rate by Age Group")
+        st.write("This chart shows the percentage of women in each age group who have reported using marijuana. It helps identify which age demographics have higher or lower rates of marijuana use.")
+        st.plotly_chart(figures["age"], use_container_width=True)
+
+    with col2:
+        st.markdown("### Age at First Marijuana Use")
+        st.write("This histogram displays the distribution of ages at which individuals first used marijuana. Peaks in the histogram indicate common ages for initiation.")
+        if figures["first_use"] is not None:
+            st.plotly_chart(figures["first_use"], use_container_width=True)
+        else:
+            st.info("No data for Age at First Marijuana Use in the filtered selection.")
+
+
+    # Usage frequency analysis
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.markdown("### Marijuana Use Frequency (Past 30 Days)")
+        st.write("This chart illustrates how many days in the past 30 days respondents reported using marijuana. It gives insight into the intensity of recent use among users.")
+        if figures["frequency"] is not None:
+            st.plotly_chart(figures["frequency"], use_container_width=True)
+        else:
+            st.info("No data for Marijuana Use Frequency (Past 30 Days) in the filtered selection.")
+
+    with col2:
+        st.markdown("### Marijuana Use Rate by Education Level")
+        st.write("Similar to the age group analysis, this bar chart shows the percentage of women at different education levels who have used marijuana, revealing potential links between education and use.")
+        st.plotly_chart(figures["education"], use_container_width=True)
+
+
+@traced("alcohol.render")
+def show_alcohol_tab(filtered_df_display, figures):
+    """
+    Renders the Alcohol Analysis tab.
+    """
+    st.markdown('<h2 class="sub-header">🍷 Alcohol Use Analysis</h2>', unsafe_allow_html=True)
+    st.markdown("This section delves into various aspects of alcohol consumption and related behaviors.")
+    st.caption(INTERVAL_NOTE)
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.markdown("### Alcohol Use Days in Past Year")
+        st.write("This histogram shows the distribution of the number of days respondents reported using alcohol in the past year, indicating frequency of consumption.")
+        if figures["days"] is not None:
+            st.plotly_chart(figures["days"], use_container_width=True)
+        else:
+            st.info("No data for Alcohol Use Days in Past Year in the filtered selection.")
+
+    with col2:
+        st.markdown("### Binge Drinking Rate by Age Group")
+        st.write("This chart displays the percentage of women in each age group who reported engaging in binge drinking in the past 30 days. It highlights age groups with higher rates of heavy episodic drinking.")
+        st.plotly_chart(figures["binge"], use_container_width=True)
+
+    # Alcohol-related risks
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.markdown("### Drove Under Influence of Alcohol")
+        st.write("This pie chart shows the proportion of respondents who reported driving under the influence of alcohol.")
+        st.plotly_chart(figures["dui"], use_container_width=True)
+
+    with col2:
+        st.markdown("### Alcohol Caused Dangerous Situations")
+        st.write("This pie chart indicates the percentage of individuals who reported experiencing dangerous situations as a result of their alcohol use.")
+        if "alcpdang_label" in filtered_df_display.columns:
+            if figures["danger"] is not None:
+                st.plotly_chart(figures["danger"], use_container_width=True)
+            else:
+                st.info("No data for Alcohol Caused Dangerous Situations in the filtered selection.")
+        else:
+            st.info("Column 'alcpdang_label' not found in the filtered dataset.")
+
+
+@traced("social.render")
+def show_social_tab(filtered_df_display, figures):
+    """
+    Renders the Social Factors tab.
+    """
+    st.markdown('<h2 class="sub-header">👥 Social Factors Analysis</h2>', unsafe_allow_html=True)
+    st.markdown("This tab explores how social environments and relationships influence substance use.")
+    st.caption(INTERVAL_NOTE)
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.markdown("### Marijuana Use by Parental Presence")
+        st.write("This chart compares marijuana use rates based on whether the mother and/or father were present in the household. It helps assess the impact of parental presence.")
+        if 'imother_label' in filtered_df_display.columns and 'ifather_label' in filtered_df_display.columns:
+            st.plotly_chart(figures["parents"], use_container_width=True)
+        else:
+            st.info("Parental presence data (imother, ifather) not available in the filtered dataset.")
+
+
+    with col2:
+        st.markdown("### Marijuana Use by Friends' Marijuana Use (Past 30 Days)")
+        st.write("This bar chart shows the percentage of marijuana users based on the number of close friends who also use marijuana. It illustrates the influence of peer behavior.")
+        if "frdmjmon" in filtered_df_display.columns:
+            if figures["friends"] is not None:
+                st.plotly_chart(figures["friends"], use_container_width=True)
+            else:
+                st.info("No data for Friends' Marijuana Use in the filtered selection.")
+        else:
+            st.info("Column 'frdmjmon' not found in the filtered dataset.")
+
+    # Household characteristics
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.markdown("### Substance Use by Household Size")
+        st.write("This line chart plots the marijuana and alcohol use rates against the number of people in the household, revealing how household size might correlate with substance use.")
+        if "irhhsiz2" in filtered_df_display.columns:
+            if figures["household"] is not None:
+                st.plotly_chart(figures["household"], use_container_width=True)
+            else:
+                st.info("No data for Household Size in the filtered selection.")
+        else:
+            st.info("Column 'irhhsiz2' not found in the filtered dataset.")
+
+
+    with col2:
+        st.markdown("### Substance Use by Marital Status")
+        st.write("This chart compares marijuana and alcohol use rates across different marital statuses, indicating potential associations between relationship status and substance use.")
+        if "irmaritstat_label" in filtered_df_display.columns:
+            if figures["marital"] is not None:
+                st.plotly_chart(figures["marital"], use_container_width=True)
+            else:
+                st.info("No data for Marital Status vs Substance Use in the filtered selection.")
+        else:
+            st.info("Column 'irmaritstat_label' not found in the filtered dataset.")
+
+
+@traced("socioeconomic.render")
+def show_socioeconomic_tab(filtered_df_display, figures):
+    """
+    Renders the Socioeconomic Impact tab.
+    """
+    st.markdown('<h2 class="sub-header">💰 Socioeconomic Impact Analysis</h2>', unsafe_allow_html=True)
+    st.markdown("This section examines the connection between socioeconomic factors and substance use.")
+    st.caption(INTERVAL_NOTE)
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.markdown("### Substance Use by Income Level")
+        st.write("This line chart displays the trends in marijuana and alcohol use rates across different annual family income categories.")
+        if "income_label" in filtered_df_display.columns:
+            if figures["income"] is not None:
+                st.plotly_chart(figures["income"], use_container_width=True)
+            else:
+                st.info("No data for Income Level vs Substance Use in the filtered selection.")
+        else:
+            st.info("Column 'income_label' not found in the filtered dataset.")
+
+    with col2:
+        st.markdown("### Marijuana Use vs Poverty Level")
+        st.write("This scatter plot shows the relationship between marijuana use rate and poverty level, with the size of the points potentially indicating the alcohol use rate for that group.")
+        if "poverty3_label" in filtered_df_display.columns:
+            if figures["poverty"] is not None:
+                st.plotly_chart(figures["poverty"], use_container_width=True)
+            else:
+                st.info("No data for Poverty Level vs Substance Use in the filtered selection.")
+        else:
+            st.info("Column 'poverty3_label' not found in the filtered dataset.")
+
+    # Employment status analysis
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.markdown("### Substance Use by Employment Status")
+        st.write("This chart illustrates marijuana and alcohol use rates based on employment status (employed, unemployed, not in labor force).")
+        if "irwrkstat_label" in filtered_df_display.columns:
+            if figures["employment"] is not None:
+                st.plotly_chart(figures["employment"], use_container_width=True)
+            else:
+                st.info("No data for Employment Status vs Substance Use in the filtered selection.")
+        else:
+            st.info("Column 'irwrkstat_label' not found in the filtered dataset.")
+
+    with col2:
+        st.markdown("### Substance Use by Government Assistance")
+        st.write("This chart compares substance use rates between individuals who receive government assistance and those who do not.")
+        if "govtprog" in filtered_df_display.columns:
+            if figures["government"] is not None:
+                st.plotly_chart(figures["government"], use_container_width=True)
+            else:
+                st.info("No data for Government Assistance vs Substance Use in the filtered selection.")
+        else:
+            st.info("Column 'govtprog' not found in the filtered dataset.")
+
+
+@traced("treatment.render")
+def show_treatment_tab(filtered_df_display, figures):
+    """
+    Renders the Treatment & Risk tab.
+    """
+    st.markdown('<h2 class="sub-header">🏥 Treatment & Risk Analysis</h2>', unsafe_allow_html=True)
+    st.markdown("This tab focuses on treatment-seeking behaviors and other risk factors.")
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.markdown("### Alcohol Treatment Seeking Behavior")
+        st.write("This pie chart shows the proportion of respondents who have sought treatment for alcohol use in the past year.")
+        if "txyralc_label" in filtered_df_display.columns:
+            if figures["seeking"] is not None:
+                st.plotly_chart(figures["seeking"], use_container_width=True)
+            else:
+                st.info("No data for Alcohol Treatment Seeking Behavior in the filtered selection.")
+        else:
+            st.info("Column 'txyralc_label' not found in the filtered dataset.")
+
+
+    with col2:
+        st.markdown("### Risk Behaviors and Consequences (Count of 'Yes')")
+        st.write("This bar chart displays the total count of individuals who reported engaging in specific risk behaviors related to substance use, such as driving under influence or experiencing dangerous situations.")
+        if figures["risk"] is not None:
+            st.plotly_chart(figures["risk"], use_container_width=True)
+        else:
+            st.info("No risk behavior data available in the filtered selection.")
+
+
+    # Age at first use analysis
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.markdown("### Age at First Marijuana Use vs Current Age Group")
+        st.write("This density heatmap visualizes the relationship between the age at which an individual first used marijuana and their current age group; darker cells hold more respondents. The diagonal red line serves as a reference where first use age equals current age.")
+        if "mjage" in filtered_df_display.columns:
+            if figures["first_use_age"] is not None:
+                st.plotly_chart(figures["first_use_age"], use_container_width=True)
+            else:
+                st.info("No data for Age at First Marijuana Use vs Current Age Group in the filtered selection.")
+        else:
+            st.info("Column 'mjage' not found in the filtered dataset.")
+
+    with col2:
+        st.markdown("### Type of Treatment Received (Alcohol Only)")
+        st.write("This pie chart breaks down the types of treatment received, specifically for alcohol-only treatment versus mixed substance treatment.")
+        if "txalconly_label" in filtered_df_display.columns:
+            if figures["type"] is not None:
+                st.plotly_chart(figures["type"], use_container_width=True)
+            else:
+                st.info("No data for Type of Treatment Received (Alcohol Only) in the filtered selection.")
+        else:
+            st.info("Column 'txalconly_label' not found in the filtered dataset.")
+
+
+def tab_figures(tab, cache_key, build, *args):
+    """
+    Returns the figures of a tab from the shared figure cache, running its builder
+    (aggregation and figure construction) only on a cache miss.
+
+    Args:
+        tab (str): Key of TAB_CHARTS.
+        cache_key (tuple): Normalized filter selection and dataset fingerprint.
+        build (callable): The tab's figure builder, e.g. marijuana_figures.
+        *args: Arguments of build.
+    """
+    chart_ids = [f"{tab}.{name}" for name in TAB_CHARTS[tab]]
+    with span(f"{tab}.figure_cache"):
+        figures = get_figure_cache().get_or_build(
+            chart_ids, cache_key, lambda: {f"{tab}.{name}": value for name, value in build(*args).items()}
+        )
+    return {chart_id.split(".", 1)[1]: value for chart_id, value in figures.items()}
 
 
 def show_data_visualization():
@@ -10,8 +1039,8 @@ def show_data_visualization():
     Displays the interactive data visualization dashboard.
     Loads data, applies filters, and generates various plots.
     """
-    df = load_data()
-    df_display = apply_display_mappings(df)
+    with span("load_data"):
+        df = load_display_data()
 
 
     st.markdown("""
@@ -98,29 +1127,42 @@ def show_data_visualization():
         help="Filter by marital status"
     )
 
-    # Apply filters using original numerical values
-    filtered_df = df.copy()
-    if selected_age_codes:
-        filtered_df = filtered_df[filtered_df["age2"].isin(selected_age_codes)]
-    if selected_edu_codes:
-        filtered_df = filtered_df[filtered_df["eduhighcat"].isin(selected_edu_codes)]
-    if selected_work_codes:
-        filtered_df = filtered_df[filtered_df["irwrkstat"].isin(selected_work_codes)]
-    if selected_marital_codes:
-        filtered_df = filtered_df[filtered_df["irmaritstat"].isin(selected_marital_codes)]
-
-    # Apply display mappings to the filtered DataFrame for plotting
-    filtered_df_display = apply_display_mappings(filtered_df)
+    # Apply filters using original numerical values: the precomputed bitmaps resolve the
+    # selection to a row mask, and the label columns were decoded once at load time
+    selections = {
+        "age2": selected_age_codes,
+        "eduhighcat": selected_edu_codes,
+        "irwrkstat": selected_work_codes,
+        "irmaritstat": selected_marital_codes
+    }
+    with span("filters"):
+        filter_index = load_filter_index()
+        mask = filter_mask(filter_index, selections)
+        # The unfiltered view uses the shared frame itself rather than a copy of every row
+        filtered_df_display = df if mask.all() else df[mask]
+
+    # Built charts are shared across sessions, keyed by the rows the selection resolves to
+    cache_key = (normalize_selections(filter_index, selections), dataset_fingerprint()['sha256'])
+
+    # The rate charts and the correlation heatmap are answered from pre-aggregated
+    # cells instead of the rows
+    with span("aggregates"):
+        cube = load_data_cube()
+        corr_stats = load_corr_stats()
 
 
     # Sidebar info
     st.sidebar.markdown("---")
     st.sidebar.markdown("### 📈 Dataset Info")
     st.sidebar.info(f"**Total Records:** {len(df):,}")
-    st.sidebar.info(f"**Filtered Records:** {len(filtered_df):,}")
-    st.sidebar.info(f"**Variables:** {len(df.columns)}")
-
-    # Main dashboard tabs
+    st.sidebar.info(f"**Filtered Records:** {len(filtered_df_display):,}")
+    st.sidebar.info(f"**Variables:** {sum(not col.endswith('_label') for col in df.columns)}")
+    cache_stats = get_figure_cache().stats()
+    st.sidebar.caption(f"Chart cache: {cache_stats['hit_rate']:.0%} hit rate, {cache_stats['entries']} charts, "
+                       f"{cache_stats['nbytes'] / 2**20:.1f} MB")
+
+    # Main dashboard tabs. Only the open tab's tables and figures are computed on a
+    # rerun; switching tabs reruns the script to fill the newly opened one.
     tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
         "📊 Overview",
         "🌿 Marijuana Analysis",
@@ -128,716 +1170,31 @@ def show_data_visualization():
         "👥 Social Factors",
         "💰 Socioeconomic Impact",
         "🏥 Treatment & Risk"
-    ])
+    ], key="viz_tab", on_change="rerun")
 
-    # Tab 1: Overview
     with tab1:
-        st.markdown('<h2 class="sub-header">📊 Dataset Overview</h2>', unsafe_allow_html=True)
-        st.markdown("This section provides a high-level summary of the dataset and key demographic distributions.")
-
-        # Dataset Description and Image
-        desc_col, img_col = st.columns([2, 2]) # Adjust column ratio as needed
-
-        with desc_col:
-            st.markdown(f"""
-            Drug abuse among women is a complex issue influenced by both parental involvement and social environments. Research has shown that the absence of parental support,
-            supervision, or open communication can increase vulnerability to substance use. Additionally, peer pressure and social acceptance of drugs—especially in close circles—can further encourage risky behavior.
-            Understanding how these two forces interact is critical to developing targeted prevention and treatment strategies for women at risk.
-            The dataset used in this research is derived from the **[National Survey on Drug Use and Health (NSDUH)](https://www.kaggle.com/datasets/bgallamoza/national-survey-of-drug-use-and-health-20152019)**,
-            covering the years 2015 to 2019. 
-            """)
-        with img_col:
-            # IMPORTANT: Update this image path if your image is not in the specified location
-            st.image(r"C:\Users\zanny\Desktop\School\NCAIR Cohort\Data Science Beginners\Project\National Survey of Drug Use and Health\womens-picture2.jpg", use_container_width=True)
-
-        st.markdown('<h2 class="sub-header">Key Metrics</h2>', unsafe_allow_html=True)
-        st.write("These cards display essential summary statistics for the entire dataset and the filtered data, giving you an immediate sense of the scale and prevalence of substance use within the surveyed population.")
-
-        # Key metrics
-        col1, col2, col3, col4 = st.columns(4)
-
-        with col1:
-            st.metric("Total Respondents", f"{len(filtered_df_display):,}")
-        with col2:
-            marijuana_users = len(filtered_df_display[filtered_df_display["mjever"] == 1])
-            st.metric("Marijuana Users", f"{marijuana_users:,}",
-                     f"{marijuana_users/len(filtered_df_display)*100:.1f}%")
-        with col3:
-            alcohol_users = len(filtered_df_display[filtered_df_display["alcever"] == 1])
-            st.metric("Alcohol Users", f"{alcohol_users:,}",
-                     f"{alcohol_users/len(filtered_df_display)*100:.1f}%")
-        with col4:
-            # Average age group might still be numerical, or we can map it to a representative label
-            avg_age_code = filtered_df_display["age2"].mean()
-            # Find the closest age group label for display
-            closest_age_label = "N/A"
-            if not pd.isna(avg_age_code):
-                closest_age_code = min(AGE_MAP.keys(), key=lambda k: abs(k - avg_age_code))
-                closest_age_label = AGE_MAP.get(closest_age_code, str(round(avg_age_code, 1)))
-            st.metric("Average Age Group", closest_age_label)
-
-
-        # Demographics overview
-        col1, col2 = st.columns(2)
-
-        with col1:
-            st.markdown("### Age Group Distribution")
-            st.write("This bar chart shows the number of respondents falling into each defined age category. It helps you understand the age demographics of the survey participants.")
-            # Age distribution - Use age2_label for x-axis
-            age_dist = filtered_df_display["age2_label"].value_counts().reindex([AGE_MAP[k] for k in sorted(AGE_MAP.keys())], fill_value=0)
-            fig_age = px.bar(
-                x=age_dist.index,
-                y=age_dist.values,
-                title="Age Group Distribution",
-                labels={"x": "Age Group", "y": "Count"},
-                color=age_dist.values,
-                color_continuous_scale="viridis",
-                category_orders={"x": [AGE_MAP[k] for k in sorted(AGE_MAP.keys())]} # Ensure correct order
-            )
-            fig_age.update_layout(showlegend=False)
-            st.plotly_chart(fig_age, use_container_width=True)
-
-        with col2:
-            st.markdown("### Education Level Distribution")
-            st.write("This pie chart illustrates the proportion of respondents across different education levels, providing insight into the educational background of the surveyed women.")
-            # Education distribution - Use eduhighcat_label for names
-            edu_dist = filtered_df_display["eduhighcat_label"].value_counts().reindex([EDU_MAP[k] for k in sorted(EDU_MAP.keys())], fill_value=0)
-            fig_edu = px.pie(
-                values=edu_dist.values,
-                names=edu_dist.index,
-                title="Education Level Distribution",
-                color_discrete_sequence=px.colors.qualitative.Set3,
-                category_orders={"names": [EDU_MAP[k] for k in sorted(EDU_MAP.keys())]} # Ensure correct order
-            )
-            st.plotly_chart(fig_edu, use_container_width=True)
-
-        # Correlation heatmap
-        st.markdown("### 🔥 Substance Use Correlation")
-        st.write("This heatmap visualizes the statistical relationships between various substance use-related variables. Red colors (towards -1) indicate a strong negative correlation (as one variable increases, the other tends to decrease). Blue colors (towards +1) indicate a strong positive correlation (as one variable increases, the other also tends to increase). Colors near white/gray (near 0) indicate a weak or no linear correlation.")
-        substance_cols = ["mjever", "alcever", "mjday30a", "alcydays", "mjage"]
-        available_cols = [col for col in filtered_df_display.columns if col in substance_cols] # Ensure column exists
-
-        if len(available_cols) > 1:
-            corr_matrix = filtered_df_display[available_cols].corr(numeric_only=True) # Added numeric_only=True
-            fig_corr = px.imshow(
-                corr_matrix,
-                color_continuous_scale="RdBu",
-                title="Substance Use Correlation Matrix",
-                aspect="auto"
-            )
-            st.plotly_chart(fig_corr, use_container_width=True)
-        else:
-            st.info("Not enough numerical substance use columns available to compute correlation in the filtered data.")
+        if tab1.open:
+            show_overview_tab(filtered_df_display, tab_figures("overview", cache_key, overview_figures, filtered_df_display, corr_stats, selections))
 
-    # Tab 2: Marijuana Analysis
     with tab2:
-        st.markdown('<h2 class="sub-header">🌿 Marijuana Use Analysis</h2>', unsafe_allow_html=True)
-        st.markdown("This tab focuses specifically on patterns and characteristics related to marijuana use.")
-
-        col1, col2 = st.columns(2)
-
-        with col1:
-            st.markdown("### Marijuana Use Rate by Age Group")
-            st.write("This chart shows the percentage of women in each age group who have reported using marijuana. It helps identify which age demographics have higher or lower rates of marijuana use.")
-            # Marijuana use by age group - Use age2_label for x-axis
-            mj_age_data = filtered_df_display.groupby("age2_label")["mjever"].agg(["count", "sum"]).reset_index()
-            mj_age_data["percentage"] = (mj_age_data["sum"] / mj_age_data["count"]) * 100
-
-            fig_mj_age = px.bar(
-                mj_age_data,
-                x="age2_label",
-                y="percentage",
-                title="Marijuana Use Rate by Age Group",
-                labels={"age2_label": "Age Group", "percentage": "Usage Rate (%)"},
-                color="percentage",
-                color_continuous_scale="greens",
-                category_orders={"age2_label": [AGE_MAP[k] for k in sorted(AGE_MAP.keys())]} # Ensure correct order
-            )
-            st.plotly_chart(fig_mj_age, use_container_width=True)
-
-        with col2:
-            st.markdown("### Age at First Marijuana Use")
-            st.write("This histogram displays the distribution of ages at which individuals first used marijuana. Peaks in the histogram indicate common ages for initiation.")
-            # Age at first use (mjage is numerical, no mapping needed here)
-            mj_first_use = filtered_df_display[filtered_df_display["mjage"] > 0]["mjage"]
-            if len(mj_first_use) > 0:
-                fig_mj_first = px.histogram(
-                    mj_first_use,
-                    nbins=20,
-                    title="Age at First Marijuana Use",
-                    labels={"value": "Age at First Use", "count": "Number of Users"},
-                    color_discrete_sequence=["#2E8B57"]
-                )
-                st.plotly_chart(fig_mj_first, use_container_width=True)
-            else:
-                st.info("No data for Age at First Marijuana Use in the filtered selection.")
-
-
-        # Usage frequency analysis
-        col1, col2 = st.columns(2)
-
-        with col1:
-            st.markdown("### Marijuana Use Frequency (Past 30 Days)")
-            st.write("This chart illustrates how many days in the past 30 days respondents reported using marijuana. It gives insight into the intensity of recent use among users.")
-            # Days used in past 30 days (mjday30a is numerical)
-            mj_30_days = filtered_df_display[filtered_df_display["mjday30a"] > 0]["mjday30a"]
-            if len(mj_30_days) > 0:
-                fig_mj_30 = px.histogram(
-                    mj_30_days,
-                    nbins=15,
-                    title="Marijuana Use Frequency (Past 30 Days)",
-                    labels={"value": "Days Used", "count": "Number of Users"},
-                    color_discrete_sequence=["#228B22"]
-                )
-                st.plotly_chart(fig_mj_30, use_container_width=True)
-            else:
-                st.info("No data for Marijuana Use Frequency (Past 30 Days) in the filtered selection.")
-
-        with col2:
-            st.markdown("### Marijuana Use Rate by Education Level")
-            st.write("Similar to the age group analysis, this bar chart shows the percentage of women at different education levels who have used marijuana, revealing potential links between education and use.")
-            # Marijuana use by education level - Use eduhighcat_label for x-axis
-            mj_edu_data = filtered_df_display.groupby("eduhighcat_label")["mjever"].agg(["count", "sum"]).reset_index()
-            mj_edu_data["percentage"] = (mj_edu_data["sum"] / mj_edu_data["count"]) * 100
-
-            fig_mj_edu = px.bar(
-                mj_edu_data,
-                x="eduhighcat_label",
-                y="percentage",
-                title="Marijuana Use Rate by Education Level",
-                labels={"eduhighcat_label": "Education Level", "percentage": "Usage Rate (%)"},
-                color="percentage",
-                color_continuous_scale="greens",
-                category_orders={"eduhighcat_label": [EDU_MAP[k] for k in sorted(EDU_MAP.keys())]} # Ensure correct order
-            )
-            st.plotly_chart(fig_mj_edu, use_container_width=True)
-
- # Tab 3: Alcohol Analysis
-    with tab3:
-        st.markdown('<h2 class="sub-header">🍷 Alcohol Use Analysis</h2>', unsafe_allow_html=True)
-        st.markdown("This section delves into various aspects of alcohol consumption and related behaviors.")
-
-        col1, col2 = st.columns(2)
-
-        with col1:
-            st.markdown("### Alcohol Use Days in Past Year")
-            st.write("This histogram shows the distribution of the number of days respondents reported using alcohol in the past year, indicating frequency of consumption.")
-            # Alcohol use days in past year (alcydays is numerical)
-            alc_days = filtered_df_display[filtered_df_display["alcydays"] > 0]["alcydays"]
-            if len(alc_days) > 0:
-                fig_alc_days = px.histogram(
-                    alc_days,
-                    nbins=30,
-                    title="Alcohol Use Days in Past Year",
-                    labels={"value": "Days Used", "count": "Number of Users"},
-                    color_discrete_sequence=["#8B0000"]
-                )
-                st.plotly_chart(fig_alc_days, use_container_width=True)
-            else:
-                st.info("No data for Alcohol Use Days in Past Year in the filtered selection.")
-
-        with col2:
-            st.markdown("### Binge Drinking Rate by Age Group")
-            st.write("This chart displays the percentage of women in each age group who reported engaging in binge drinking in the past 30 days. It highlights age groups with higher rates of heavy episodic drinking.")
-            # Binge drinking by age group - Use age2_label for x-axis
-            binge_data = filtered_df_display.groupby("age2_label")["alcbng30d"].agg(["count", "sum"]).reset_index()
-            binge_data["percentage"] = (binge_data["sum"] / binge_data["count"]) * 100
-
-            fig_binge = px.bar(
-                binge_data,
-                x="age2_label",
-                y="percentage",
-                title="Binge Drinking Rate by Age Group",
-                labels={"age2_label": "Age Group", "percentage": "Binge Drinking Rate (%)"},
-                color="percentage",
-                color_continuous_scale="reds",
-                category_orders={"age2_label": [AGE_MAP[k] for k in sorted(AGE_MAP.keys())]} # Ensure correct order
-            )
-            st.plotly_chart(fig_binge, use_container_width=True)
-
-        # Alcohol-related risks
-        col1, col2 = st.columns(2)
-
-        with col1:
-            st.markdown("### Drove Under Influence of Alcohol")
-            st.write("This pie chart shows the proportion of respondents who reported driving under the influence of alcohol.")
-            # Driving under influence - Use drvinalco_label for names
-            dui_data = filtered_df_display["drvinalco_label"].value_counts().reindex(["No", "Yes"], fill_value=0)
-            fig_dui = px.pie(
-                values=dui_data.values,
-                names=dui_data.index, # Use index which now contains "No", "Yes"
-                title="Drove Under Influence of Alcohol",
-                color_discrete_sequence=["#90EE90", "#FF6B6B"]
-            )
-            st.plotly_chart(fig_dui, use_container_width=True)
-
-        with col2:
-            st.markdown("### Alcohol Caused Dangerous Situations")
-            st.write("This pie chart indicates the percentage of individuals who reported experiencing dangerous situations as a result of their alcohol use.")
-            # Alcohol-related dangerous situations - Use alcpdang_label for names
-            if "alcpdang_label" in filtered_df_display.columns:
-                danger_data = filtered_df_display["alcpdang_label"].value_counts().reindex([ALCPDANG_MAP[k] for k in sorted(ALCPDANG_MAP.keys())], fill_value=0)
-                if not danger_data.empty and danger_data.sum() > 0:
-                    fig_danger = px.pie(
-                        values=danger_data.values,
-                        names=danger_data.index, # Use index which now contains labels
-                        title="Alcohol Caused Dangerous Situations",
-                        color_discrete_sequence=["#98FB98", "#FF4500"],
-                        category_orders={"names": [ALCPDANG_MAP[k] for k in sorted(ALCPDANG_MAP.keys())]}
-                    )
-                    st.plotly_chart(fig_danger, use_container_width=True)
-                else:
-                    st.info("No data for Alcohol Caused Dangerous Situations in the filtered selection.")
-            else:
-                st.info("Column 'alcpdang_label' not found in the filtered dataset.")
+        if tab2.open:
+            show_marijuana_tab(filtered_df_display, tab_figures("marijuana", cache_key, marijuana_figures, filtered_df_display, cube, selections))
 
+    with tab3:
+        if tab3.open:
+            show_alcohol_tab(filtered_df_display, tab_figures("alcohol", cache_key, alcohol_figures, filtered_df_display, cube, selections))
 
-    # Tab 4: Social Factors
     with tab4:
-        st.markdown('<h2 class="sub-header">👥 Social Factors Analysis</h2>', unsafe_allow_html=True)
-        st.markdown("This tab explores how social environments and relationships influence substance use.")
-
-        col1, col2 = st.columns(2)
-
-        with col1:
-            st.markdown("### Marijuana Use by Parental Presence")
-            st.write("This chart compares marijuana use rates based on whether the mother and/or father were present in the household. It helps assess the impact of parental presence.")
-            # Parental influence on marijuana use - Use imother_label and ifather_label
-            # Create a combined label for parental status
-            parent_data_display = filtered_df_display.copy()
-            if 'imother_label' in parent_data_display.columns and 'ifather_label' in parent_data_display.columns:
-                parent_data_display['parent_status_label'] = parent_data_display.apply(
-                    lambda row: f"Mother: {row['imother_label']}, Father: {row['ifather_label']}", axis=1
-                )
-                parent_agg = parent_data_display.groupby("parent_status_label")["mjever"].agg(["count", "sum"]).reset_index()
-                parent_agg["percentage"] = (parent_agg["sum"] / parent_agg["count"]) * 100
-
-                # Define a custom order for parental status for better visualization
-                parent_order = [
-                    "Mother: Yes, Father: Yes",
-                    "Mother: Yes, Father: No",
-                    "Mother: No, Father: Yes",
-                    "Mother: No, Father: No"
-                ]
-                # Reindex to ensure all categories are present, even if empty
-                parent_agg_reindexed = parent_agg.set_index('parent_status_label').reindex(parent_order, fill_value=0).reset_index()
-                parent_agg_reindexed['percentage'] = parent_agg_reindexed['percentage'].fillna(0) # Fill NaN percentages with 0
-
-                fig_parent = px.bar(
-                    parent_agg_reindexed,
-                    x="parent_status_label",
-                    y="percentage",
-                    title="Marijuana Use by Parental Presence",
-                    labels={"parent_status_label": "Parental Presence", "percentage": "Usage Rate (%)"},
-                    color="percentage",
-                    color_continuous_scale="blues",
-                    category_orders={"parent_status_label": parent_order}
-                )
-                fig_parent.update_xaxes(tickangle=45)
-                st.plotly_chart(fig_parent, use_container_width=True)
-            else:
-                st.info("Parental presence data (imother, ifather) not available in the filtered dataset.")
-
-
-        with col2:
-            st.markdown("### Marijuana Use by Friends' Marijuana Use (Past 30 Days)")
-            st.write("This bar chart shows the percentage of marijuana users based on the number of close friends who also use marijuana. It illustrates the influence of peer behavior.")
-            # Friend influence on marijuana use (frdmjmon is numerical)
-            if "frdmjmon" in filtered_df_display.columns:
-                friend_data = filtered_df_display.groupby("frdmjmon")["mjever"].agg(["count", "sum"]).reset_index()
-                friend_data["percentage"] = (friend_data["sum"] / friend_data["count"]) * 100
-
-                if not friend_data.empty:
-                    fig_friend = px.bar(
-                        friend_data,
-                        x="frdmjmon",
-                        y="percentage",
-                        title="Marijuana Use by Friends' Marijuana Use (Past 30 Days)",
-                        labels={"frdmjmon": "Number of Friends Using Marijuana (Past 30 Days)", "percentage": "Usage Rate (%)"},
-                        color="percentage",
-                        color_continuous_scale="purples"
-                    )
-                    st.plotly_chart(fig_friend, use_container_width=True)
-                else:
-                    st.info("No data for Friends' Marijuana Use in the filtered selection.")
-            else:
-                st.info("Column 'frdmjmon' not found in the filtered dataset.")
-
-        # Household characteristics
-        col1, col2 = st.columns(2)
-
-        with col1:
-            st.markdown("### Substance Use by Household Size")
-            st.write("This line chart plots the marijuana and alcohol use rates against the number of people in the household, revealing how household size might correlate with substance use.")
-            # Household size vs substance use (irhhsiz2 is numerical)
-            if "irhhsiz2" in filtered_df_display.columns:
-                household_data = filtered_df_display.groupby("irhhsiz2")[["mjever", "alcever"]].mean().reset_index()
-                household_data["mjever"] *= 100
-                household_data["alcever"] *= 100
-
-                if not household_data.empty:
-                    fig_household = go.Figure()
-                    fig_household.add_trace(go.Scatter(
-                        x=household_data["irhhsiz2"],
-                        y=household_data["mjever"],
-                        mode="lines+markers",
-                        name="Marijuana Use",
-                        line=dict(color="green")
-                    ))
-                    fig_household.add_trace(go.Scatter(
-                        x=household_data["irhhsiz2"],
-                        y=household_data["alcever"],
-                        mode="lines+markers",
-                        name="Alcohol Use",
-                        line=dict(color="red")
-                    ))
-                    fig_household.update_layout(
-                        title="Substance Use by Household Size",
-                        xaxis_title="Household Size",
-                        yaxis_title="Usage Rate (%)"
-                    )
-                    st.plotly_chart(fig_household, use_container_width=True)
-                else:
-                    st.info("No data for Household Size in the filtered selection.")
-            else:
-                st.info("Column 'irhhsiz2' not found in the filtered dataset.")
-
-
-        with col2:
-            st.markdown("### Substance Use by Marital Status")
-            st.write("This chart compares marijuana and alcohol use rates across different marital statuses, indicating potential associations between relationship status and substance use.")
-            # Marital status vs substance use - Use irmaritstat_label for x-axis
-            if "irmaritstat_label" in filtered_df_display.columns:
-                marital_data = filtered_df_display.groupby("irmaritstat_label")[["mjever", "alcever"]].agg(["count", "sum"])
-                marital_mj = (marital_data["mjever"]["sum"] / marital_data["mjever"]["count"]) * 100
-                marital_alc = (marital_data["alcever"]["sum"] / marital_data["alcever"]["count"]) * 100
-
-                # Reindex to ensure all categories are present, even if empty
-                marital_order = [MARITAL_MAP[k] for k in sorted(MARITAL_MAP.keys())]
-                marital_mj_reindexed = marital_mj.reindex(marital_order, fill_value=0).fillna(0)
-                marital_alc_reindexed = marital_alc.reindex(marital_order, fill_value=0).fillna(0)
-
-                if not marital_mj_reindexed.empty or not marital_alc_reindexed.empty:
-                    fig_marital = go.Figure()
-                    fig_marital.add_trace(go.Bar(
-                        x=marital_mj_reindexed.index,
-                        y=marital_mj_reindexed.values,
-                        name="Marijuana Use",
-                        marker_color="lightgreen"
-                    ))
-                    fig_marital.add_trace(go.Bar(
-                        x=marital_alc_reindexed.index,
-                        y=marital_alc_reindexed.values,
-                        name="Alcohol Use",
-                        marker_color="lightcoral"
-                    ))
-                    fig_marital.update_layout(
-                        title="Substance Use by Marital Status",
-                        xaxis_title="Marital Status",
-                        yaxis_title="Usage Rate (%)",
-                        barmode="group",
-                        xaxis=dict(categoryorder='array', categoryarray=marital_order) # Ensure order
-                    )
-                    st.plotly_chart(fig_marital, use_container_width=True)
-                else:
-                    st.info("No data for Marital Status vs Substance Use in the filtered selection.")
-            else:
-                st.info("Column 'irmaritstat_label' not found in the filtered dataset.")
+        if tab4.open:
+            show_social_tab(filtered_df_display, tab_figures("social", cache_key, social_figures, cube, selections))
 
-    # Tab 5: Socioeconomic Impact
     with tab5:
-        st.markdown('<h2 class="sub-header">💰 Socioeconomic Impact Analysis</h2>', unsafe_allow_html=True)
-        st.markdown("This section examines the connection between socioeconomic factors and substance use.")
-
-        col1, col2 = st.columns(2)
-
-        with col1:
-            st.markdown("### Substance Use by Income Level")
-            st.write("This line chart displays the trends in marijuana and alcohol use rates across different annual family income categories.")
-            # Income vs substance use - Use income_label for x-axis
-            if "income_label" in filtered_df_display.columns:
-                income_data = filtered_df_display.groupby("income_label")[["mjever", "alcever"]].agg(["count", "sum"]).reset_index()
-                income_data[("mjever", "percentage")] = (income_data["mjever"]["sum"] / income_data["mjever"]["count"]) * 100
-                income_data[("alcever", "percentage")] = (income_data["alcever"]["sum"] / income_data["alcever"]["count"]) * 100
-
-                # Reindex to ensure all categories are present, even if empty
-                income_order = [INCOME_MAP[k] for k in sorted(INCOME_MAP.keys())]
-                income_data_reindexed = income_data.set_index('income_label').reindex(income_order, fill_value=0).reset_index()
-                income_data_reindexed[("mjever", "percentage")] = income_data_reindexed[("mjever", "percentage")].fillna(0)
-                income_data_reindexed[("alcever", "percentage")] = income_data_reindexed[("alcever", "percentage")].fillna(0)
-
-                if not income_data_reindexed.empty:
-                    fig_income = go.Figure()
-                    fig_income.add_trace(go.Scatter(
-                        x=income_data_reindexed["income_label"],
-                        y=income_data_reindexed[("mjever", "percentage")],
-                        mode="lines+markers",
-                        name="Marijuana Use",
-                        line=dict(color="green")
-                    ))
-                    fig_income.add_trace(go.Scatter(
-                        x=income_data_reindexed["income_label"],
-                        y=income_data_reindexed[("alcever", "percentage")],
-                        mode="lines+markers",
-                        name="Alcohol Use",
-                        line=dict(color="red")
-                    ))
-                    fig_income.update_layout(
-                        title="Substance Use by Income Level",
-                        xaxis_title="Income Category",
-                        yaxis_title="Usage Rate (%)",
-                        xaxis=dict(categoryorder='array', categoryarray=income_order) # Ensure order
-                    )
-                    st.plotly_chart(fig_income, use_container_width=True)
-                else:
-                    st.info("No data for Income Level vs Substance Use in the filtered selection.")
-            else:
-                st.info("Column 'income_label' not found in the filtered dataset.")
-
-        with col2:
-            st.markdown("### Marijuana Use vs Poverty Level")
-            st.write("This scatter plot shows the relationship between marijuana use rate and poverty level, with the size of the points potentially indicating the alcohol use rate for that group.")
-            # Poverty level vs substance use - Use poverty3_label for x-axis
-            if "poverty3_label" in filtered_df_display.columns:
-                poverty_data = filtered_df_display.groupby("poverty3_label")[["mjever", "alcever"]].mean().reset_index()
-                poverty_data["mjever"] *= 100
-                poverty_data["alcever"] *= 100
-
-                # Reindex to ensure all categories are present, even if empty
-                poverty_order = [POVERTY_MAP[k] for k in sorted(POVERTY_MAP.keys())]
-                poverty_data_reindexed = poverty_data.set_index('poverty3_label').reindex(poverty_order, fill_value=0).reset_index()
-                poverty_data_reindexed["mjever"] = poverty_data_reindexed["mjever"].fillna(0)
-                poverty_data_reindexed["alcever"] = poverty_data_reindexed["alcever"].fillna(0)
-
-                if not poverty_data_reindexed.empty:
-                    fig_poverty = px.scatter(
-                        poverty_data_reindexed,
-                        x="poverty3_label",
-                        y="mjever",
-                        size="alcever",
-                        title="Marijuana Use vs Poverty Level",
-                        labels={"poverty3_label": "Poverty Level", "mjever": "Marijuana Use Rate (%)", "alcever": "Alcohol Use Rate (%)"},
-                        color="alcever",
-                        color_continuous_scale="viridis",
-                        category_orders={"poverty3_label": poverty_order}
-                    )
-                    st.plotly_chart(fig_poverty, use_container_width=True)
-                else:
-                    st.info("No data for Poverty Level vs Substance Use in the filtered selection.")
-            else:
-                st.info("Column 'poverty3_label' not found in the filtered dataset.")
-
-        # Employment status analysis
-        col1, col2 = st.columns(2)
-
-        with col1:
-            st.markdown("### Substance Use by Employment Status")
-            st.write("This chart illustrates marijuana and alcohol use rates based on employment status (employed, unemployed, not in labor force).")
-            # Employment status vs substance use - Use irwrkstat_label for x-axis
-            if "irwrkstat_label" in filtered_df_display.columns:
-                work_data = filtered_df_display.groupby("irwrkstat_label")[["mjever", "alcever"]].agg(["count", "sum"])
-                work_mj = (work_data["mjever"]["sum"] / work_data["mjever"]["count"]) * 100
-                work_alc = (work_data["alcever"]["sum"] / work_data["alcever"]["count"]) * 100
-
-                # Reindex to ensure all categories are present, even if empty
-                work_order = [WORK_MAP[k] for k in sorted(WORK_MAP.keys())]
-                work_mj_reindexed = work_mj.reindex(work_order, fill_value=0).fillna(0)
-                work_alc_reindexed = work_alc.reindex(work_order, fill_value=0).fillna(0)
-
-                if not work_mj_reindexed.empty or not work_alc_reindexed.empty:
-                    fig_work = go.Figure()
-                    fig_work.add_trace(go.Bar(
-                        x=work_mj_reindexed.index,
-                        y=work_mj_reindexed.values,
-                        name="Marijuana Use",
-                        marker_color="lightgreen"
-                    ))
-                    fig_work.add_trace(go.Bar(
-                        x=work_alc_reindexed.index,
-                        y=work_alc_reindexed.values,
-                        name="Alcohol Use",
-                        marker_color="lightcoral"
-                    ))
-                    fig_work.update_layout(
-                        title="Substance Use by Employment Status",
-                        xaxis_title="Employment Status",
-                        yaxis_title="Usage Rate (%)",
-                        barmode="group",
-                        xaxis=dict(categoryorder='array', categoryarray=work_order) # Ensure order
-                    )
-                    st.plotly_chart(fig_work, use_container_width=True)
-                else:
-                    st.info("No data for Employment Status vs Substance Use in the filtered selection.")
-            else:
-                st.info("Column 'irwrkstat_label' not found in the filtered dataset.")
-
-        with col2:
-            st.markdown("### Substance Use by Government Assistance")
-            st.write("This chart compares substance use rates between individuals who receive government assistance and those who do not.")
-            # Government assistance vs substance use - Use YES_NO_MAP for x-axis
-            if "govtprog" in filtered_df_display.columns:
-                # FIX: Added extra brackets to ensure column selection is a list
-                govt_data = filtered_df_display.groupby("govtprog")[["mjever", "alcever"]].agg(["count", "sum"])
-                govt_mj = (govt_data["mjever"]["sum"] / govt_data["mjever"]["count"]) * 100
-                govt_alc = (govt_data["alcever"]["sum"] / govt_data["alcever"]["count"]) * 100
-
-                # Reindex to ensure all categories (1 and 2) are present, even if empty
-                govt_order_codes = [1, 2] # 1: Yes, 2: No
-                govt_mj_reindexed = govt_mj.reindex(govt_order_codes, fill_value=0).fillna(0)
-                govt_alc_reindexed = govt_alc.reindex(govt_order_codes, fill_value=0).fillna(0)
-
-                # Map the indices to display labels for plotting
-                govt_labels = [YES_NO_MAP.get(idx, str(idx)) for idx in govt_mj_reindexed.index]
-
-                if not govt_mj_reindexed.empty or not govt_alc_reindexed.empty:
-                    fig_govt = go.Figure()
-                    fig_govt.add_trace(go.Bar(
-                        x=govt_labels,
-                        y=govt_mj_reindexed.values,
-                        name="Marijuana Use",
-                        marker_color="lightgreen"
-                    ))
-                    fig_govt.add_trace(go.Bar(
-                        x=govt_labels,
-                        y=govt_alc_reindexed.values,
-                        name="Alcohol Use",
-                        marker_color="lightcoral"
-                    ))
-                    fig_govt.update_layout(
-                        title="Substance Use by Government Assistance",
-                        xaxis_title="Government Assistance Status",
-                        yaxis_title="Usage Rate (%)",
-                        barmode="group",
-                        xaxis=dict(categoryorder='array', categoryarray=govt_labels) # Ensure order
-                    )
-                    st.plotly_chart(fig_govt, use_container_width=True)
-                else:
-                    st.info("No data for Government Assistance vs Substance Use in the filtered selection.")
-            else:
-                st.info("Column 'govtprog' not found in the filtered dataset.")
+        if tab5.open:
+            show_socioeconomic_tab(filtered_df_display, tab_figures("socioeconomic", cache_key, socioeconomic_figures, cube, selections))
 
-    # Tab 6: Treatment & Risk
     with tab6:
-        st.markdown('<h2 class="sub-header">🏥 Treatment & Risk Analysis</h2>', unsafe_allow_html=True)
-        st.markdown("This tab focuses on treatment-seeking behaviors and other risk factors.")
-
-        col1, col2 = st.columns(2)
-
-        with col1:
-            st.markdown("### Alcohol Treatment Seeking Behavior")
-            st.write("This pie chart shows the proportion of respondents who have sought treatment for alcohol use in the past year.")
-            # Treatment seeking behavior - Use txyralc_label for names
-            if "txyralc_label" in filtered_df_display.columns:
-                treatment_data = filtered_df_display["txyralc_label"].value_counts().reindex(["No", "Yes"], fill_value=0)
-                if not treatment_data.empty and treatment_data.sum() > 0:
-                    fig_treatment = px.pie(
-                        values=treatment_data.values,
-                        names=treatment_data.index,
-                        title="Alcohol Treatment Seeking Behavior",
-                        color_discrete_sequence=["#FFB6C1", "#FF69B4"]
-                    )
-                    st.plotly_chart(fig_treatment, use_container_width=True)
-                else:
-                    st.info("No data for Alcohol Treatment Seeking Behavior in the filtered selection.")
-            else:
-                st.info("Column 'txyralc_label' not found in the filtered dataset.")
-
-
-        with col2:
-            st.markdown("### Risk Behaviors and Consequences (Count of 'Yes')")
-            st.write("This bar chart displays the total count of individuals who reported engaging in specific risk behaviors related to substance use, such as driving under influence or experiencing dangerous situations.")
-            # Risk behaviors (drvinalco_label, alcpdang_label, alclimit_label)
-            risk_behaviors = []
-            risk_labels = []
-
-            # Sum 'Yes' (1) occurrences for each risk behavior
-            if "drvinalco" in filtered_df_display.columns:
-                risk_behaviors.append(filtered_df_display[filtered_df_display["drvinalco"] == 1].shape[0])
-                risk_labels.append("Drove Under Influence")
-
-            if "alcpdang" in filtered_df_display.columns:
-                # Assuming 'alcpdang' 1-4, where 1 is most dangerous.
-                # Let's count those who perceive it as dangerous (1 or 2)
-                # Or, if it's a binary 'Yes/No' like the PDF implies for the example, use that.
-                # The PDF example for alcpdang is "1=At parties, 2=Alone..." which is confusing.
-                # If it's a binary "Yes/No" for "alcohol caused dangerous situations",
-                # it should be mapped like other Yes/No. Assuming it's a binary flag (1=Yes, 2=No)
-                # based on the previous pie chart.
-                risk_behaviors.append(filtered_df_display[filtered_df_display["alcpdang"] == 1].shape[0])
-                risk_labels.append("Alcohol Caused Danger")
-
-
-            if "alclimit" in filtered_df_display.columns:
-                risk_behaviors.append(filtered_df_display[filtered_df_display["alclimit"] == 1].shape[0])
-                risk_labels.append("Tried to Limit Alcohol")
-
-            if risk_behaviors:
-                fig_risk = px.bar(
-                    x=risk_labels,
-                    y=risk_behaviors,
-                    title="Risk Behaviors and Consequences (Count of 'Yes')",
-                    labels={"x": "Risk Behavior", "y": "Number of Cases"},
-                    color=risk_behaviors,
-                    color_continuous_scale="reds"
-                )
-                fig_risk.update_xaxes(tickangle=45)
-                st.plotly_chart(fig_risk, use_container_width=True)
-            else:
-                st.info("No risk behavior data available in the filtered selection.")
-
-
-        # Age at first use analysis
-        col1, col2 = st.columns(2)
-
-        with col1:
-            st.markdown("### Age at First Marijuana Use vs Current Age Group")
-            st.write("This scatter plot visualizes the relationship between the age at which an individual first used marijuana and their current age group. The diagonal red line serves as a reference where first use age equals current age.")
-            # Age at first marijuana use vs current age (mjage is numerical)
-            if "mjage" in filtered_df_display.columns:
-                age_comparison = filtered_df_display[filtered_df_display["mjage"] > 0][["age2_label", "mjage"]]
-                if len(age_comparison) > 0:
-                    fig_age_comp = px.scatter(
-                        age_comparison,
-                        x="mjage",
-                        y="age2_label", # Use label for y-axis
-                        title="Age at First Marijuana Use vs Current Age Group",
-                        labels={"mjage": "Age at First Use", "age2_label": "Current Age Group"},
-                        opacity=0.6,
-                        category_orders={"age2_label": [AGE_MAP[k] for k in sorted(AGE_MAP.keys())]} # Ensure order
-                    )
-                    # Add diagonal reference line
-                    fig_age_comp.add_shape(
-                        type="line",
-                        x0=age_comparison["mjage"].min(),
-                        y0=age_comparison["mjage"].min(),
-                        x1=age_comparison["mjage"].max(),
-                        y1=age_comparison["mjage"].max(),
-                        line=dict(color="red", dash="dash")
-                    )
-                    st.plotly_chart(fig_age_comp, use_container_width=True)
-                else:
-                    st.info("No data for Age at First Marijuana Use vs Current Age Group in the filtered selection.")
-            else:
-                st.info("Column 'mjage' not found in the filtered dataset.")
-
-        with col2:
-            st.markdown("### Type of Treatment Received (Alcohol Only)")
-            st.write("This pie chart breaks down the types of treatment received, specifically for alcohol-only treatment versus mixed substance treatment.")
-            # Treatment type analysis - Use txalconly_label for names
-            if "txalconly_label" in filtered_df_display.columns:
-                tx_type_data = filtered_df_display["txalconly_label"].value_counts().reindex(["No", "Yes"], fill_value=0)
-                if not tx_type_data.empty and tx_type_data.sum() > 0:
-                    fig_tx_type = px.pie(
-                        values=tx_type_data.values,
-                        names=tx_type_data.index,
-                        title="Type of Treatment Received (Alcohol Only)",
-                        color_discrete_sequence=["#87CEEB", "#4682B4"]
-                    )
-                    st.plotly_chart(fig_tx_type, use_container_width=True)
-                else:
-                    st.info("No data for Type of Treatment Received (Alcohol Only) in the filtered selection.")
-            else:
-                st.info("Column 'txalconly_label' not found in the filtered dataset.")
+        if tab6.open:
+            show_treatment_tab(filtered_df_display, tab_figures("treatment", cache_key, treatment_figures, filtered_df_display, cube, selections))
 
     # Footer
     st.markdown("---")
@@ -0,0 +1,159 @@
+"""
+Process-wide cache of built dashboard charts, shared by all sessions.
+
+Entries are keyed by (chart id, normalized filter selection, dataset fingerprint), so
+every session that asks for the same chart of the same selection of the same data
+gets the figure built by the first one, without redoing the aggregation or the
+figure construction. The least recently used entries are evicted once the serialized
+size of the cached charts exceeds the byte budget.
+"""
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+import plotly.graph_objects as go
+import plotly.io
+import streamlit as st
+
+# Byte budget of the shared cache. Override with the NSDUH_FIGURE_CACHE_MB environment variable.
+FIGURE_CACHE_MB = int(os.environ.get("NSDUH_FIGURE_CACHE_MB", 64))
+
+
+def entry_nbytes(value):
+    """
+    Returns the size a cached value is accounted for: the length of a figure's JSON
+    spec (what is sent to the browser), or of any other value's pickle.
+    """
+    if value is None:
+        return 0
+    if isinstance(value, go.Figure):
+        return len(plotly.io.to_json(value, validate=False))
+    return len(pickle.dumps(value))
+
+
+class FigureCache:
+    """
+    Thread-safe LRU cache of built charts with a byte budget and hit/miss counters.
+
+    Cached figures are shared between sessions and must not be modified by callers.
+    The counters run from the creation of the cache until clear() or reset_stats();
+    the sidebar caption and the Performance panel report them as they are, and
+    load_test.py resets them before each load level.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.chart_hits = {}
+        self.chart_misses = {}
+
+    def _get(self, chart_id, key):
+        entry = self._entries.get((chart_id, key))
+        counts = self.chart_hits if entry is not None else self.chart_misses
+        counts[chart_id] = counts.get(chart_id, 0) + 1
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end((chart_id, key))
+        return entry
+
+    def _put(self, chart_id, key, value, nbytes):
+        if nbytes > self.max_bytes:
+            return
+        old = self._entries.pop((chart_id, key), None)
+        if old is not None:
+            self.nbytes -= old[1]
+        self._entries[(chart_id, key)] = (value, nbytes)
+        self.nbytes += nbytes
+        while self.nbytes > self.max_bytes:
+            _, (_, evicted_nbytes) = self._entries.popitem(last=False)
+            self.nbytes -= evicted_nbytes
+            self.evictions += 1
+
+    def get_or_build(self, chart_ids, key, build):
+        """
+        Returns the charts of one dashboard section, building them only if one of them
+        is not cached.
+
+        Args:
+            chart_ids (list): Ids of the section's charts.
+            key (tuple): Everything besides the chart id that determines the charts,
+                e.g. (normalized selection, dataset fingerprint).
+            build (callable): Returns {chart_id: value} for all chart_ids. A value
+                can be None (nothing to draw for this selection).
+
+        Returns:
+            dict: Chart id to cached or newly built value.
+        """
+        with self._lock:
+            cached = {chart_id: self._get(chart_id, key) for chart_id in chart_ids}
+        if all(entry is not None for entry in cached.values()):
+            return {chart_id: value for chart_id, (value, _) in cached.items()}
+
+        # Build outside the lock so sessions rendering other selections are not blocked.
+        built = build()
+        sizes = {chart_id: entry_nbytes(built[chart_id]) for chart_id in chart_ids if cached[chart_id] is None}
+        with self._lock:
+            for chart_id, nbytes in sizes.items():
+                self._put(chart_id, key, built[chart_id], nbytes)
+        return {chart_id: built[chart_id] if cached[chart_id] is None else cached[chart_id][0]
+                for chart_id in chart_ids}
+
+    def clear(self):
+        """
+        Drops every cached chart and resets the counters (see reset_stats).
+        """
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+            self._reset_stats()
+
+    def _reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.chart_hits = {}
+        self.chart_misses = {}
+
+    def reset_stats(self):
+        """
+        Resets the hit, miss and eviction counters, overall and per chart, keeping the
+        cached charts, so stats() describes only the lookups that follow.
+        """
+        with self._lock:
+            self._reset_stats()
+
+    def stats(self):
+        """
+        Returns the cache's counters since it was created, cleared or last had its
+        stats reset: 'hits', 'misses', 'hit_rate', 'evictions', 'entries', 'nbytes',
+        'max_bytes' and per-chart 'charts' {id: (hits, misses)}.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'nbytes': self.nbytes,
+                'max_bytes': self.max_bytes,
+                'charts': {chart_id: (self.chart_hits.get(chart_id, 0), self.chart_misses.get(chart_id, 0))
+                           for chart_id in sorted(set(self.chart_hits) | set(self.chart_misses))}
+            }
+
+
+@st.cache_resource
+def get_figure_cache():
+    """
+    Returns the figure cache shared by all sessions of this server process.
+    """
+    return FigureCache(FIGURE_CACHE_MB * 2**20)
@@ -0,0 +1,93 @@
+import numpy as np
+
+# Columns indexed for the sidebar filters. Any coded column can be added here.
+FILTER_COLUMNS = ['age2', 'eduhighcat', 'irwrkstat', 'irmaritstat', 'income', 'poverty3', 'govtprog']
+
+
+def build_filter_index(df, columns=FILTER_COLUMNS):
+    """
+    Builds a packed bitmap per (column, code) pair, one bit per row.
+
+    Args:
+        df (pd.DataFrame): The dataset.
+        columns (list): Coded columns to index; columns missing from df are skipped.
+
+    Returns:
+        dict: {'n_rows': int, 'columns': {column: {code: np.ndarray of uint8}},
+        'complete': {column: bool}}, where 'complete' tells whether every row of the
+        column has a code.
+    """
+    index = {'n_rows': len(df), 'columns': {}, 'complete': {}}
+    for col in columns:
+        if col not in df.columns:
+            continue
+        values = df[col].to_numpy()
+        missing = np.isnan(values) if values.dtype.kind == 'f' else np.zeros(len(values), dtype=bool)
+        codes = np.unique(values[~missing])
+        index['columns'][col] = {int(code): np.packbits(values == code) for code in codes}
+        index['complete'][col] = not missing.any()
+    return index
+
+
+def _restricts(index, col, codes):
+    # Selecting every code only leaves the rows unrestricted if none of them lacks a
+    # code; otherwise it still drops the rows whose code is missing, as `isin` does.
+    return bool(codes) and not (codes.issuperset(index['columns'][col]) and index['complete'][col])
+
+
+def filter_mask(index, selections):
+    """
+    Resolves a filter selection to a boolean row mask.
+
+    Codes selected within a column are OR-ed together and the columns are AND-ed, so
+    a row whose code is missing in a restricted column is dropped, as with `isin`
+    and as in the rate cube. A column with an empty selection does not restrict the
+    rows; neither does one with every code selected, unless the column has rows
+    without a code, which are then dropped.
+
+    Args:
+        index (dict): The index returned by build_filter_index.
+        selections (dict): Column name to list of selected codes.
+
+    Returns:
+        np.ndarray: Boolean mask with one entry per row.
+    """
+    n_rows = index['n_rows']
+    combined = None
+    for col, codes in selections.items():
+        bitmaps = index['columns'][col]
+        codes = {int(code) for code in codes}
+        if not _restricts(index, col, codes):
+            continue
+        column_bits = np.zeros((n_rows + 7) // 8, dtype=np.uint8)
+        for code in codes:
+            if code in bitmaps:
+                column_bits |= bitmaps[code]
+        if combined is None:
+            combined = column_bits
+        else:
+            combined &= column_bits
+    if combined is None:
+        return np.ones(n_rows, dtype=bool)
+    return np.unpackbits(combined, count=n_rows).view(bool)
+
+
+def normalize_selections(index, selections):
+    """
+    Returns a hashable form of a filter selection in which selections that resolve to
+    the same rows compare equal: codes are sorted and de-duplicated, and a column that
+    does not restrict the rows (see filter_mask) is dropped.
+
+    Args:
+        index (dict): The index returned by build_filter_index.
+        selections (dict): Column name to list of selected codes.
+
+    Returns:
+        tuple: ((column, (code, ...)), ...) sorted by column.
+    """
+    normalized = []
+    for col in sorted(selections):
+        codes = {int(code) for code in selections[col]}
+        if _restricts(index, col, codes):
+            normalized.append((col, tuple(sorted(codes))))
+    return tuple(normalized)
@@ -0,0 +1,255 @@
+"""
+Trains the substance-use models out of core, for datasets that do not fit in memory.
+
+The dataset file is streamed in chunks (see batch_scoring.iter_chunks) for a few
+epochs, and each shuffled chunk updates a logistic-loss SGDClassifier through
+partial_fit, so memory is bounded by the chunk size whatever the number of rows. The
+one-hot encoder is built from the fixed category vocabulary of the label maps
+(CATEGORY_VOCABULARY) instead of being fitted to the data, so it is complete before
+the first chunk is read. The result has the same 'preprocessor' and 'classifier'
+steps as model_store's pipelines and works with the Predictive Analysis page's
+prediction form and coefficient table unchanged.
+
+A fixed share of every chunk's rows is held out from training and scored at the end,
+like the 20% test split of model_store.train_model.
+
+Set NSDUH_STREAMING_TRAINING=1 to have the page train its missing models this way.
+
+Usage:
+    python incremental_model.py
+    python incremental_model.py --target mjever --data womens.parquet --chunksize 200000 --epochs 5
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.compose import ColumnTransformer
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import log_loss
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder
+
+from batch_scoring import iter_chunks
+from data_loader import LABEL_MAPS, compact_frame
+from instrumentation import span
+from model_store import (CATEGORICAL_FEATURES, FEATURES, NUMERICAL_FEATURES, TARGETS, get_model_path,
+                         save_model)
+
+# Train missing models by streaming the dataset file. Set NSDUH_STREAMING_TRAINING=1 to enable.
+STREAMING_TRAINING = os.environ.get("NSDUH_STREAMING_TRAINING", "0") == "1"
+
+# Survey codes the label maps do not name: parent in household "don't know" (3) and
+# "respondent is 18 or older" (4).
+UNLABELED_CODES = {'imother': [3, 4], 'ifather': [3, 4]}
+
+# Categories of every one-hot feature. Codes outside the vocabulary encode as all zeros.
+CATEGORY_VOCABULARY = {
+    feature: sorted(LABEL_MAPS[feature]) + UNLABELED_CODES.get(feature, [])
+    for feature in CATEGORICAL_FEATURES
+}
+
+INCREMENTAL_HYPERPARAMETERS = {
+    'loss': 'log_loss', 'alpha': 1e-4, 'learning_rate': 'adaptive', 'eta0': 0.01, 'average': True,
+    'random_state': 42
+}
+
+DEFAULT_CHUNKSIZE = 100_000
+DEFAULT_EPOCHS = 5
+HOLDOUT_FRACTION = 0.2
+
+
+def build_incremental_pipeline(hyperparameters=INCREMENTAL_HYPERPARAMETERS):
+    """
+    Builds the pipeline trained by train_incremental: the preprocessor, already fitted
+    to CATEGORY_VOCABULARY, and an unfitted SGDClassifier.
+    """
+    preprocessor = ColumnTransformer(
+        transformers=[
+            ('cat', OneHotEncoder(categories=[CATEGORY_VOCABULARY[feature] for feature in CATEGORICAL_FEATURES],
+                                  handle_unknown='ignore'), CATEGORICAL_FEATURES),
+            ('num', 'passthrough', NUMERICAL_FEATURES)
+        ],
+        remainder='passthrough'
+    )
+    # Fitting only checks the columns; a frame listing every category is enough.
+    n_rows = max(len(codes) for codes in CATEGORY_VOCABULARY.values())
+    vocabulary = pd.DataFrame({
+        feature: np.resize(CATEGORY_VOCABULARY[feature], n_rows) if feature in CATEGORY_VOCABULARY else np.zeros(n_rows)
+        for feature in FEATURES
+    })
+    preprocessor.fit(vocabulary)
+    return Pipeline(steps=[('preprocessor', preprocessor),
+                           ('classifier', SGDClassifier(**hyperparameters))])
+
+
+def target_classes(path, target, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Returns the sorted codes of the target column, read alone in one streaming pass.
+    """
+    classes = set()
+    for chunk in iter_chunks(path, chunksize, columns=[target]):
+        classes.update(chunk[target].dropna().unique().tolist())
+    return np.array(sorted(classes))
+
+
+def _model_chunks(path, target, chunksize, holdout_fraction, seed):
+    # Yields (chunk number, complete rows, holdout mask). The mask depends only on
+    # the chunk number, so every epoch holds out the same rows.
+    for chunk_number, chunk in enumerate(iter_chunks(path, chunksize, columns=FEATURES + [target])):
+        chunk = compact_frame(chunk.dropna())
+        rng = np.random.default_rng([seed, chunk_number])
+        yield chunk_number, chunk, rng.random(len(chunk)) < holdout_fraction
+
+
+def train_incremental(path, target, chunksize=DEFAULT_CHUNKSIZE, epochs=DEFAULT_EPOCHS,
+                      hyperparameters=INCREMENTAL_HYPERPARAMETERS, holdout_fraction=HOLDOUT_FRACTION, seed=0,
+                      report=None):
+    """
+    Trains a model on a CSV or Parquet file read chunk by chunk.
+
+    Args:
+        path (str): The dataset file.
+        target (str): Target variable, e.g. 'mjever'.
+        chunksize (int): Rows read and fitted at a time.
+        epochs (int): Passes over the file.
+        hyperparameters (dict): Keyword arguments for SGDClassifier.
+        holdout_fraction (float): Share of the rows kept out of training and scored.
+        seed (int): Seed of the holdout draw and of the shuffling.
+        report (callable, optional): Called with (epoch, rows fitted so far, seconds
+            elapsed) after each chunk.
+
+    Returns:
+        tuple: The fitted pipeline, and a dict with 'rows' (trained on),
+        'holdout_rows', 'holdout_accuracy', 'holdout_log_loss', 'epochs' and
+        'seconds'.
+    """
+    start = time.perf_counter()
+    classes = target_classes(path, target, chunksize)
+    if len(classes) < 2:
+        raise ValueError(f"The {target} column of {path} needs at least two codes to train on.")
+    model_pipeline = build_incremental_pipeline(hyperparameters)
+    preprocessor = model_pipeline.named_steps['preprocessor']
+    classifier = model_pipeline.named_steps['classifier']
+
+    rows = 0
+    for epoch in range(epochs):
+        for chunk_number, chunk, holdout in _model_chunks(path, target, chunksize, holdout_fraction, seed):
+            train = chunk[~holdout]
+            if train.empty:
+                continue
+            order = np.random.default_rng([seed, epoch, chunk_number]).permutation(len(train))
+            train = train.iloc[order]
+            classifier.partial_fit(preprocessor.transform(train[FEATURES]), train[target].to_numpy(), classes=classes)
+            rows += len(train)
+            if report:
+                report(epoch, rows, time.perf_counter() - start)
+    if rows == 0:
+        raise ValueError(f"No complete rows to train the {target} model on.")
+
+    holdout_rows = correct = 0
+    total_log_loss = 0.0
+    for _, chunk, holdout in _model_chunks(path, target, chunksize, holdout_fraction, seed):
+        test = chunk[holdout]
+        if test.empty:
+            continue
+        proba = model_pipeline.predict_proba(test[FEATURES])
+        y = test[target].to_numpy()
+        holdout_rows += len(test)
+        correct += int((classes[np.argmax(proba, axis=1)] == y).sum())
+        total_log_loss += log_loss(y, proba, labels=classes, normalize=False)
+    return model_pipeline, {
+        'rows': rows // epochs,
+        'holdout_rows': holdout_rows,
+        'holdout_accuracy': correct / holdout_rows if holdout_rows else None,
+        'holdout_log_loss': total_log_loss / holdout_rows if holdout_rows else None,
+        'epochs': epochs,
+        'seconds': time.perf_counter() - start
+    }
+
+
+def incremental_model_key(hyperparameters=INCREMENTAL_HYPERPARAMETERS, chunksize=DEFAULT_CHUNKSIZE,
+                          epochs=DEFAULT_EPOCHS):
+    """
+    Returns the settings a streamed model is stored under in the model store, in place
+    of model_store's LogisticRegression hyperparameters.
+    """
+    return {'estimator': 'SGDClassifier', **hyperparameters, 'chunksize': chunksize, 'epochs': epochs,
+            'holdout_fraction': HOLDOUT_FRACTION}
+
+
+def train_and_store_incremental(path, target, dataset_sha256, chunksize=DEFAULT_CHUNKSIZE, epochs=DEFAULT_EPOCHS):
+    """
+    Trains a model with train_incremental and writes it to the model store.
+
+    Returns:
+        tuple: The fitted pipeline, train_incremental's statistics and the model file.
+    """
+    settings = incremental_model_key(chunksize=chunksize, epochs=epochs)
+    model_pipeline, stats = train_incremental(path, target, chunksize, epochs)
+    model_path = get_model_path(target, dataset_sha256, settings)
+    save_model(model_pipeline, model_path, {
+        'target': target,
+        'features': FEATURES,
+        'dataset_sha256': dataset_sha256,
+        'hyperparameters': settings,
+        'sklearn_version': sklearn.__version__,
+        'trained_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'training_seconds': stats['seconds'],
+        'holdout': stats
+    })
+    return model_pipeline, stats, model_path
+
+
+def load_or_train_incremental(path, target, dataset_sha256, chunksize=DEFAULT_CHUNKSIZE, epochs=DEFAULT_EPOCHS):
+    """
+    Loads the stored streamed model for this target and dataset, training and storing
+    it first if it does not exist yet.
+
+    Args:
+        path (str): The dataset file.
+        target (str): Target variable, e.g. 'mjever'.
+        dataset_sha256 (str): Content hash of the dataset file.
+        chunksize (int): Rows read and fitted at a time.
+        epochs (int): Passes over the file.
+
+    Returns:
+        Pipeline: The fitted pipeline.
+    """
+    import joblib
+
+    model_path = get_model_path(target, dataset_sha256, incremental_model_key(chunksize=chunksize, epochs=epochs))
+    if os.path.exists(model_path):
+        with span("model.load"):
+            return joblib.load(model_path)['pipeline']
+    with span("model.fit"):
+        try:
+            return train_and_store_incremental(path, target, dataset_sha256, chunksize, epochs)[0]
+        except OSError:
+            # Without a writable model directory the model is simply retrained next time.
+            return train_incremental(path, target, chunksize, epochs)[0]
+
+
+def main():
+    from data_loader import DATA_PATH, file_fingerprint
+
+    parser = argparse.ArgumentParser(description="Train the substance-use models by streaming the dataset in chunks.")
+    parser.add_argument("--target", nargs="+", default=TARGETS, choices=TARGETS)
+    parser.add_argument("--data", default=DATA_PATH, help="Dataset CSV or Parquet file (default: DATA_PATH)")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument("--epochs", type=int, default=DEFAULT_EPOCHS)
+    args = parser.parse_args()
+
+    dataset_sha256 = file_fingerprint(args.data)['sha256']
+    for target in args.target:
+        _, stats, model_path = train_and_store_incremental(args.data, target, dataset_sha256, args.chunksize,
+                                                           args.epochs)
+        print(f"{target}: {stats['rows']:,} rows x {stats['epochs']} epochs in {stats['seconds']:.2f}s; "
+              f"holdout accuracy {stats['holdout_accuracy']:.3f}, log loss {stats['holdout_log_loss']:.4f} "
+              f"on {stats['holdout_rows']:,} rows; stored {model_path}")
+
+
+if __name__ == "__main__":
+    main()
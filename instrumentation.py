@@ -0,0 +1,161 @@
+"""
+Timing and memory spans of the dashboard's hot paths, collected per rerun.
+
+A stage is timed by running it inside `with span("name"):`, or by decorating its
+function with @traced("name"). Spans are recorded only while app.py has a rerun open
+(start_rerun ... finish_rerun) and instrumentation is enabled, so the data and model
+modules stay instrumented when run from benchmark.py or the command-line tools, at the
+cost of one flag check per span. Spans nest; each records its wall time, the change
+in the process's resident memory and, if tracemalloc is tracing (PYTHONTRACEMALLOC=1),
+the change in traced Python allocations.
+
+Set NSDUH_PERF_PANEL=1 to show the spans of the last rerun in a sidebar "Performance"
+panel, and NSDUH_PERF_LOG to a file path to append every rerun to it as a JSON line.
+"""
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+# Show the sidebar Performance panel. Set NSDUH_PERF_PANEL=1 to enable.
+PERF_PANEL = os.environ.get("NSDUH_PERF_PANEL", "0") == "1"
+
+# JSON lines file every rerun's spans are appended to. Set NSDUH_PERF_LOG to enable.
+PERF_LOG = os.environ.get("NSDUH_PERF_LOG")
+
+ENABLED = PERF_PANEL or bool(PERF_LOG)
+
+_NO_SPAN = nullcontext()
+_local = threading.local()
+_log_lock = threading.Lock()
+
+
+def _rss_mb():
+    # Resident memory of this process (Linux); NaN where /proc is not available.
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return float("nan")
+
+
+def _traced_mb():
+    return tracemalloc.get_traced_memory()[0] / 2 ** 20 if tracemalloc.is_tracing() else None
+
+
+@contextmanager
+def _recorded_span(rerun, name):
+    record = {'name': name, 'depth': rerun['depth']}
+    rerun['spans'].append(record)
+    rerun['depth'] += 1
+    rss, traced = _rss_mb(), _traced_mb()
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['ms'] = (time.perf_counter() - start) * 1000
+        record['rss_mb'] = _rss_mb() - rss
+        if traced is not None:
+            record['alloc_mb'] = _traced_mb() - traced
+        rerun['depth'] -= 1
+
+
+def span(name):
+    """
+    Returns a context manager recording the time and memory of the code it wraps as a
+    span of the current rerun; a no-op when instrumentation is disabled or no rerun
+    is open in this thread.
+
+    Args:
+        name (str): Stage name, e.g. 'filters' or 'marijuana.tables'.
+    """
+    if not ENABLED:
+        return _NO_SPAN
+    rerun = getattr(_local, 'rerun', None)
+    if rerun is None:
+        return _NO_SPAN
+    return _recorded_span(rerun, name)
+
+
+def traced(name):
+    """
+    Decorator recording every call of a function as a span (see span).
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return function(*args, **kwargs)
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def start_rerun(page):
+    """
+    Opens the span record of a rerun of the app in this thread, if enabled.
+
+    Args:
+        page (str): Session page id being rendered.
+    """
+    if not ENABLED:
+        return
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    _local.rerun = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'session': ctx.session_id if ctx else None,
+                    'page': page, 'spans': [], 'depth': 0, 'start': time.perf_counter()}
+
+
+def finish_rerun():
+    """
+    Closes the current rerun's record and appends it to PERF_LOG.
+
+    Returns:
+        dict: 'timestamp', 'session', 'page', 'total_ms', 'rss_mb' (resident memory
+        of the process at the end) and 'spans' (one dict per span, in start order,
+        with 'name', 'depth', 'ms', 'rss_mb' and, if tracing, 'alloc_mb'); None if
+        no rerun was open.
+    """
+    rerun = getattr(_local, 'rerun', None)
+    if rerun is None:
+        return None
+    _local.rerun = None
+    record = {key: rerun[key] for key in ('timestamp', 'session', 'page')}
+    record.update({'total_ms': (time.perf_counter() - rerun['start']) * 1000, 'rss_mb': _rss_mb(),
+                   'spans': rerun['spans']})
+    if PERF_LOG:
+        line = json.dumps(record, default=float) + "\n"
+        with _log_lock, open(PERF_LOG, "a") as f:
+            f.write(line)
+    return record
+
+
+def show_performance_panel(record):
+    """
+    Shows a rerun's spans in a collapsible sidebar panel, with the chart cache's
+    counters (figure_cache.FigureCache.stats, which the panel never resets).
+    """
+    import pandas as pd
+    import streamlit as st
+
+    from figure_cache import get_figure_cache
+
+    cache_stats = get_figure_cache().stats()
+    with st.sidebar.expander("⏱️ Performance"):
+        st.caption(f"Last rerun of the {record['page']} page: {record['total_ms']:.0f} ms, "
+                   f"{record['rss_mb']:.0f} MB resident")
+        st.caption(f"Chart cache since start: {cache_stats['hits']:,} hits, {cache_stats['misses']:,} misses, "
+                   f"{cache_stats['evictions']:,} evictions")
+        if record['spans']:
+            spans = pd.DataFrame({
+                'Stage': [" " * s['depth'] + s['name'] for s in record['spans']],
+                'ms': [s['ms'] for s in record['spans']],
+                'RSS Δ MB': [s['rss_mb'] for s in record['spans']],
+                **({'Alloc Δ MB': [s.get('alloc_mb') for s in record['spans']]} if tracemalloc.is_tracing() else {})
+            })
+            st.dataframe(spans.round(2), hide_index=True, use_container_width=True)
@@ -0,0 +1,343 @@
+"""
+Load-tests the app with simulated concurrent analysts, locally and without a browser.
+
+Every simulated session is a streamlit.testing AppTest session of app.py driven from
+its own thread, all in one process like the sessions of one server: they share the
+process's caches (the loaded dataset, the models, the chart cache) and its memory.
+Starting on the Home page, a session repeats JOURNEY: it opens the Descriptive
+Analysis page, changes sidebar filters and switches tabs, moves to the Predictive
+Analysis page, toggles the Marijuana/Alcohol radio, submits predictions with changed
+inputs and goes back Home. Every rerun is timed. AppTest keeps its mock runtime in
+process-wide state, so reruns run one at a time (_RUN_LOCK); a rerun's latency
+includes the time it waited for the reruns of other sessions, as on a server whose
+interpreter they share.
+
+For each number of sessions the report gives the rerun latency percentiles, the
+throughput (reruns per second over all sessions), the peak resident memory of the
+process, the chart cache's hit rate over the level's reruns and three kinds of
+problems, counted apart:
+
+- errors: reruns the harness could not complete (a timeout or a failure of the
+  AppTest driver), i.e. failures of the load test itself;
+- app errors: reruns that completed but showed an exception or an st.error message,
+  which the app also shows to a single user when it is broken;
+- skipped steps: steps whose widget is not on the page (e.g. the prediction form of
+  a page that failed to render); the session goes on with the next step.
+
+One warm-up journey runs first, so the levels measure a server whose models and
+caches are built; --cold skips it.
+
+The command exits with status 1 when a level has more errors than --max-errors, more
+app errors than --max-app-errors (if given) or exceeds --max-p95-ms or --max-p99-ms,
+so it can gate a release.
+
+Usage:
+    python load_test.py
+    python load_test.py --sessions 1 5 10 20 --rounds 3 --think-ms 500
+    python load_test.py --sessions 10 --max-p95-ms 2000 --max-p99-ms 5000 --json load.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+# Seconds a single rerun may take before it counts as failed.
+RERUN_TIMEOUT = 600
+
+_RUN_LOCK = threading.Lock()
+
+# Sidebar navigation names of app.py's PAGES, by session page id.
+PAGE_NAMES = {'statistical': "Descriptive Analysis", 'predictive': "Predictive Analysis"}
+
+# "Back to Home" buttons of the pages.
+HOME_BUTTONS = {'statistical': "back_to_home_sidebar", 'predictive': "back_to_home_pred_page"}
+
+# Tabs of the Descriptive Analysis page (its viz_tab widget).
+TABS = ["📊 Overview", "🌿 Marijuana Analysis", "🍷 Alcohol Analysis", "👥 Social Factors",
+        "💰 Socioeconomic Impact", "🏥 Treatment & Risk"]
+
+# One round of a simulated analyst's interactions; every step is one rerun.
+JOURNEY = ['descriptive', 'filter', 'tab', 'filter', 'tab', 'predictive', 'substance', 'predict', 'substance',
+           'predict', 'home']
+
+
+def _open_page(at, page_id):
+    if at.session_state['page'] == 'home':
+        # What the Home page's navigation buttons do.
+        at.session_state['page'] = page_id
+    else:
+        at.sidebar.radio[0].set_value(PAGE_NAMES[page_id])
+
+
+def _change_filter(at, rng, all_codes):
+    multiselect = rng.choice(list(at.sidebar.multiselect))
+    # A filter's codes are all selected when the page first renders it.
+    codes = all_codes.setdefault(multiselect.label, list(multiselect.value))
+    multiselect.set_value(sorted(rng.sample(codes, rng.randint(1, len(codes)))))
+
+
+def _toggle_substance(at):
+    radio = at.radio(key='substance_selection')
+    radio.set_value('Alcohol Use' if radio.value == 'Marijuana Use' else 'Marijuana Use')
+
+
+def _submit_prediction(at, rng):
+    selectbox = rng.choice(list(at.selectbox))
+    selectbox.select_index(rng.randrange(len(selectbox.options)))
+    next(button for button in at.button if button.label.startswith("Predict")).click()
+
+
+def prepare_step(at, step, rng, all_codes):
+    """
+    Makes the widget changes of one JOURNEY step on a session; the caller reruns it.
+
+    Raises:
+        LookupError: If a widget the step needs is not on the page.
+    """
+    try:
+        if step == 'descriptive':
+            _open_page(at, 'statistical')
+        elif step == 'predictive':
+            _open_page(at, 'predictive')
+        elif step == 'filter':
+            _change_filter(at, rng, all_codes)
+        elif step == 'tab':
+            at.session_state['viz_tab'] = rng.choice(TABS)
+        elif step == 'substance':
+            _toggle_substance(at)
+        elif step == 'predict':
+            _submit_prediction(at, rng)
+        elif step == 'home':
+            at.button(key=HOME_BUTTONS[at.session_state['page']]).click()
+        else:
+            raise ValueError(f"Unknown journey step {step!r}")
+    except (IndexError, KeyError, StopIteration) as e:
+        raise LookupError(f"{step}: widget not found ({type(e).__name__}: {e})") from e
+
+
+def run_session(seed, rounds=1, think_ms=0.0, start=None):
+    """
+    Simulates one analyst: opens the app and walks JOURNEY `rounds` times.
+
+    Args:
+        seed (int): Seed of the session's random choices.
+        rounds (int): Journeys walked.
+        think_ms (float): Mean pause before each interaction, drawn uniformly between
+            half and one and a half times this.
+        start (threading.Barrier, optional): Waited on before opening the app, so the
+            sessions of a level start together.
+
+    Returns:
+        list: One dict per step with 'step', 'ms' (None if the step was skipped),
+        'error' (a harness failure), 'app_error' (the first exception or error
+        message the page showed) and 'skipped' (why the step could not be made);
+        the last three are None when they do not apply.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(seed)
+    at = AppTest.from_file(APP_PATH, default_timeout=RERUN_TIMEOUT)
+    all_codes = {}
+    samples = []
+
+    def sample(step, ms=None, error=None, app_error=None, skipped=None):
+        samples.append({'step': step, 'ms': ms, 'error': error, 'app_error': app_error, 'skipped': skipped})
+
+    def rerun(step):
+        began = time.perf_counter()
+        try:
+            with _RUN_LOCK:
+                at.run()
+        except Exception as e:  # a timeout, or a failure of the test driver itself
+            sample(step, (time.perf_counter() - began) * 1000, error=f"{type(e).__name__}: {e}"[:200])
+            return
+        errors = [str(exception.value) for exception in at.exception] + [str(error.value) for error in at.error]
+        sample(step, (time.perf_counter() - began) * 1000, app_error=errors[0][:200] if errors else None)
+
+    if start is not None:
+        start.wait()
+    rerun('open')
+    for _ in range(rounds):
+        for step in JOURNEY:
+            if think_ms:
+                time.sleep(rng.uniform(0.5, 1.5) * think_ms / 1000)
+            try:
+                prepare_step(at, step, rng, all_codes)
+            except LookupError as e:
+                sample(step, skipped=str(e))
+                continue
+            rerun(step)
+    return samples
+
+
+def _rss_mb():
+    # Resident memory of this process (Linux); NaN where /proc is not available.
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return float("nan")
+
+
+def latency_summary(samples):
+    """
+    Returns the count and p50, p95, p99 and maximum latency in ms of the timed reruns
+    among samples.
+    """
+    latencies = [sample['ms'] for sample in samples if sample['ms'] is not None]
+    if not latencies:
+        return {'reruns': 0, 'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'max_ms': None}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {'reruns': len(latencies), 'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99),
+            'max_ms': float(max(latencies))}
+
+
+def load_level(sessions, rounds=1, think_ms=0.0, seed=0):
+    """
+    Runs `sessions` concurrent sessions (see run_session) and summarizes their reruns.
+
+    Returns:
+        tuple: A dict with 'sessions', the latency_summary fields, 'errors',
+        'app_errors', 'skipped', 'throughput' (reruns per second), 'seconds',
+        'peak_rss_mb' and
+        'chart_cache' (the chart cache's stats over this level's reruns); and the
+        list of every session's samples.
+    """
+    from figure_cache import get_figure_cache
+
+    # Charts cached by earlier levels stay, but only this level's lookups are counted.
+    figure_cache = get_figure_cache()
+    figure_cache.reset_stats()
+    results = [None] * sessions
+    start = threading.Barrier(sessions)
+
+    def session(number):
+        results[number] = run_session(seed * 1000 + number, rounds, think_ms, start)
+
+    peak_rss = [_rss_mb()]
+    done = threading.Event()
+
+    def sample_memory():
+        while not done.wait(0.05):
+            peak_rss[0] = max(peak_rss[0], _rss_mb())
+
+    sampler = threading.Thread(target=sample_memory, daemon=True)
+    sampler.start()
+    threads = [threading.Thread(target=session, args=(number,)) for number in range(sessions)]
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - began
+    done.set()
+    sampler.join()
+
+    samples = [sample for session_samples in results for sample in session_samples]
+    summary = latency_summary(samples)
+    return {
+        'sessions': sessions,
+        **summary,
+        'errors': sum(sample['error'] is not None for sample in samples),
+        'app_errors': sum(sample['app_error'] is not None for sample in samples),
+        'skipped': sum(sample['skipped'] is not None for sample in samples),
+        'throughput': summary['reruns'] / seconds,
+        'seconds': seconds,
+        'peak_rss_mb': max(peak_rss[0], _rss_mb()),
+        'chart_cache': figure_cache.stats()
+    }, samples
+
+
+def _format(value, digits=0):
+    return "-" if value is None else f"{value:,.{digits}f}"
+
+
+def main():
+    import streamlit.config
+    import streamlit.logger
+
+    parser = argparse.ArgumentParser(description="Load-test the app with simulated concurrent sessions.")
+    parser.add_argument("--sessions", nargs="+", type=int, default=[1, 5, 10, 20],
+                        help="Numbers of concurrent sessions to run, one level each")
+    parser.add_argument("--rounds", type=int, default=2, help="Journeys walked by every session")
+    parser.add_argument("--think-ms", type=float, default=0.0,
+                        help="Mean pause before each interaction (default: none, as fast as possible)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cold", action="store_true", help="Skip the warm-up journey")
+    parser.add_argument("--max-errors", type=int, default=0,
+                        help="Reruns the harness could not complete allowed per level")
+    parser.add_argument("--max-app-errors", type=int,
+                        help="Fail if a level has more reruns showing an app exception or error message")
+    parser.add_argument("--max-p95-ms", type=float, help="Fail if a level's p95 rerun latency exceeds this")
+    parser.add_argument("--max-p99-ms", type=float, help="Fail if a level's p99 rerun latency exceeds this")
+    parser.add_argument("--json", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    # Failed reruns are counted and summarized below instead of logged one by one.
+    streamlit.config.set_option("logger.level", "critical")
+    streamlit.logger.set_log_level("critical")
+
+    results = {'meta': {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'rounds': args.rounds,
+                        'think_ms': args.think_ms, 'seed': args.seed, 'journey': JOURNEY}, 'levels': []}
+    if not args.cold:
+        began = time.perf_counter()
+        run_session(-1)
+        results['meta']['warmup_seconds'] = time.perf_counter() - began
+        print(f"Warm-up journey: {results['meta']['warmup_seconds']:.1f}s")
+
+    print(f"{'sessions':>8} {'reruns':>7} {'errors':>6} {'app_err':>7} {'skipped':>7} {'p50_ms':>8} {'p95_ms':>8} "
+          f"{'p99_ms':>8} {'max_ms':>8} {'reruns/s':>8} {'rss_mb':>7} {'cache_hit':>9}")
+    failures = []
+    for sessions in args.sessions:
+        level, samples = load_level(sessions, args.rounds, args.think_ms, args.seed)
+        by_step = {}
+        for sample in samples:
+            by_step.setdefault(sample['step'], []).append(sample)
+        level['steps'] = {step: latency_summary(step_samples) for step, step_samples in by_step.items()}
+        for kind in ('error', 'app_error', 'skipped'):
+            level[f'{kind}_messages'] = Counter(sample[kind] for sample in samples if sample[kind]).most_common()
+        results['levels'].append(level)
+        print(f"{sessions:>8} {level['reruns']:>7} {level['errors']:>6} {level['app_errors']:>7} "
+              f"{level['skipped']:>7} {_format(level['p50_ms']):>8} "
+              f"{_format(level['p95_ms']):>8} {_format(level['p99_ms']):>8} {_format(level['max_ms']):>8} "
+              f"{level['throughput']:>8.2f} {level['peak_rss_mb']:>7.0f} {level['chart_cache']['hit_rate']:>9.0%}")
+
+        if level['errors'] > args.max_errors:
+            failures.append(f"{sessions} sessions: {level['errors']} failed reruns (allowed {args.max_errors})")
+        if args.max_app_errors is not None and level['app_errors'] > args.max_app_errors:
+            failures.append(f"{sessions} sessions: {level['app_errors']} reruns with app errors "
+                            f"(allowed {args.max_app_errors})")
+        for limit, key in ((args.max_p95_ms, 'p95_ms'), (args.max_p99_ms, 'p99_ms')):
+            if limit is not None and level[key] is not None and level[key] > limit:
+                failures.append(f"{sessions} sessions: {key} {level[key]:.0f} > {limit:.0f}")
+
+    largest = results['levels'][-1]
+    print(f"\nRerun latency by step at {largest['sessions']} sessions:")
+    for step, summary in largest['steps'].items():
+        print(f"  {step:<12} {summary['reruns']:>5} reruns  p50 {_format(summary['p50_ms']):>7} ms  "
+              f"p95 {_format(summary['p95_ms']):>7} ms  p99 {_format(summary['p99_ms']):>7} ms")
+    for kind, label in (('error', 'harness error'), ('app_error', 'app error'), ('skipped', 'skipped')):
+        messages = Counter()
+        for level in results['levels']:
+            messages.update(dict(level[f'{kind}_messages']))
+        for message, count in messages.most_common(5):
+            print(f"  {label} x{count}: {message}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if failures:
+        print("\nFAILED:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
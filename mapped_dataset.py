@@ -0,0 +1,198 @@
+"""
+Stores the loaded dataset as memory-mappable files, so every server process on a host
+shares one copy of it through the OS page cache.
+
+When the app is scaled out to several Streamlit processes, each one otherwise parses
+the dataset, decodes its display labels and builds its filter bitmaps into private
+memory. write_mapped_dataset saves all three once into a directory of uncompressed
+NumPy .npy files: one per data column, the integer codes of every `<column>_label`
+Categorical (the categories go in the manifest), and one packed bitmap array per
+filter column. open_mapped_dataset maps the files read-only and wraps DataFrames and
+a filter index around them without copying, so pages are read from disk on first
+access and then shared by every process mapping the same files.
+
+Set NSDUH_MAPPED_DATASET to the directory to have data_loader serve it instead of
+loading DATA_PATH. The directory is a snapshot; rebuild it when the dataset changes.
+
+Usage:
+    python mapped_dataset.py
+    python mapped_dataset.py --data womens.parquet --out /srv/nsduh/womens-mapped
+"""
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from filter_index import build_filter_index
+
+# Bump when the directory layout changes; directories of another version are refused.
+MAPPED_VERSION = 2
+
+MANIFEST = "manifest.json"
+
+# Nullable column arrays, stored as their values and their missing-value mask.
+MASKED_ARRAYS = (pd.arrays.IntegerArray, pd.arrays.FloatingArray, pd.arrays.BooleanArray)
+
+
+def get_mapped_path(data_path):
+    """
+    Returns the default mapped dataset directory of a dataset file, next to it.
+    """
+    return os.path.splitext(data_path)[0] + "-mapped"
+
+
+def _column_arrays(series):
+    # Returns the manifest entry of a column and its arrays by file suffix.
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return ({'kind': 'categorical', 'categories': series.cat.categories.tolist(),
+                 'ordered': bool(series.cat.ordered)},
+                {'': series.array._ndarray})
+    if isinstance(series.array, MASKED_ARRAYS):
+        return {'kind': 'masked', 'dtype': str(series.dtype)}, {'': series.array._data, '.mask': series.array._mask}
+    if isinstance(series.dtype, np.dtype) and series.dtype.kind in 'biufmM':
+        return {'kind': 'numpy'}, {'': series.to_numpy()}
+    raise ValueError(f"Column {series.name!r} of type {series.dtype} cannot be memory-mapped.")
+
+
+def _column_from_arrays(entry, arrays):
+    # Rebuilds a column around its mapped arrays without copying them.
+    if entry['kind'] == 'categorical':
+        dtype = pd.CategoricalDtype(entry['categories'], ordered=entry['ordered'])
+        return pd.Categorical.from_codes(arrays[''], dtype=dtype, validate=False)
+    if entry['kind'] == 'masked':
+        return pd.api.types.pandas_dtype(entry['dtype']).construct_array_type()(arrays[''], arrays['.mask'],
+                                                                                copy=False)
+    return arrays['']
+
+
+def write_mapped_dataset(display, directory, data_columns, filter_index=None, source=None):
+    """
+    Writes a dataset to a mapped dataset directory, replacing any previous one.
+
+    The files are written to a temporary directory first and swapped in by renaming,
+    so processes opening the directory never see it half written; processes that
+    already mapped the previous files keep reading them.
+
+    Args:
+        display (pd.DataFrame): The dataset with its display label columns (see
+            data_loader.apply_display_mappings).
+        directory (str): The directory to write.
+        data_columns (list): The columns of display that make up the dataset itself.
+        filter_index (dict, optional): The sidebar filter bitmaps; built from display
+            if not given.
+        source (dict, optional): Fingerprint of the file the dataset was read from
+            (see data_loader.file_fingerprint), recorded in the manifest.
+
+    Returns:
+        dict: The manifest.
+    """
+    if filter_index is None:
+        filter_index = build_filter_index(display[data_columns])
+    tmp_path = f"{directory}.{os.getpid()}.tmp"
+    os.makedirs(tmp_path)
+    try:
+        manifest = {'version': MAPPED_VERSION, 'n_rows': len(display), 'source': source,
+                    'data_columns': list(data_columns), 'columns': {}, 'filters': {}}
+        for number, col in enumerate(display.columns):
+            entry, arrays = _column_arrays(display[col])
+            entry['file'] = f"column-{number}"
+            for suffix, array in arrays.items():
+                np.save(os.path.join(tmp_path, f"{entry['file']}{suffix}.npy"), np.ascontiguousarray(array))
+            manifest['columns'][col] = entry
+        for number, (col, bitmaps) in enumerate(filter_index['columns'].items()):
+            codes = sorted(bitmaps)
+            manifest['filters'][col] = {'file': f"filter-{number}", 'codes': codes,
+                                        'complete': filter_index['complete'][col]}
+            bits = np.stack([bitmaps[code] for code in codes]) if codes else \
+                np.zeros((0, (len(display) + 7) // 8), dtype=np.uint8)
+            np.save(os.path.join(tmp_path, f"filter-{number}.npy"), bits)
+        with open(os.path.join(tmp_path, MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+        old_path = f"{directory}.{os.getpid()}.old"
+        if os.path.exists(directory):
+            os.rename(directory, old_path)
+        os.rename(tmp_path, directory)
+        shutil.rmtree(old_path, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    return manifest
+
+
+def open_mapped_dataset(directory):
+    """
+    Maps a directory written by write_mapped_dataset.
+
+    Args:
+        directory (str): The mapped dataset directory.
+
+    Returns:
+        dict: 'data' (the dataset), 'display' (the dataset with its label columns,
+        sharing the same arrays), 'filter_index' (as build_filter_index returns it)
+        and 'source' (the fingerprint recorded by write_mapped_dataset). All arrays
+        are read-only memory maps.
+    """
+    with open(os.path.join(directory, MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest.get('version') != MAPPED_VERSION:
+        raise ValueError(f"{directory} is a version {manifest.get('version')} mapped dataset; rebuild it "
+                         f"with mapped_dataset.py (version {MAPPED_VERSION}).")
+
+    def load(name):
+        return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r').view(np.ndarray)
+
+    columns = {}
+    for col, entry in manifest['columns'].items():
+        suffixes = ['', '.mask'] if entry['kind'] == 'masked' else ['']
+        columns[col] = _column_from_arrays(entry, {suffix: load(entry['file'] + suffix) for suffix in suffixes})
+    index = pd.RangeIndex(manifest['n_rows'])
+    filter_index = {'n_rows': manifest['n_rows'], 'columns': {}, 'complete': {}}
+    for col, entry in manifest['filters'].items():
+        bits = load(entry['file'])
+        filter_index['columns'][col] = {code: bits[row] for row, code in enumerate(entry['codes'])}
+        filter_index['complete'][col] = entry['complete']
+    return {
+        'data': pd.DataFrame({col: columns[col] for col in manifest['data_columns']}, index=index, copy=False),
+        'display': pd.DataFrame(columns, index=index, copy=False),
+        'filter_index': filter_index,
+        'source': manifest['source']
+    }
+
+
+def build_mapped_dataset(data_path, directory):
+    """
+    Reads a dataset file (see data_loader.read_dataset), decodes its display labels,
+    builds its filter index and writes them to a mapped dataset directory.
+
+    Returns:
+        dict: The manifest.
+    """
+    from data_loader import apply_display_mappings, file_fingerprint, read_dataset
+
+    df = read_dataset(data_path)
+    return write_mapped_dataset(apply_display_mappings(df), directory, list(df.columns), build_filter_index(df),
+                                file_fingerprint(data_path))
+
+
+def main():
+    from data_loader import DATA_PATH
+
+    parser = argparse.ArgumentParser(description="Write the dataset as memory-mappable files shared by server processes.")
+    parser.add_argument("--data", default=DATA_PATH, help="Dataset CSV or Parquet file (default: DATA_PATH)")
+    parser.add_argument("--out", help="Directory to write (default: next to the dataset, with a -mapped suffix)")
+    args = parser.parse_args()
+
+    directory = args.out or get_mapped_path(args.data)
+    manifest = build_mapped_dataset(args.data, directory)
+    size = sum(entry.stat().st_size for entry in os.scandir(directory))
+    print(f"Wrote {manifest['n_rows']:,} rows, {len(manifest['columns'])} columns and "
+          f"{len(manifest['filters'])} filter indexes to {directory} ({size / 2 ** 20:.1f} MB)")
+    print(f"Serve it with NSDUH_MAPPED_DATASET={directory}")
+
+
+if __name__ == "__main__":
+    main()
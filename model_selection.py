@@ -0,0 +1,283 @@
+"""
+Selects the hyperparameters of the substance-use models by stratified k-fold
+cross-validation, offline, and stores the winning pipeline in the model store.
+
+Every candidate is a LogisticRegression solver and penalty (SEARCH_SPACE) combined
+with a regularization strength from C_GRID. The one-hot design matrix of each fold is
+encoded once and shared by all candidates, and each (fold, solver, penalty) task fits
+the C values in increasing order with warm starts, so every fit starts from the
+coefficients of the previous, more regularized one. Tasks run in a process pool.
+
+Candidates are ranked by mean validation log loss, which scores the probabilities
+shown on the Predictive Analysis page and works for mjever's three classes. A
+candidate that cannot fit the data (e.g. liblinear on a multiclass target) is
+reported and skipped. The winner is trained like any stored model (see
+model_store.train_model) and recorded with its CV scores, and the page loads it
+from then on (see model_store.selected_hyperparameters).
+
+Usage:
+    python model_selection.py
+    python model_selection.py --target alcever --folds 5 --workers 4
+"""
+import argparse
+import json
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import sklearn
+from sklearn.base import clone
+from sklearn.exceptions import ConvergenceWarning
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import accuracy_score, log_loss
+from sklearn.model_selection import StratifiedKFold
+
+from model_store import (FEATURES, HYPERPARAMETERS, TARGETS, build_pipeline, get_model_path, get_selection_path,
+                         save_model, train_model)
+
+# Solver and penalty combinations searched; each is fitted along the whole C_GRID.
+# The penalty is given as l1_ratio: 0 is L2, 1 is L1, in between is elastic net.
+SEARCH_SPACE = [
+    {'solver': 'liblinear', 'l1_ratio': 1.0},
+    {'solver': 'liblinear', 'l1_ratio': 0.0},
+    {'solver': 'lbfgs', 'l1_ratio': 0.0},
+    {'solver': 'saga', 'l1_ratio': 1.0},
+    {'solver': 'saga', 'l1_ratio': 0.5},
+    {'solver': 'saga', 'l1_ratio': 0.0}
+]
+
+# Inverse regularization strengths, fitted in increasing order along each path.
+C_GRID = [0.001, 0.01, 0.1, 1.0, 10.0, 100.0]
+
+DEFAULT_FOLDS = 5
+MAX_ITER = 1000
+
+
+def candidate_hyperparameters(family, C):
+    """
+    Returns the LogisticRegression keyword arguments of one candidate, as stored in
+    the model store.
+    """
+    return {**family, 'C': C, 'max_iter': MAX_ITER, 'random_state': HYPERPARAMETERS['random_state']}
+
+
+def fold_design_matrices(df, target, folds=DEFAULT_FOLDS):
+    """
+    Splits the complete rows into stratified folds and encodes each fold once.
+
+    The preprocessor of the model pipeline is fitted on each fold's training rows
+    only, as it would be inside a refitted pipeline, so no category information
+    leaks from the validation rows.
+
+    Args:
+        df (pd.DataFrame): The dataset.
+        target (str): Target variable, e.g. 'mjever'.
+        folds (int): Number of folds.
+
+    Returns:
+        list: One (X_train, y_train, X_valid, y_valid) tuple per fold.
+    """
+    df_model = df[FEATURES + [target]].dropna()
+    X = df_model[FEATURES]
+    y = df_model[target].to_numpy()
+    preprocessor = build_pipeline().named_steps['preprocessor']
+    matrices = []
+    splitter = StratifiedKFold(n_splits=folds, shuffle=True, random_state=HYPERPARAMETERS['random_state'])
+    with warnings.catch_warnings():
+        # mjever's rare code 94 has fewer rows than there are folds.
+        warnings.simplefilter('ignore', UserWarning)
+        splits = list(splitter.split(X, y))
+    for train_rows, valid_rows in splits:
+        fold_preprocessor = clone(preprocessor).fit(X.iloc[train_rows])
+        matrices.append((fold_preprocessor.transform(X.iloc[train_rows]), y[train_rows],
+                         fold_preprocessor.transform(X.iloc[valid_rows]), y[valid_rows]))
+    return matrices
+
+
+def score_path(fold, family, c_grid=C_GRID):
+    """
+    Fits one solver and penalty along the C grid on one fold, warm-starting each fit
+    from the previous one.
+
+    Args:
+        fold (tuple): (X_train, y_train, X_valid, y_valid) from fold_design_matrices.
+        family (dict): Solver and penalty, an entry of SEARCH_SPACE.
+        c_grid (list): C values.
+
+    Returns:
+        list: One dict per C with 'C', and 'log_loss', 'accuracy' and 'seconds', or
+        'error' if the candidate cannot fit the data.
+    """
+    X_train, y_train, X_valid, y_valid = fold
+    classifier = LogisticRegression(**candidate_hyperparameters(family, min(c_grid)), warm_start=True)
+    scores = []
+    for C in sorted(c_grid):
+        start = time.perf_counter()
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', ConvergenceWarning)
+                classifier.set_params(C=C).fit(X_train, y_train)
+        except ValueError as e:
+            scores.append({'C': C, 'error': str(e)})
+            continue
+        proba = classifier.predict_proba(X_valid)
+        scores.append({
+            'C': C,
+            'log_loss': log_loss(y_valid, proba, labels=classifier.classes_),
+            'accuracy': accuracy_score(y_valid, classifier.classes_[np.argmax(proba, axis=1)]),
+            'seconds': time.perf_counter() - start
+        })
+    return scores
+
+
+_worker_folds = None
+
+
+def _init_worker(folds):
+    global _worker_folds
+    _worker_folds = folds
+
+
+def _score_path_in_worker(fold_index, family, c_grid):
+    return score_path(_worker_folds[fold_index], family, c_grid)
+
+
+def search(df, target, folds=DEFAULT_FOLDS, workers=1, search_space=SEARCH_SPACE, c_grid=C_GRID):
+    """
+    Cross-validates every candidate for a target.
+
+    Args:
+        df (pd.DataFrame): The dataset.
+        target (str): Target variable, e.g. 'mjever'.
+        folds (int): Number of stratified folds.
+        workers (int): Number of processes; 1 fits in this process.
+        search_space (list): Solver and penalty combinations.
+        c_grid (list): C values.
+
+    Returns:
+        dict: 'candidates' (one dict per candidate with 'hyperparameters',
+        'mean_log_loss', 'std_log_loss', 'mean_accuracy', 'fold_log_loss' and
+        'fit_seconds', or 'error'), sorted best first; 'best' (the winner's
+        hyperparameters); 'folds', 'workers', 'encode_seconds' and 'search_seconds'.
+    """
+    start = time.perf_counter()
+    matrices = fold_design_matrices(df, target, folds)
+    encode_seconds = time.perf_counter() - start
+
+    tasks = [(fold_index, family) for family in search_space for fold_index in range(folds)]
+    if workers <= 1:
+        paths = [score_path(matrices[fold_index], family, c_grid) for fold_index, family in tasks]
+    else:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(matrices,)) as pool:
+            paths = list(pool.map(_score_path_in_worker, *zip(*tasks), [c_grid] * len(tasks)))
+
+    by_candidate = {}
+    for (_, family), path in zip(tasks, paths):
+        for score in path:
+            by_candidate.setdefault((tuple(family.items()), score['C']), []).append(score)
+    candidates = []
+    for (family, C), scores in by_candidate.items():
+        candidate = {'hyperparameters': candidate_hyperparameters(dict(family), C)}
+        errors = [score['error'] for score in scores if 'error' in score]
+        if errors:
+            candidate['error'] = errors[0]
+        else:
+            fold_log_loss = [score['log_loss'] for score in scores]
+            candidate.update({
+                'mean_log_loss': float(np.mean(fold_log_loss)),
+                'std_log_loss': float(np.std(fold_log_loss)),
+                'mean_accuracy': float(np.mean([score['accuracy'] for score in scores])),
+                'fold_log_loss': fold_log_loss,
+                'fit_seconds': sum(score['seconds'] for score in scores)
+            })
+        candidates.append(candidate)
+    candidates.sort(key=lambda candidate: candidate.get('mean_log_loss', np.inf))
+    if 'error' in candidates[0]:
+        raise ValueError(f"No candidate could fit the {target} model: {candidates[0]['error']}")
+
+    return {
+        'candidates': candidates,
+        'best': candidates[0]['hyperparameters'],
+        'folds': folds,
+        'workers': workers,
+        'encode_seconds': encode_seconds,
+        'search_seconds': time.perf_counter() - start
+    }
+
+
+def candidates_summary(result):
+    """
+    Returns the parts of a search result worth storing: the scores of every
+    candidate, the fold count and the timings.
+    """
+    return {key: result[key] for key in ('candidates', 'folds', 'workers', 'encode_seconds', 'search_seconds')}
+
+
+def select_model(df, target, dataset_sha256, folds=DEFAULT_FOLDS, workers=1):
+    """
+    Runs the search for a target, trains and stores the winning pipeline, and records
+    the selection so the Predictive Analysis page loads that model.
+
+    Returns:
+        dict: The search result (see search) plus 'model_path'.
+    """
+    result = search(df, target, folds, workers)
+    hyperparameters = result['best']
+    start = time.perf_counter()
+    model_pipeline = train_model(df, target, hyperparameters)
+    model_path = get_model_path(target, dataset_sha256, hyperparameters)
+    save_model(model_pipeline, model_path, {
+        'target': target,
+        'features': FEATURES,
+        'dataset_sha256': dataset_sha256,
+        'hyperparameters': hyperparameters,
+        'sklearn_version': sklearn.__version__,
+        'trained_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'training_seconds': time.perf_counter() - start,
+        'cv': candidates_summary(result)
+    })
+
+    selection = {
+        'target': target,
+        'dataset_sha256': dataset_sha256,
+        'hyperparameters': hyperparameters,
+        'model_path': model_path,
+        'selected_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        **candidates_summary(result)
+    }
+    path = get_selection_path(target, dataset_sha256)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(selection, f, indent=2)
+    os.replace(tmp_path, path)
+    return {**result, 'model_path': model_path}
+
+
+def main():
+    from data_loader import DATA_PATH, file_fingerprint, read_dataset
+
+    parser = argparse.ArgumentParser(description="Select the substance-use models' hyperparameters by cross-validation.")
+    parser.add_argument("--target", nargs="+", default=TARGETS, choices=TARGETS)
+    parser.add_argument("--folds", type=int, default=DEFAULT_FOLDS)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Fitting processes (default: all cores)")
+    parser.add_argument("--data", default=DATA_PATH, help="Dataset CSV (default: DATA_PATH)")
+    args = parser.parse_args()
+
+    df = read_dataset(args.data)
+    dataset_sha256 = file_fingerprint(args.data)['sha256']
+    for target in args.target:
+        result = select_model(df, target, dataset_sha256, args.folds, args.workers)
+        print(f"{target}: {len(result['candidates'])} candidates x {result['folds']} folds in "
+              f"{result['search_seconds']:.2f}s on {result['workers']} worker(s) "
+              f"(encoding {result['encode_seconds']:.2f}s)")
+        for candidate in result['candidates'][:5]:
+            if 'error' not in candidate:
+                print(f"  log loss {candidate['mean_log_loss']:.4f} +/- {candidate['std_log_loss']:.4f}, "
+                      f"accuracy {candidate['mean_accuracy']:.3f}: {candidate['hyperparameters']}")
+        print(f"  stored {result['model_path']}")
+
+
+if __name__ == "__main__":
+    main()
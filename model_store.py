@@ -0,0 +1,278 @@
+"""
+Trains and persists the substance-use models so the Predictive Analysis page can load
+them instead of refitting on every rerun.
+
+A model is stored once per (target variable, feature list, dataset fingerprint,
+hyperparameters) combination. The hyperparameters are those chosen by
+model_selection.py for the dataset, or HYPERPARAMETERS if no selection was run. To
+retrain explicitly:
+
+    python model_store.py rebuild
+    python model_store.py rebuild --target mjever
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import joblib
+import sklearn
+from sklearn.model_selection import train_test_split
+from sklearn.linear_model import LogisticRegression
+from sklearn.preprocessing import OneHotEncoder
+from sklearn.compose import ColumnTransformer
+from sklearn.pipeline import Pipeline
+
+from instrumentation import span
+
+# Location of the stored models. Override with the NSDUH_MODEL_DIR environment variable.
+MODEL_DIR = os.environ.get(
+    "NSDUH_MODEL_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+)
+
+TARGETS = ['mjever', 'alcever']
+
+FEATURES = [
+    'age2', 'eduhighcat', 'irmaritstat', 'irwrkstat', 'income',
+    'imother', 'ifather', 'frdmjmon', 'irhhsiz2', 'poverty3'
+]
+CATEGORICAL_FEATURES = ['eduhighcat', 'irmaritstat', 'irwrkstat', 'imother', 'ifather', 'poverty3', 'income']
+NUMERICAL_FEATURES = ['age2', 'frdmjmon', 'irhhsiz2']
+
+# lbfgs fits mjever's three classes ({1, 2, 94}) as one multinomial model, which
+# liblinear cannot; the unscaled numerical features need more than the default 100
+# iterations to converge.
+HYPERPARAMETERS = {'solver': 'lbfgs', 'max_iter': 1000, 'random_state': 42}
+
+
+def build_pipeline(hyperparameters=HYPERPARAMETERS):
+    """
+    Builds the unfitted one-hot encoding + logistic regression pipeline.
+    """
+    preprocessor = ColumnTransformer(
+        transformers=[
+            ('cat', OneHotEncoder(handle_unknown='ignore'), CATEGORICAL_FEATURES),
+            ('num', 'passthrough', NUMERICAL_FEATURES)
+        ],
+        remainder='passthrough'
+    )
+    return Pipeline(steps=[('preprocessor', preprocessor),
+                           ('classifier', LogisticRegression(**hyperparameters))])
+
+
+def train_model(df, target, hyperparameters=HYPERPARAMETERS):
+    """
+    Fits the pipeline on a stratified 80% training split of the rows complete for
+    FEATURES and the target.
+
+    Args:
+        df (pd.DataFrame): The dataset.
+        target (str): Target variable, e.g. 'mjever'.
+        hyperparameters (dict): Keyword arguments for LogisticRegression.
+
+    Returns:
+        Pipeline: The fitted pipeline.
+    """
+    df_model = df[FEATURES + [target]].dropna()
+    if df_model.empty:
+        raise ValueError(f"No complete rows to train the {target} model on.")
+
+    X = df_model[FEATURES]
+    y = df_model[target]
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
+
+    model_pipeline = build_pipeline(hyperparameters)
+    model_pipeline.fit(X_train, y_train)
+    return model_pipeline
+
+
+def model_key(target, dataset_sha256, hyperparameters=HYPERPARAMETERS):
+    """
+    Returns the identifier of a stored model: a hash of everything that determines it.
+    """
+    spec = {
+        'target': target,
+        'features': FEATURES,
+        'categorical_features': CATEGORICAL_FEATURES,
+        'dataset_sha256': dataset_sha256,
+        'hyperparameters': hyperparameters,
+        'sklearn_version': sklearn.__version__
+    }
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def get_model_path(target, dataset_sha256, hyperparameters=HYPERPARAMETERS):
+    """
+    Returns the joblib file a model is stored in.
+    """
+    return os.path.join(MODEL_DIR, f"{target}-{model_key(target, dataset_sha256, hyperparameters)}.joblib")
+
+
+def get_selection_path(target, dataset_sha256):
+    """
+    Returns the JSON file recording the hyperparameters model_selection.py chose for a
+    target and dataset.
+    """
+    return os.path.join(MODEL_DIR, f"{target}-{dataset_sha256[:16]}-selection.json")
+
+
+def load_selection(target, dataset_sha256):
+    """
+    Returns the model selection recorded for a target and dataset ('hyperparameters',
+    the CV scores of every 'candidates', ...), or None if none was run.
+    """
+    try:
+        with open(get_selection_path(target, dataset_sha256)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def selected_hyperparameters(target, dataset_sha256):
+    """
+    Returns the hyperparameters chosen by cross-validation for a target and dataset,
+    or HYPERPARAMETERS if no selection was run.
+    """
+    selection = load_selection(target, dataset_sha256)
+    return selection['hyperparameters'] if selection else HYPERPARAMETERS
+
+
+def save_model(model_pipeline, path, metadata):
+    """
+    Writes a fitted pipeline and its metadata with joblib, replacing any previous file atomically.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    joblib.dump({'pipeline': model_pipeline, 'metadata': metadata}, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_or_train(df, target, dataset_sha256, hyperparameters=HYPERPARAMETERS, rebuild=False):
+    """
+    Loads the stored model for this target, dataset and hyperparameters, training and
+    storing it first if it does not exist yet (or if rebuild is set).
+
+    Args:
+        df (pd.DataFrame): The dataset; only used when training.
+        target (str): Target variable, e.g. 'mjever'.
+        dataset_sha256 (str): Content hash of the dataset file (see data_loader.file_fingerprint).
+        hyperparameters (dict): Keyword arguments for LogisticRegression.
+        rebuild (bool): Retrain even if a stored model exists.
+
+    Returns:
+        Pipeline: The fitted pipeline.
+    """
+    path = get_model_path(target, dataset_sha256, hyperparameters)
+    if not rebuild and os.path.exists(path):
+        with span("model.load"):
+            return joblib.load(path)['pipeline']
+
+    start = time.perf_counter()
+    with span("model.fit"):
+        model_pipeline = train_model(df, target, hyperparameters)
+    metadata = {
+        'target': target,
+        'features': FEATURES,
+        'dataset_sha256': dataset_sha256,
+        'hyperparameters': hyperparameters,
+        'sklearn_version': sklearn.__version__,
+        'trained_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'training_seconds': time.perf_counter() - start
+    }
+    try:
+        save_model(model_pipeline, path, metadata)
+    except OSError:
+        # Without a writable model directory the model is simply retrained next time.
+        pass
+    return model_pipeline
+
+
+def rebuild_command(target):
+    """
+    Returns the command that trains and stores the dashboard's model for a target.
+    """
+    from incremental_model import STREAMING_TRAINING
+
+    if STREAMING_TRAINING:
+        return f"python incremental_model.py --target {target}"
+    return f"python model_store.py rebuild --target {target}"
+
+
+def stored_model_path(target, dataset_sha256):
+    """
+    Returns the file the dashboard's model for a target and dataset is stored in: the
+    streamed model (see incremental_model.py) with NSDUH_STREAMING_TRAINING=1,
+    otherwise the model with the selected hyperparameters.
+    """
+    from incremental_model import STREAMING_TRAINING, incremental_model_key
+
+    if STREAMING_TRAINING:
+        return get_model_path(target, dataset_sha256, incremental_model_key())
+    return get_model_path(target, dataset_sha256, selected_hyperparameters(target, dataset_sha256))
+
+
+def load_stored_model(target, dataset_sha256, data_path=None, load_df=None):
+    """
+    Loads the dashboard's model for a target and dataset (see stored_model_path)
+    without reading the dataset. If it is not stored yet it is trained and stored: by
+    streaming data_path with NSDUH_STREAMING_TRAINING=1, otherwise on load_df().
+
+    Args:
+        target (str): Target variable, e.g. 'mjever'.
+        dataset_sha256 (str): Content hash of the dataset file (see data_loader.file_fingerprint).
+        data_path (str, optional): The dataset file, streamed to train a missing model.
+        load_df (callable, optional): Returns the dataset to train a missing model on.
+
+    Returns:
+        Pipeline: The fitted pipeline.
+
+    Raises:
+        FileNotFoundError: If the model is not stored and cannot be trained.
+    """
+    from incremental_model import STREAMING_TRAINING, load_or_train_incremental
+
+    path = stored_model_path(target, dataset_sha256)
+    if os.path.exists(path):
+        with span("model.load"):
+            return joblib.load(path)['pipeline']
+    if STREAMING_TRAINING and data_path:
+        return load_or_train_incremental(data_path, target, dataset_sha256)
+    if not STREAMING_TRAINING and load_df:
+        return load_or_train(load_df(), target, dataset_sha256, selected_hyperparameters(target, dataset_sha256))
+    raise FileNotFoundError(f"No stored {target} model at {path}; run `{rebuild_command(target)}` first.")
+
+
+def main():
+    from data_loader import DATA_PATH, file_fingerprint, read_dataset
+
+    parser = argparse.ArgumentParser(description="Manage the stored substance-use models.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = subparsers.add_parser("rebuild", help="Retrain and store the models")
+    rebuild_parser.add_argument("--target", nargs="+", default=TARGETS, choices=TARGETS)
+    rebuild_parser.add_argument("--data", default=DATA_PATH, help="Dataset CSV (default: DATA_PATH)")
+    args = parser.parse_args()
+
+    df = read_dataset(args.data)
+    dataset_sha256 = file_fingerprint(args.data)['sha256']
+    failed = []
+    for target in args.target:
+        start = time.perf_counter()
+        hyperparameters = selected_hyperparameters(target, dataset_sha256)
+        try:
+            load_or_train(df, target, dataset_sha256, hyperparameters, rebuild=True)
+        except ValueError as e:
+            # Report the target and go on with the others.
+            print(f"{target}: could not be trained: {e}", file=sys.stderr)
+            failed.append(target)
+            continue
+        print(f"{target}: trained and stored in {get_model_path(target, dataset_sha256, hyperparameters)} "
+              f"({time.perf_counter() - start:.2f}s)")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,50 @@
 import streamlit as st
 import pandas as pd
-from sklearn.model_selection import train_test_split
-from sklearn.linear_model import LogisticRegression
-from sklearn.preprocessing import OneHotEncoder
-from sklearn.compose import ColumnTransformer
-from sklearn.pipeline import Pipeline
-import joblib
-
-from data_loader import load_data, AGE_MAP, EDU_MAP, MARITAL_MAP, WORK_MAP, INCOME_MAP, YES_NO_MAP, POVERTY_MAP
+
+from data_loader import DATA_PATH, load_data, dataset_fingerprint, AGE_MAP, EDU_MAP, MARITAL_MAP, WORK_MAP, INCOME_MAP, YES_NO_MAP, POVERTY_MAP
 from utils import get_readable_feature_name
+from model_store import FEATURES, CATEGORICAL_FEATURES, NUMERICAL_FEATURES, load_selection, load_stored_model
+from compiled_model import compile_model
+from incremental_model import STREAMING_TRAINING
+from probability_table import MAX_TABLE_CELLS, build_probability_table, form_grid_axes, grid_cells, lookup
+from instrumentation import span
+
+
+@st.cache_resource
+def load_model(target_variable):
+    """
+    Returns the fitted pipeline for a target variable, shared by all sessions.
+    It is loaded from the model store, and trained and stored only if missing, with
+    the hyperparameters chosen by model_selection.py if a selection was run. With
+    NSDUH_STREAMING_TRAINING=1 the model is trained by streaming the dataset file
+    instead (see incremental_model.py). batch_scoring.py scores with the same stored
+    model (see model_store.load_stored_model).
+    """
+    return load_stored_model(target_variable, dataset_fingerprint()['sha256'], DATA_PATH, load_data)
+
+
+@st.cache_resource
+def load_compiled_model(target_variable):
+    """
+    Returns the numpy scorer of a target variable's model (see compiled_model.py),
+    extracted once per process.
+    """
+    return compile_model(load_model(target_variable))
+
+
+@st.cache_resource
+def load_probability_table(target_variable):
+    """
+    Returns the probability of every possible form input for a target variable's model,
+    scored once per process (see probability_table.build_probability_table), or None
+    if the grid has more than MAX_TABLE_CELLS cells; the page then scores each
+    submission with the model.
+    """
+    axes = form_grid_axes(load_data())
+    if grid_cells(axes) > MAX_TABLE_CELLS:
+        return None
+    return build_probability_table(load_model(target_variable), axes)
+
 
 def show_predictive_page():
     """
@@ -21,7 +57,8 @@ def show_predictive_page():
     st.title("🔮 Predictive Analysis: Substance Use Likelihood")
     st.markdown("This section allows you to interact with the trained machine learning model.")
 
-    df = load_data()
+    with span("load_data"):
+        df = load_data()
 
     st.markdown("### Select Substance for Prediction")
     selected_substance = st.radio(
@@ -40,46 +77,29 @@ def show_predictive_page():
     st.write(f"Predicting the likelihood of **{substance_label}** use based on various factors.")
 
 
-    features = [
-        'age2', 'eduhighcat', 'irmaritstat', 'irwrkstat', 'income',
-        'imother', 'ifather', 'frdmjmon', 'irhhsiz2', 'poverty3'
-    ]
-
-    df_model = df[features + [target_variable]].dropna()
+    features = FEATURES
 
-    if df_model.empty:
+    if not df[features + [target_variable]].notna().all(axis=1).any():
         st.warning("Not enough data after dropping missing values for predictive analysis. Please check your dataset.")
         return
 
-    categorical_features = ['eduhighcat', 'irmaritstat', 'irwrkstat', 'imother', 'ifather', 'poverty3', 'income']
-    numerical_features = ['age2', 'frdmjmon', 'irhhsiz2']
-
-    preprocessor = ColumnTransformer(
-        transformers=[
-            ('cat', OneHotEncoder(handle_unknown='ignore'), categorical_features),
-            ('num', 'passthrough', numerical_features)
-        ],
-        remainder='passthrough'
-    )
-
-
-    model_pipeline = Pipeline(steps=[('preprocessor', preprocessor),
-                                     ('classifier', LogisticRegression(solver='liblinear', random_state=42))])
+    categorical_features = CATEGORICAL_FEATURES
+    numerical_features = NUMERICAL_FEATURES
 
-    # Prepare X and y
-    X = df_model[features]
-    y = df_model[target_variable]
-
-    # Split data into training and testing sets
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
-
-
-    with st.spinner(f"Training model for {substance_label} use prediction..."):
+    with st.spinner(f"Loading model for {substance_label} use prediction..."):
         try:
-            model_pipeline.fit(X_train, y_train)
-            st.success(f"Model for {substance_label} use trained successfully!")
+            with span("model"):
+                model_pipeline = load_model(target_variable)
+            st.success(f"Model for {substance_label} use loaded successfully!")
+            selection = load_selection(target_variable, dataset_fingerprint()['sha256'])
+            if selection and not STREAMING_TRAINING:
+                best = selection['candidates'][0]
+                params = best['hyperparameters']
+                st.caption(f"Selected by {selection['folds']}-fold cross-validation: {params['solver']} solver, "
+                           f"l1_ratio={params['l1_ratio']:g}, C={params['C']:g} (log loss {best['mean_log_loss']:.3f} "
+                           f"± {best['std_log_loss']:.3f}, accuracy {best['mean_accuracy']:.1%}).")
         except Exception as e:
-            st.error(f"Error training model for {substance_label} use: {e}")
+            st.error(f"Error loading model for {substance_label} use: {e}")
             return
 
     st.markdown(f"### Make a Prediction for {substance_label.capitalize()} Use")
@@ -104,14 +124,25 @@ def show_predictive_page():
         input_data['poverty3'] = st.selectbox("Income-to-Poverty Ratio:", options=sorted(df['poverty3'].dropna().unique()), format_func=lambda x: POVERTY_MAP.get(x, str(x)), key=f'poverty3_{substance_label}')
 
 
-    if st.button(f"Predict {substance_label.capitalize()} Likelihood"):
-        input_df = pd.DataFrame([input_data])
-        input_df = input_df[features]
+    use_probability_table = st.checkbox(
+        "Use precomputed probability table",
+        value=True,
+        key=f'probability_table_{substance_label}',
+        help="Answer from a table of every possible input, scored once per model, instead of running the model on each click. "
+             f"Inputs with more than {MAX_TABLE_CELLS:,} combinations are always scored with the model."
+    )
 
+    if st.button(f"Predict {substance_label.capitalize()} Likelihood"):
         with st.spinner(f"Predicting {substance_label} likelihood..."):
             try:
-                prediction_proba = model_pipeline.predict_proba(input_df)[0][1]
-                prediction_class = model_pipeline.predict(input_df)[0]
+                with span("predict"):
+                    table = load_probability_table(target_variable) if use_probability_table else None
+                    result = lookup(table, input_data) if table is not None else None
+                    if result is not None:
+                        prediction_proba, prediction_class = result
+                    else:
+                        probability, prediction = load_compiled_model(target_variable).score(input_data)
+                        prediction_proba, prediction_class = probability[0], prediction[0]
 
                 st.markdown(f"### Prediction Result for {substance_label.capitalize()} Use:")
                 st.info(f"Based on the provided inputs, the likelihood of {substance_label} use is: **{prediction_proba:.2f}**")
@@ -126,14 +157,15 @@ def show_predictive_page():
     st.write(f"The coefficients below indicate the influence of each factor on the likelihood of {substance_label} use. A positive coefficient suggests an increased likelihood, while a negative coefficient suggests a decreased likelihood. The absolute value (magnitude) of the coefficient indicates the strength of that factor's influence; larger absolute values mean a stronger impact.")
 
 
-    ohe_feature_names = model_pipeline.named_steps['preprocessor'].named_transformers_['cat'].get_feature_names_out(categorical_features)
-    final_feature_names = list(ohe_feature_names) + numerical_features
+    with span("coefficients"):
+        ohe_feature_names = model_pipeline.named_steps['preprocessor'].named_transformers_['cat'].get_feature_names_out(categorical_features)
+        final_feature_names = list(ohe_feature_names) + numerical_features
 
-    coefficients = model_pipeline.named_steps['classifier'].coef_[0]
+        coefficients = model_pipeline.named_steps['classifier'].coef_[0]
 
-    coef_df = pd.DataFrame({
-        'Feature': [get_readable_feature_name(f, categorical_features) for f in final_feature_names],
-        'Coefficient': coefficients
-    }).sort_values(by='Coefficient', ascending=False)
+        coef_df = pd.DataFrame({
+            'Feature': [get_readable_feature_name(f, categorical_features) for f in final_feature_names],
+            'Coefficient': coefficients
+        }).sort_values(by='Coefficient', ascending=False)
 
-    st.dataframe(coef_df, use_container_width=True)
+        st.dataframe(coef_df, use_container_width=True)
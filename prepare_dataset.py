@@ -0,0 +1,247 @@
+"""
+Builds the cleaned women's dataset from the raw multi-year NSDUH file in one pass.
+
+Replaces the three preparation notebooks (Gender_Split, Variable_Filtering and
+Cleaning), which each wrote and re-read a full intermediate CSV. The raw file is read
+once, in byte ranges parsed by worker processes; only RAW_COLUMNS are parsed, and each
+range goes through the gender split, the variable filter and the per-row cleaning
+rules before it reaches the output. The two rules that need the whole dataset (the
+median imputation of poverty3 and duplicate removal) are finished on the small
+filtered output, so memory stays bounded by the range size times the number of
+workers plus 8 bytes per distinct output row.
+
+The raw file must not contain quoted line breaks, which holds for the numeric NSDUH
+public-use file.
+
+Usage:
+    python prepare_dataset.py NSDUH_2015-2019.csv "Cleaned Womens Dataset.parquet"
+    python prepare_dataset.py NSDUH_2015-2019.csv womens.parquet --workers 8 --chunk-mb 128
+"""
+import argparse
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from batch_scoring import ChunkWriter
+
+# Gender split: NSDUH codes irsex 2 as female.
+SEX_COLUMN = 'irsex'
+FEMALE = 2
+
+# Variable filter: the columns kept for the analysis.
+COLUMNS_TO_KEEP = [
+    # Demographics
+    'age2', 'eduhighcat', 'irwrkstat', 'irmaritstat',
+    # Family/Parental Structure
+    'imother', 'ifather', 'irhhsiz2',
+    # Social & Peer Influence
+    'frdmjmon', 'talkprob',
+    # Socioeconomic Factors
+    'govtprog', 'income', 'poverty3',
+    # Marijuana Use
+    'mjever', 'mjage', 'mjday30a', 'mjrec', 'mjyrtot', 'mjonlyflag', 'mjonlyyr', 'mjprior', 'mjpriyr',
+    # Alcohol Use
+    'alcflag', 'alcmon', 'alcyr', 'alcever', 'alcydays', 'alcmfu', 'alcbng30d', 'alclimit', 'alcpdang', 'drvinalco',
+    # Treatment
+    'txyralc', 'txalconly'
+]
+
+# Columns parsed from the raw file.
+RAW_COLUMNS = [SEX_COLUMN] + COLUMNS_TO_KEEP
+
+# Cleaning: rows missing any of these are dropped.
+REQUIRED_COLUMNS = ['frdmjmon', 'talkprob', 'irmaritstat']
+# Cleaning: missing values filled with the column median over the remaining rows.
+MEDIAN_FILL_COLUMNS = ['poverty3']
+# Cleaning: missing values filled with 0.
+ZERO_FILL_COLUMNS = ['drvinalco']
+
+DEFAULT_CHUNK_MB = 64
+
+
+def clean_chunk(raw):
+    """
+    Applies the gender split, the variable filter and the row-level cleaning rules to
+    a block of raw rows. The median fill and duplicate removal need the whole dataset
+    and are left to prepare_dataset.
+
+    Args:
+        raw (pd.DataFrame): Raw rows with at least RAW_COLUMNS.
+
+    Returns:
+        pd.DataFrame: COLUMNS_TO_KEEP as float64, the types of the shipped dataset.
+    """
+    df = raw.loc[raw[SEX_COLUMN] == FEMALE, COLUMNS_TO_KEEP]
+    df = df.dropna(subset=REQUIRED_COLUMNS)
+    df = df.fillna({col: 0 for col in ZERO_FILL_COLUMNS})
+    return df.astype('float64')
+
+
+def byte_ranges(path, chunk_bytes):
+    """
+    Splits a CSV file after its header line into (start, end) byte ranges of about
+    chunk_bytes, each ending at a line break.
+    """
+    size = os.path.getsize(path)
+    ranges = []
+    with open(path, 'rb') as f:
+        f.readline()
+        start = f.tell()
+        while start < size:
+            f.seek(min(start + chunk_bytes, size))
+            f.readline()
+            end = min(f.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def read_header(path):
+    """
+    Returns the column names of a CSV file, lower-cased like the notebooks used them.
+    """
+    with open(path, 'rb') as f:
+        header = f.readline().decode().strip()
+    return [name.strip().strip('"').lower() for name in header.split(',')]
+
+
+def _prepare_range(path, header, start, end):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    raw = pd.read_csv(io.BytesIO(data), header=None, names=header, usecols=RAW_COLUMNS, low_memory=False)
+    df = clean_chunk(raw)
+    counts = {col: df[col].value_counts() for col in MEDIAN_FILL_COLUMNS}
+    return len(raw), df, counts
+
+
+def _median_from_counts(counts):
+    # Median of the values counted in a value_counts Series, as Series.median computes it.
+    counts = counts.sort_index()
+    n = int(counts.sum())
+    if n == 0:
+        return np.nan
+    positions = np.cumsum(counts.to_numpy())
+    lower = counts.index[np.searchsorted(positions, (n - 1) // 2, side='right')]
+    upper = counts.index[np.searchsorted(positions, n // 2, side='right')]
+    return (lower + upper) / 2
+
+
+def _drop_seen(df, seen):
+    """
+    Drops the rows of df that are duplicates within df or of a row hashed into seen
+    (a sorted uint64 array), keeping first occurrences. Returns the remaining rows and
+    the updated seen array. Rows are compared by 64-bit hash.
+    """
+    hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    _, first = np.unique(hashes, return_index=True)
+    keep = np.zeros(len(df), dtype=bool)
+    keep[first] = True
+    if len(seen):
+        keep &= seen[np.minimum(np.searchsorted(seen, hashes), len(seen) - 1)] != hashes
+    new = np.sort(hashes[keep])
+    return df[keep], np.insert(seen, np.searchsorted(seen, new), new)
+
+
+def prepare_dataset(raw_path, output_path, workers=1, chunk_mb=DEFAULT_CHUNK_MB, report=None):
+    """
+    Runs the whole preparation: gender split, variable filter and cleaning.
+
+    Args:
+        raw_path (str): The raw NSDUH CSV file.
+        output_path (str): Parquet (or CSV) file to write, chosen by extension.
+        workers (int): Number of parsing processes; 1 parses in this process.
+        chunk_mb (int): Megabytes of raw CSV parsed at a time per process.
+        report (callable, optional): Called with (raw rows read, seconds elapsed)
+            after each range.
+
+    Returns:
+        dict: 'raw_rows', 'rows' (written), 'medians' (fill value per
+        MEDIAN_FILL_COLUMNS column) and 'seconds'.
+    """
+    start_time = time.perf_counter()
+    header = read_header(raw_path)
+    missing = set(RAW_COLUMNS) - set(header)
+    if missing:
+        raise ValueError(f"{raw_path} lacks the columns {sorted(missing)}")
+    ranges = byte_ranges(raw_path, chunk_mb * 2**20)
+
+    # Pass over the raw file: row-level rules and exact-duplicate removal, written to
+    # a temporary file together with the value counts the medians need.
+    tmp_path = f"{output_path}.{os.getpid()}.tmp.parquet"
+    writer = ChunkWriter(tmp_path)
+    counts = {col: pd.Series(dtype='int64') for col in MEDIAN_FILL_COLUMNS}
+    seen = np.empty(0, dtype=np.uint64)
+    raw_rows = 0
+
+    def consume(result):
+        nonlocal raw_rows, seen
+        n_raw, df, chunk_counts = result
+        raw_rows += n_raw
+        for col, col_counts in chunk_counts.items():
+            counts[col] = counts[col].add(col_counts, fill_value=0)
+        df, seen = _drop_seen(df, seen)
+        writer.write(df)
+        if report:
+            report(raw_rows, time.perf_counter() - start_time)
+
+    try:
+        if workers <= 1:
+            for begin, end in ranges:
+                consume(_prepare_range(raw_path, header, begin, end))
+        else:
+            with ProcessPoolExecutor(workers) as pool:
+                # Keep at most two ranges per worker in flight and consume them in file order.
+                pending = []
+                for begin, end in ranges:
+                    pending.append(pool.submit(_prepare_range, raw_path, header, begin, end))
+                    if len(pending) >= 2 * workers:
+                        consume(pending.pop(0).result())
+                for future in pending:
+                    consume(future.result())
+        if writer.parquet_writer is None:
+            writer.write(pd.DataFrame({col: pd.Series(dtype='float64') for col in COLUMNS_TO_KEEP}))
+    finally:
+        writer.close()
+
+    # Finish on the filtered rows: fill with the medians, which can make more rows
+    # identical, and drop those duplicates too.
+    import pyarrow.parquet as pq
+
+    medians = {col: float(_median_from_counts(col_counts)) for col, col_counts in counts.items()}
+    writer = ChunkWriter(output_path)
+    seen = np.empty(0, dtype=np.uint64)
+    rows = 0
+    try:
+        for batch in pq.ParquetFile(tmp_path).iter_batches(batch_size=1_000_000):
+            df, seen = _drop_seen(batch.to_pandas().fillna(medians), seen)
+            writer.write(df)
+            rows += len(df)
+    finally:
+        writer.close()
+        os.remove(tmp_path)
+    return {'raw_rows': raw_rows, 'rows': rows, 'medians': medians, 'seconds': time.perf_counter() - start_time}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prepare the cleaned women's dataset from the raw NSDUH file.")
+    parser.add_argument("raw", help="Raw NSDUH CSV file, e.g. NSDUH_2015-2019.csv")
+    parser.add_argument("output", help="Parquet (or CSV) file to write")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Parsing processes (default: all cores)")
+    parser.add_argument("--chunk-mb", type=int, default=DEFAULT_CHUNK_MB, help="Megabytes of raw CSV per chunk")
+    args = parser.parse_args()
+
+    def report(raw_rows, seconds):
+        print(f"\r{raw_rows:,} raw rows, {raw_rows / seconds:,.0f} rows/s", end="", flush=True)
+
+    result = prepare_dataset(args.raw, args.output, args.workers, args.chunk_mb, report)
+    print(f"\nWrote {result['rows']:,} of {result['raw_rows']:,} rows to {args.output} in {result['seconds']:.2f}s "
+          f"({result['raw_rows'] / result['seconds']:,.0f} raw rows/s); median fills: {result['medians']}")
+
+
+if __name__ == "__main__":
+    main()
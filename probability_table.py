@@ -0,0 +1,103 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from model_store import FEATURES
+
+# Rows scored per predict_proba call while building a table.
+BUILD_BATCH_SIZE = 100_000
+
+# Largest grid a table is built for (9 bytes per cell: 2M cells take 17 MB and about
+# 1.5 s to score). The grid is the product of the number of values of every form
+# input, so it grows multiplicatively with the distinct codes of the data; beyond
+# this the page scores each submission with the model instead. Override with the
+# NSDUH_PROBABILITY_TABLE_MAX_CELLS environment variable.
+MAX_TABLE_CELLS = int(os.environ.get("NSDUH_PROBABILITY_TABLE_MAX_CELLS", 2_000_000))
+
+
+def form_grid_axes(df):
+    """
+    Returns the values each input of the prediction form can take, in FEATURES order.
+    The coded inputs offer the codes present in the data; the two number inputs range
+    over the integers between their form bounds.
+
+    Args:
+        df (pd.DataFrame): The dataset the form reads its options from.
+
+    Returns:
+        dict: Feature name to np.ndarray of values.
+    """
+    axes = {}
+    for feature in FEATURES:
+        if feature in ('imother', 'ifather'):
+            axes[feature] = np.array([1, 2])
+        elif feature == 'frdmjmon':
+            axes[feature] = np.arange(0, int(df['frdmjmon'].max()) + 1)
+        elif feature == 'irhhsiz2':
+            axes[feature] = np.arange(1, int(df['irhhsiz2'].max()) + 1)
+        else:
+            axes[feature] = np.array(sorted(df[feature].dropna().unique()))
+    return axes
+
+
+def grid_cells(axes):
+    """
+    Returns the number of cells of the grid spanned by axes (see form_grid_axes).
+    """
+    return int(np.prod([len(values) for values in axes.values()], dtype=np.int64))
+
+
+def build_probability_table(model_pipeline, axes):
+    """
+    Scores every combination of form inputs with batched predict_proba calls.
+
+    Args:
+        model_pipeline (Pipeline): A fitted pipeline from model_store.
+        axes (dict): Feature name to values, as returned by form_grid_axes.
+
+    Returns:
+        dict: 'axes', 'positions' (feature to {value: axis position}), 'classes',
+        'probability' (float64 array with one dimension per feature, holding
+        predict_proba's second column), 'prediction' (int8 array of positions in
+        'classes') and 'build_seconds'.
+    """
+    start = time.perf_counter()
+    shape = tuple(len(values) for values in axes.values())
+    size = int(np.prod(shape))
+    probability = np.empty(size, dtype=np.float64)
+    prediction = np.empty(size, dtype=np.int8)
+    for begin in range(0, size, BUILD_BATCH_SIZE):
+        flat = np.arange(begin, min(begin + BUILD_BATCH_SIZE, size))
+        grid = pd.DataFrame({
+            feature: values[positions]
+            for (feature, values), positions in zip(axes.items(), np.unravel_index(flat, shape))
+        })
+        proba = model_pipeline.predict_proba(grid)
+        probability[flat] = proba[:, 1]
+        prediction[flat] = np.argmax(proba, axis=1)
+    return {
+        'axes': axes,
+        'positions': {feature: {value: i for i, value in enumerate(values.tolist())} for feature, values in axes.items()},
+        'classes': model_pipeline.classes_,
+        'probability': probability.reshape(shape),
+        'prediction': prediction.reshape(shape),
+        'build_seconds': time.perf_counter() - start
+    }
+
+
+def lookup(table, input_data):
+    """
+    Returns the precomputed (probability, predicted class) for one set of form inputs,
+    or None if an input lies outside the table's grid.
+
+    Args:
+        table (dict): The table returned by build_probability_table.
+        input_data (dict): Feature name to the value entered in the form.
+    """
+    try:
+        cell = tuple(table['positions'][feature][input_data[feature]] for feature in table['axes'])
+    except KeyError:
+        return None
+    return table['probability'][cell], table['classes'][table['prediction'][cell]]
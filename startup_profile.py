@@ -0,0 +1,116 @@
+"""
+Profiles the app's cold start, page by page.
+
+Every page is rendered in a fresh Python process, as on a newly started server
+replica: the process imports Streamlit, then runs app.py once with the page selected
+(through streamlit.testing's AppTest, without a browser). Python's -X importtime
+report of that run gives the time spent importing each module the app pulled in; the
+time of the run itself is the page's time to first render.
+
+Set NSDUH_PROFILE_STARTUP=1 when running the app to print the import and first-render
+time of each page as a live server first shows it.
+
+Usage:
+    python startup_profile.py
+    python startup_profile.py predictive statistical --top 20
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+# Session page ids of app.py's PAGES.
+PAGE_IDS = ['home', 'statistical', 'predictive', 'documentation']
+
+# Written to stderr between the harness's imports and the app run, so only the
+# imports of the app itself are counted.
+MARKER = "-- app run --"
+
+_CHILD = f"""
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({APP_PATH!r}, default_timeout=600)
+at.session_state['page'] = sys.argv[1]
+sys.stderr.write({MARKER!r} + "\\n")
+sys.stderr.flush()
+start = time.perf_counter()
+at.run()
+render_ms = (time.perf_counter() - start) * 1000
+print(json.dumps({{'render_ms': render_ms, 'errors': [str(e.value) for e in at.exception]}}))
+"""
+
+
+def parse_importtime(stderr):
+    """
+    Reads the -X importtime lines written after MARKER.
+
+    Returns:
+        tuple: (total import time in ms, list of (module, cumulative ms) for the
+        modules imported directly by the app and its page modules, i.e. the
+        outermost imports, slowest first).
+    """
+    lines = stderr.splitlines()
+    if MARKER in lines:
+        lines = lines[lines.index(MARKER) + 1:]
+    entries = []
+    for line in lines:
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((depth, name.strip(), int(self_us), int(cumulative_us)))
+    if not entries:
+        return 0.0, []
+    top_depth = min(depth for depth, _, _, _ in entries)
+    modules = [(name, cumulative / 1000) for depth, name, _, cumulative in entries if depth == top_depth]
+    return sum(self_us for _, _, self_us, _ in entries) / 1000, sorted(modules, key=lambda m: -m[1])
+
+
+def profile_page(page_id):
+    """
+    Renders one page in a fresh process.
+
+    Returns:
+        dict: 'page', 'render_ms' (time to first render, imports included),
+        'import_ms' (time importing modules during the render), 'modules'
+        ((module, cumulative ms) slowest first) and 'errors' (exceptions the page raised).
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", _CHILD, page_id],
+                            capture_output=True, text=True, cwd=os.path.dirname(APP_PATH))
+    if result.returncode != 0:
+        raise RuntimeError(f"Profiling the {page_id} page failed:\n{result.stderr[-2000:]}")
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    import_ms, modules = parse_importtime(result.stderr)
+    return {'page': page_id, 'render_ms': report['render_ms'], 'import_ms': import_ms, 'modules': modules,
+            'errors': report['errors']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile the import time and time to first render of each page.")
+    parser.add_argument("pages", nargs="*", metavar="PAGE", help=f"Pages to profile, of {PAGE_IDS} (default: all)")
+    parser.add_argument("--top", type=int, default=10, help="Slowest imported modules listed per page")
+    parser.add_argument("--json", help="Write the results to this JSON file")
+    args = parser.parse_args()
+    unknown = set(args.pages) - set(PAGE_IDS)
+    if unknown:
+        parser.error(f"unknown pages {sorted(unknown)}; choose from {PAGE_IDS}")
+
+    results = []
+    for page_id in args.pages or PAGE_IDS:
+        result = profile_page(page_id)
+        results.append(result)
+        print(f"{page_id}: first render {result['render_ms']:.0f} ms, of which importing {result['import_ms']:.0f} ms")
+        for module, ms in result['modules'][:args.top]:
+            print(f"  {ms:8.1f} ms  {module}")
+        for error in result['errors']:
+            print(f"  error: {error}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Generates synthetic datasets with the schema and joint distribution of the cleaned
+dataset, at any size, for load-testing the loader, the dashboard and the models.
+
+The columns are sampled along a fixed dependency network (NETWORK): each node draws
+one or more columns jointly, conditional on columns drawn before it, from the
+frequencies observed in the source data. Only code combinations that occur in the
+source are produced, so the NSDUH sentinel codes (91 "never used", 93, 99, 991, ...)
+keep their meaning, and the skip logic between the gate questions (mjever, alcever)
+and their detail columns holds in every synthetic row.
+
+Rows are generated and written chunk by chunk, so memory stays bounded by the chunk
+size whatever the number of rows.
+
+Usage:
+    python synthetic_data.py synthetic.csv --rows 1000000
+    python synthetic_data.py synthetic.parquet --rows 50000000 --chunksize 1000000 --seed 7
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from batch_scoring import ChunkWriter
+from data_loader import DATA_PATH
+
+# Marijuana detail questions; all skip to sentinel codes unless mjever is 1.
+MJ_DETAIL = ['mjage', 'mjday30a', 'mjrec', 'mjyrtot', 'mjonlyflag', 'mjonlyyr', 'mjprior', 'mjpriyr']
+
+# Alcohol detail questions; all skip to sentinel codes unless alcever is 1.
+ALC_DETAIL = ['alcflag', 'alcmon', 'alcyr', 'alcydays', 'alcmfu', 'alcbng30d', 'alclimit', 'alcpdang']
+
+# Sampling order as (columns drawn jointly, parent columns they are conditional on).
+NETWORK = [
+    (['age2'], []),
+    (['eduhighcat'], ['age2']),
+    (['irwrkstat', 'irmaritstat'], ['age2']),
+    (['imother', 'ifather'], ['age2']),
+    (['income'], ['irwrkstat', 'ifather']),
+    (['irhhsiz2'], ['income', 'imother', 'ifather']),
+    (['poverty3'], ['income', 'irhhsiz2']),
+    (['govtprog'], ['poverty3', 'ifather']),
+    (['frdmjmon', 'talkprob'], ['age2']),
+    (['mjever'], ['age2', 'frdmjmon']),
+    (['alcever'], ['age2', 'mjever', 'income']),
+    (MJ_DETAIL, ['mjever', 'alcever']),
+    (ALC_DETAIL, ['alcever', 'mjpriyr']),
+    (['drvinalco', 'txyralc', 'txalconly'], ['age2', 'alcever', 'mjever'])
+]
+
+DEFAULT_CHUNKSIZE = 500_000
+
+# Bits per parent code when packing parent combinations into integer keys; NSDUH codes
+# are below 1000.
+KEY_BITS = 10
+
+
+def fit_generator(df, network=NETWORK):
+    """
+    Learns the conditional code frequencies of every node of the network.
+
+    Args:
+        df (pd.DataFrame): The source dataset; every column must appear in the network.
+        network (list): (columns, parents) pairs in sampling order.
+
+    Returns:
+        dict: 'columns' and 'dtypes' of the source, and 'nodes', one dict per network
+        node with the observed 'outcomes' (distinct code tuples of its columns) and
+        'tables': (parent key to row, cumulative outcome probabilities per row) for
+        all parents, then for each shorter prefix of the parents down to none. A
+        parent combination the source never shows is sampled from the longest
+        prefix it does show, so parents are listed most important first.
+    """
+    covered = [col for columns, _ in network for col in columns]
+    missing = set(df.columns) - set(covered)
+    if missing:
+        raise ValueError(f"Columns not covered by the network: {sorted(missing)}")
+
+    df = df.dropna()
+    nodes = []
+    for columns, parents in network:
+        outcomes, outcome_ids = np.unique(df[columns].to_numpy(), axis=0, return_inverse=True)
+        keys = _parent_keys(df, parents, len(df))
+        tables = []
+        for dropped in range(len(parents) + 1):
+            parent_keys, parent_ids = np.unique(keys >> (KEY_BITS * dropped), return_inverse=True)
+            counts = np.zeros((len(parent_keys), len(outcomes)))
+            np.add.at(counts, (parent_ids, outcome_ids.ravel()), 1)
+            tables.append(({key: i for i, key in enumerate(parent_keys.tolist())}, _cumulative(counts)))
+        nodes.append({'columns': columns, 'parents': parents, 'outcomes': outcomes, 'tables': tables})
+    return {'columns': list(df.columns), 'dtypes': df.dtypes.to_dict(), 'nodes': nodes}
+
+
+def _parent_keys(data, parents, n_rows):
+    # Packs each row's parent codes into one integer, KEY_BITS bits per code.
+    keys = np.zeros(n_rows, dtype=np.int64)
+    for col in parents:
+        codes = np.asarray(data[col])
+        if ((codes < 0) | (codes >= 1 << KEY_BITS) | (codes % 1 != 0)).any():
+            raise ValueError(f"{col} has codes outside 0..{(1 << KEY_BITS) - 1}")
+        keys = (keys << KEY_BITS) | codes.astype(np.int64)
+    return keys
+
+
+def _cumulative(counts):
+    cdf = np.cumsum(counts, axis=1) / counts.sum(axis=1, keepdims=True)
+    cdf[:, -1] = 1.0
+    return cdf
+
+
+def _sample_node(node, data, n_rows, rng):
+    u = rng.random(n_rows)
+    choice = np.empty(n_rows, dtype=np.intp)
+    keys, key_ids = np.unique(_parent_keys(data, node['parents'], n_rows), return_inverse=True)
+    for i, key in enumerate(keys.tolist()):
+        rows = key_ids == i
+        for dropped, (parent_index, cdf) in enumerate(node['tables']):
+            row = parent_index.get(key >> (KEY_BITS * dropped))
+            if row is not None:
+                break
+        choice[rows] = np.searchsorted(cdf[row], u[rows], side='right')
+    for j, col in enumerate(node['columns']):
+        data[col] = node['outcomes'][choice, j]
+
+
+def generate_frame(model, n_rows, rng):
+    """
+    Samples n_rows synthetic respondents.
+
+    Args:
+        model (dict): The model returned by fit_generator.
+        n_rows (int): Number of rows.
+        rng (np.random.Generator): Source of randomness.
+
+    Returns:
+        pd.DataFrame: Rows with the source's columns, column order and dtypes.
+    """
+    data = {}
+    for node in model['nodes']:
+        _sample_node(node, data, n_rows, rng)
+    return pd.DataFrame({col: data[col] for col in model['columns']}).astype(model['dtypes'])
+
+
+def generate_chunks(model, n_rows, chunksize=DEFAULT_CHUNKSIZE, seed=0):
+    """
+    Yields n_rows synthetic respondents as DataFrames of at most chunksize rows. The
+    output is reproducible for a given seed and chunksize.
+    """
+    for chunk_number, begin in enumerate(range(0, n_rows, chunksize)):
+        rng = np.random.default_rng([seed, chunk_number])
+        chunk = generate_frame(model, min(chunksize, n_rows - begin), rng)
+        chunk.index += begin
+        yield chunk
+
+
+def write_synthetic(model, path, n_rows, chunksize=DEFAULT_CHUNKSIZE, seed=0):
+    """
+    Writes n_rows synthetic respondents to a CSV or Parquet file (chosen by extension),
+    one chunk at a time.
+    """
+    writer = ChunkWriter(path)
+    try:
+        for chunk in generate_chunks(model, n_rows, chunksize, seed):
+            writer.write(chunk)
+    finally:
+        writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic dataset shaped like the cleaned dataset.")
+    parser.add_argument("output", help="CSV or Parquet file to write")
+    parser.add_argument("--rows", type=int, required=True, help="Number of rows to generate")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="Rows generated at a time")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data", default=DATA_PATH, help="Source dataset CSV (default: DATA_PATH)")
+    args = parser.parse_args()
+
+    model = fit_generator(pd.read_csv(args.data))
+    start = time.perf_counter()
+    write_synthetic(model, args.output, args.rows, args.chunksize, args.seed)
+    elapsed = time.perf_counter() - start
+    print(f"Wrote {args.rows:,} rows to {args.output} in {elapsed:.2f}s ({args.rows / elapsed:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()